@@ -1,14 +1,24 @@
 import argparse
 import asyncio
-import json
 import logging
+import time
+import uuid
 from aiohttp import web
-from obsws_python import ReqClient, events
 import os
+import obs_metrics
 from datetime import datetime
+from command_registry import CommandError, CommandRegistry, UnknownCommandError
+from obs_async import AsyncOBSClient
+from obs_clips import STAGES, ClipPipeline
+from obs_files import ArtifactFileServer
+from obs_pool import OBSConnectionPool
+from obs_probes import Readiness
+from obs_reconnect import backoff_delays, is_idempotent
+from obs_replay import ReplayBufferSaver
+from obs_state import OUTPUT_STOPPED
+from obs_serializer import JSON
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+STARTED = time.monotonic()  # time_to_ready is measured from here
 
 # Parse command line arguments
 parser = argparse.ArgumentParser(description='OBS WebSocket Service')
@@ -17,7 +27,17 @@ parser.add_argument('--obs_port', type=int, default=4455, help='OBS WebSocket po
 parser.add_argument('--obs_password', type=str, default='', help='OBS WebSocket password')
 parser.add_argument('--ws_host', type=str, default='0.0.0.0', help='WebSocket server host')
 parser.add_argument('--ws_port', type=int, default=8765, help='WebSocket server port')
-args = parser.parse_args()
+parser.add_argument('--obs_idle_timeout', type=float, default=300.0, help='Seconds an unused pooled OBS session is kept open')
+parser.add_argument('--obs_health_interval', type=float, default=30.0, help='Seconds between health checks of a pooled OBS session')
+parser.add_argument('--obs_connect_timeout', type=float, default=15.0, help='Seconds to keep retrying an unreachable OBS before failing a command')
+parser.add_argument('--metrics', action='store_true', help='Record latency metrics and serve them on /metrics')
+parser.add_argument('--max_downloads', type=int, default=8, help='Concurrent file downloads served on /files, further requests get 503')
+parser.add_argument('--max_downloads_per_client', type=int, default=2, help='Concurrent file downloads per remote address')
+parser.add_argument('--clip_stages', type=str, nargs='*', default=['checksum', 'remux', 'poster'], help='obs_clips stages run on saved replays and recordings')
+parser.add_argument('--clip_processes', type=int, default=2, help='Worker processes running clip stages')
+parser.add_argument('--plugins', type=str, nargs='*', default=[], help='Modules exposing register(registry) that add commands')
+# Importing the module (plugins, tools) must not consume someone else's command line
+args = parser.parse_args() if __name__ == "__main__" else parser.parse_args([])
 
 # OBS WebSocket connection details
 OBS_HOST = args.obs_host
@@ -30,165 +50,338 @@ VIDEO_PATH = os.path.join(BASE_PATH, "videos")
 CLIPS_PATH = os.path.join(BASE_PATH, "clips")
 SNAPSHOT_PATH = os.path.join(BASE_PATH, "snapshots")
 
-# Ensure directories exist
-os.makedirs(VIDEO_PATH, exist_ok=True)
-os.makedirs(CLIPS_PATH, exist_ok=True)
-os.makedirs(SNAPSHOT_PATH, exist_ok=True)
+# Recordings, clips and snapshots are downloadable on /files/<videos|clips|snapshots>/<name>
+file_server = ArtifactFileServer(
+    {'videos': VIDEO_PATH, 'clips': CLIPS_PATH, 'snapshots': SNAPSHOT_PATH},
+    max_downloads=args.max_downloads,
+    max_downloads_per_client=args.max_downloads_per_client,
+)
+
+async def log_clip_stage(job, stage, result, error):
+    if error is not None:
+        logging.error(f"Clip stage {stage} failed for {job.file_path}: {error}")
+    else:
+        logging.info(f"Clip stage {stage} finished for {job.file_path}: {result}")
+
+# Saved replays are moved into CLIPS_PATH and post-processed; recordings are
+# already written to VIDEO_PATH and only post-processed
+clip_pipeline = ClipPipeline(
+    {name: STAGES[name] for name in args.clip_stages},
+    processes=args.clip_processes,
+    on_stage=log_clip_stage,
+)
+
+def on_obs_event(data):
+    event_type = data.get('eventType')
+    event_data = data.get('eventData', {})
+    if event_type == 'ReplayBufferSaved':
+        source, directory, kind = event_data.get('savedReplayPath'), CLIPS_PATH, 'replay'
+    elif event_type == 'RecordStateChanged' and event_data.get('outputState') == OUTPUT_STOPPED:
+        source, directory, kind = event_data.get('outputPath'), VIDEO_PATH, 'recording'
+    else:
+        return
+    if source and os.path.isfile(source):
+        clip_pipeline.submit(source, directory, kind)
+
+# Identified OBS sessions are shared by every client connecting with the same
+# (host, port, password) instead of doing a full handshake per client
+replay_savers = {}  # One long-lived ReplayBufferSaved dispatcher per pooled session
+
+async def open_obs_client(host, port, password):
+    client = await AsyncOBSClient(host=host, port=port, password=password).connect()
+    replay_savers[client] = ReplayBufferSaver()
+    replay_savers[client].attach(client)
+    client.register_raw_event(on_obs_event)
+    return client
+
+async def close_obs_client(client):
+    saver = replay_savers.pop(client, None)
+    if saver is not None:
+        saver.detach()
+    await client.disconnect()
+
+async def check_obs_client(client):
+    await client.call('GetVersion')
+
+obs_pool = OBSConnectionPool(
+    open_obs_client,
+    close_obs_client,
+    health_check=check_obs_client,
+    idle_timeout=args.obs_idle_timeout,
+    health_interval=args.obs_health_interval,
+)
 
 class OBSService:
-    def __init__(self):
-        # Initialize and connect to OBS when creating an instance
-        logging.info("Initializing OBS connection...")
-        try:
-            self.ws = ReqClient(host=OBS_HOST, port=OBS_PORT, password=OBS_PASSWORD)
-            self.ws.register_event(self.on_replay_buffer_saved, events.ReplayBufferSaved)
-            logging.info("OBS connection established successfully.")
-        except Exception as e:
-            logging.error(f"Failed to connect to OBS WebSocket: {e}")
-            raise e
+    def __init__(self, host=OBS_HOST, port=OBS_PORT, password=OBS_PASSWORD):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.ws = None
+
+    async def connect(self):
+        # Retries with jittered exponential backoff while OBS is restarting
+        logging.info("Acquiring OBS connection...")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + args.obs_connect_timeout
+        delays = backoff_delays()
+        while True:
+            try:
+                self.ws = await obs_pool.acquire(self.host, self.port, self.password)
+                logging.info("OBS connection established successfully.")
+                return
+            except Exception as e:
+                delay = next(delays)
+                if loop.time() + delay > deadline:
+                    logging.error(f"Failed to connect to OBS WebSocket: {e}")
+                    raise e
+                logging.warning(f"OBS WebSocket unreachable ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def ensure_connected(self):
+        # A dropped session is replaced before the next request
+        if self.ws is None or not self.ws.is_connected:
+            await self.disconnect()
+            await self.connect()
+
+    async def call(self, request_type, request_data=None):
+        # An idempotent request that was cut off by a dropped session is sent once more
+        for attempt in range(2):
+            await self.ensure_connected()
+            try:
+                return await self.ws.call(request_type, request_data)
+            except ConnectionError:
+                if attempt or not is_idempotent(request_type):
+                    raise
 
-    def disconnect(self):
-        logging.info("Disconnecting OBS...")
-        self.ws.disconnect()
+    async def disconnect(self):
+        if self.ws is not None:
+            logging.info("Releasing OBS connection...")
+            await obs_pool.release(self.ws)
+            self.ws = None
 
-    def start_recording(self):
+    async def start_recording(self):
         logging.info("Starting recording...")
-        self.ws.set_record_directory(recordDirectory=VIDEO_PATH)
-        self.ws.start_record()
+        await self.call('SetRecordDirectory', {'recordDirectory': VIDEO_PATH})
+        await self.call('StartRecord')
 
-    def stop_recording(self):
+    async def stop_recording(self):
         logging.info("Stopping recording...")
-        response = self.ws.stop_record()
-        output_path = response.output_path if response.output_path else None
+        response = await self.call('StopRecord')
+        output_path = response.get('outputPath')
         if output_path:
             logging.info(f"Recording stopped, file path: {output_path}")
             return output_path
         else:
             raise Exception("Failed to retrieve recording file path")
 
-    def toggle_record_pause(self):
+    async def toggle_record_pause(self):
         logging.info("Toggling recording pause...")
-        self.ws.toggle_record_pause()
+        await self.call('ToggleRecordPause')
 
-    def take_snapshot(self, source_name="Scene", image_format="png"):
+    async def take_snapshot(self, source_name="Scene", image_format="png"):
         logging.info("Taking snapshot...")
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        file_name = f"{timestamp}.{image_format}"
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")[:-3]
+        file_name = f"{timestamp}_{uuid.uuid4().hex[:8]}.{image_format}"
         file_path = os.path.join(SNAPSHOT_PATH, file_name)
 
         width, height, quality = 1920, 1080, -1
         try:
-            self.ws.save_source_screenshot(
-                name=source_name,
-                img_format=image_format,
-                file_path=file_path,
-                width=width,
-                height=height,
-                quality=quality
-            )
+            await self.call('SaveSourceScreenshot', {
+                'sourceName': source_name,
+                'imageFormat': image_format,
+                'imageFilePath': file_path,
+                'imageWidth': width,
+                'imageHeight': height,
+                'imageCompressionQuality': quality,
+            })
             logging.info(f"Snapshot taken, saved at: {file_path}")
             return file_path
         except Exception as e:
             raise Exception(f"Failed to take snapshot: {str(e)}")
 
-    def start_replay_buffer(self):
+    async def start_replay_buffer(self):
         logging.info("Starting replay buffer...")
-        self.ws.start_replay_buffer()
+        await self.call('StartReplayBuffer')
 
     async def save_replay_buffer(self):
         logging.info("Saving replay buffer...")
-        self.ws.save_replay_buffer()
-        
-        # Wait for the ReplayBufferSaved event to get the saved path
+        # The session's dispatcher waits for the matching ReplayBufferSaved event
         try:
-            saved_path = await self.wait_for_replay_buffer_saved()
+            await self.ensure_connected()
+            saved_path, duration = await replay_savers[self.ws].save()
             logging.info(f"Replay buffer saved, file path: {saved_path}")
-            return saved_path
+            return saved_path, duration
         except Exception as e:
             raise Exception(f"Failed to save replay buffer: {str(e)}")
 
-    async def wait_for_replay_buffer_saved(self):
-        future = asyncio.get_event_loop().create_future()
+# Command handlers, called as handler(obs_service, parameters)
+async def start_recording(obs_service, parameters):
+    await obs_service.start_recording()
+    return {"status": "Recording started"}
 
-        def on_replay_buffer_saved(event):
-            saved_path = event.datain['savedReplayPath']
-            future.set_result(saved_path)
+async def stop_recording(obs_service, parameters):
+    try:
+        video_path = await clip_pipeline.wait_moved(await obs_service.stop_recording())
+        return {"status": "Recording stopped", "file_path": video_path, "url": file_server.url_for(video_path)}
+    except Exception as e:
+        return {"error": f"Stopping recording failed: {str(e)}"}
+
+async def pause_recording(obs_service, parameters):
+    await obs_service.toggle_record_pause()
+    return {"status": "Toggled recording pause state"}
 
-        self.ws.register_event(on_replay_buffer_saved, events.ReplayBufferSaved)
-        return await future
+async def take_snapshot(obs_service, parameters):
+    try:
+        file_path = await obs_service.take_snapshot()
+        return {"status": "Snapshot taken", "file_path": file_path, "url": file_server.url_for(file_path)}
+    except Exception as e:
+        return {"error": f"Snapshot failed: {str(e)}"}
 
-    def on_replay_buffer_saved(self, event):
-        saved_path = event.datain['savedReplayPath']
-        logging.info(f"Replay buffer saved at: {saved_path}")
+async def start_replay_buffer(obs_service, parameters):
+    await obs_service.start_replay_buffer()
+    return {"status": "Replay buffer started"}
+
+async def save_replay_buffer(obs_service, parameters):
+    try:
+        file_path, duration = await obs_service.save_replay_buffer()
+        file_path = await clip_pipeline.wait_moved(file_path)
+        return {"status": "Replay buffer saved", "file_path": file_path, "url": file_server.url_for(file_path), "duration": duration}
+    except Exception as e:
+        return {"error": f"Saving replay buffer failed: {str(e)}"}
+
+async def get_pool_stats(obs_service, parameters):
+    return {"status": "Pool stats", "data": obs_pool.stats()}
+
+async def get_command_stats(obs_service, parameters):
+    return {"status": "Command stats", "data": commands.stats()}
+
+commands = CommandRegistry(is_error=lambda response: "error" in response)
+commands.register("START_RECORDING", start_recording)
+commands.register("STOP_RECORDING", stop_recording)
+commands.register("PAUSE_RECORDING", pause_recording)
+commands.register("TAKE_SNAPSHOT", take_snapshot)
+commands.register("START_REPLAY_BUFFER", start_replay_buffer)
+commands.register("SAVE_REPLAY_BUFFER", save_replay_buffer)
+commands.register("GET_POOL_STATS", get_pool_stats)
+commands.register("GET_COMMAND_STATS", get_command_stats)
+commands.load_plugins(args.plugins)
+
+connected_clients = set()
 
 # WebSocket handler for incoming connections using aiohttp
 async def handle_client(request):
     ws = web.WebSocketResponse()
     await ws.prepare(request)
+    connected_clients.add(ws)
 
     obs_service = OBSService()
+    try:
+        await obs_service.connect()
+    except Exception:
+        # Keep the client; its next command tries to reach OBS again
+        pass
     try:
         async for msg in ws:
             if msg.type == web.WSMsgType.TEXT:
+                timer = obs_metrics.start_command()
+                received = time.perf_counter() if timer is not None else None
+                command = None
                 try:
-                    data = json.loads(msg.data)
+                    data = JSON.loads(msg.data)
                     command = data.get("command")
-
-                    if command == "START_RECORDING":
-                        obs_service.start_recording()
-                        await ws.send_str(json.dumps({"status": "Recording started"}))
-
-                    elif command == "STOP_RECORDING":
-                        try:
-                            video_path = obs_service.stop_recording()
-                            await ws.send_str(json.dumps({
-                                "status": "Recording stopped",
-                                "file_path": video_path
-                            }))
-                        except Exception as e:
-                            await ws.send_str(json.dumps({"error": f"Stopping recording failed: {str(e)}"}))
-
-                    elif command == "PAUSE_RECORDING":
-                        obs_service.toggle_record_pause()
-                        await ws.send_str(json.dumps({"status": "Toggled recording pause state"}))
-
-                    elif command == "TAKE_SNAPSHOT":
-                        try:
-                            file_path = obs_service.take_snapshot()
-                            await ws.send_str(json.dumps({
-                                "status": "Snapshot taken",
-                                "file_path": file_path
-                            }))
-                        except Exception as e:
-                            await ws.send_str(json.dumps({"error": f"Snapshot failed: {str(e)}"}))
-
-                    elif command == "START_REPLAY_BUFFER":
-                        obs_service.start_replay_buffer()
-                        await ws.send_str(json.dumps({"status": "Replay buffer started"}))
-
-                    elif command == "SAVE_REPLAY_BUFFER":
-                        try:
-                            file_path = await obs_service.save_replay_buffer()
-                            await ws.send_str(json.dumps({
-                                "status": "Replay buffer saved",
-                                "file_path": file_path
-                            }))
-                        except Exception as e:
-                            await ws.send_str(json.dumps({"error": f"Saving replay buffer failed: {str(e)}"}))
-
-                    else:
-                        await ws.send_str(json.dumps({"error": "Unknown command"}))
-                except json.JSONDecodeError:
-                    await ws.send_str(json.dumps({"error": "Invalid message format"}))
+                    response = await commands.dispatch(command, data.get("parameter", {}), obs_service)
+                except ValueError:
+                    response = {"error": "Invalid message format"}
+                except UnknownCommandError:
+                    response = {"error": "Unknown command"}
+                except CommandError as e:
+                    response = {"error": str(e)}
+                except Exception as e:
+                    logging.error(f"Command failed: {e}")
+                    response = {"error": f"Command failed: {str(e)}"}
+                if timer is not None:
+                    serialize_started = time.perf_counter()
+                    payload = JSON.dumps(response)
+                    finished = time.perf_counter()
+                    # Commands are handled one at a time per client, so nothing queues
+                    obs_metrics.registry.observe_command(str(command), 0.0, timer.obs, finished - serialize_started, finished - received)
+                    obs_metrics.registry.inc('obs_service_commands_total', command=str(command), status='error' if 'error' in response else 'success')
+                else:
+                    payload = JSON.dumps(response)
+                await ws.send_str(payload)
 
     finally:
-        obs_service.disconnect()
+        connected_clients.discard(ws)
+        await obs_service.disconnect()
 
     return ws
 
+async def handle_metrics(request):
+    return web.Response(body=obs_metrics.registry.render().encode(), headers={'Content-Type': obs_metrics.CONTENT_TYPE})
+
+def setup_metrics():
+    registry = obs_metrics.enable()
+    registry.gauge('obs_service_clients', 'Connected service clients', lambda: len(connected_clients))
+    registry.gauge('obs_service_pool_sessions', 'Open pooled OBS sessions', lambda: len(obs_pool.sessions))
+    registry.gauge('obs_service_pool_handshakes', 'OBS handshakes done by the pool, including reconnects',
+                   lambda: obs_pool.metrics['handshakes'])
+    registry.gauge('obs_service_pool_handshake_failures', 'OBS handshakes that failed', lambda: obs_pool.metrics['handshake_failures'])
+    registry.gauge('obs_service_time_to_ready_seconds', 'Seconds from process start until the service was first ready',
+                   lambda: readiness.time_to_ready if readiness.time_to_ready is not None else {})
+
+# Holds a pooled session to the configured OBS from startup on, so the first
+# client finds it identified and /readyz tells whether OBS is reachable
+obs_keeper = OBSService()
+obs_keeper_task = None
+
+async def keep_obs_connected():
+    delays = backoff_delays()
+    while True:
+        try:
+            await obs_keeper.ensure_connected()
+        except Exception:
+            # connect() has already retried for --obs_connect_timeout
+            await asyncio.sleep(next(delays))
+            continue
+        delays = backoff_delays()
+        readiness.update()
+        await asyncio.wait([obs_keeper.ws.reader_task])
+        logging.warning("Lost the OBS connection, reconnecting in the background")
+
+def check_ready():
+    connected = obs_keeper.ws is not None and obs_keeper.ws.is_connected
+    return connected, {'obs': {'host': OBS_HOST, 'port': OBS_PORT, 'connected': connected}}
+
+readiness = Readiness(check_ready, STARTED)
+
 # Start the WebSocket server using aiohttp
+async def start_obs_pool(app):
+    global obs_keeper_task
+    for path in (VIDEO_PATH, CLIPS_PATH, SNAPSHOT_PATH):
+        os.makedirs(path, exist_ok=True)
+    obs_pool.start()
+    # OBS is connected in the background; the port is bound right after the
+    # startup hooks, and no probe can be answered before that
+    readiness.listening = True
+    obs_keeper_task = asyncio.get_running_loop().create_task(keep_obs_connected())
+
+async def close_obs_pool(app):
+    if obs_keeper_task is not None:
+        obs_keeper_task.cancel()
+    await obs_keeper.disconnect()
+    await obs_pool.close()
+    await clip_pipeline.close()
+
 app = web.Application()
 app.router.add_get('/', handle_client)
+file_server.add_routes(app)
+readiness.add_routes(app)
+if args.metrics:
+    setup_metrics()
+    app.router.add_get('/metrics', handle_metrics)
+app.on_startup.append(start_obs_pool)
+app.on_cleanup.append(close_obs_pool)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     web.run_app(app, host=args.ws_host, port=args.ws_port)
@@ -1,36 +1,199 @@
 import asyncio
-import json
 import logging
 import os
 import datetime
 import uuid
-import obsws_python as obs
 import websockets
 import concurrent.futures
-import functools
 import traceback
-import base64
-import inspect
-import datetime  # Make sure to import datetime if not already imported
-import obsws_python as obs
+import sys
+import tempfile
+import time
+from aiohttp import web
+import obs_metrics
+from command_registry import CommandError, CommandRegistry
+from obs_admission import RateLimiter
+from obs_artifacts import ARTIFACT_KINDS, ArtifactIndex, file_size
+from obs_burst import SnapshotBurst
+from obs_clips import STAGES, ClipPipeline
+from obs_fanout import parse_event_subscriptions
+from obs_files import ArtifactFileServer
+from obs_logging import setup_async_logging
+from obs_probes import Readiness
+from obs_rules import Rule, RuleEngine
+from obs_serializer import IPC, JSON, for_subprotocol, get_serializer, select_subprotocol
+from obs_async import OBSRequestError, RequestBatchExecutionType
+from obs_snapshot import MODE_TRANSFER, SNAPSHOT_MODES, SnapshotEngine
+from obs_snapshot_cache import BASE_HEIGHT, BASE_WIDTH
+from obs_state import OUTPUT_STOPPED
+from obs_targets import OBSTargetRegistry, parse_targets
+from obs_worker import IPC_READ_LIMIT, RemoteWebSocket, WorkerLink, encode_frame, queued_messages, read_frame
+
+STARTED = time.monotonic()  # time_to_ready is measured from here
 
 # Default configuration
 DEFAULT_OBS_HOST = 'localhost'
 DEFAULT_OBS_PORT = 4455
 DEFAULT_OBS_PASSWORD = ''  # Set your OBS WebSocket password if you have one
-DEFAULT_WEBSOCKET_PORT = 8184
+DEFAULT_WEBSOCKET_PORT = int(os.environ.get('OBS_SERVICE_PORT', '8184'))
+# Ports tried from DEFAULT_WEBSOCKET_PORT on when it is taken; a port set
+# through OBS_SERVICE_PORT is used as is or the service fails to start
+PORT_FALLBACK_ATTEMPTS = 1 if 'OBS_SERVICE_PORT' in os.environ else 10
+# 'eager' connects to every OBS target before accepting clients; 'lazy' binds
+# right away and connects in the background, /readyz tells when OBS is up
+STARTUP_MODE = os.environ.get('OBS_SERVICE_STARTUP', 'eager')
+DEFAULT_TARGET = 'default'  # Name of the target when OBS_TARGETS is not set
+STATE_MAX_STALENESS = 10.0  # Seconds the event-driven OBS state mirror is trusted without a resync
+REPLAY_SAVE_TIMEOUT = 10.0  # Seconds to wait for OBS to report a saved replay
+SNAPSHOT_CACHE_TTL = 1.0  # Seconds a captured preview is served to other viewers
+SNAPSHOT_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Memory budget of the preview cache
+EVENT_QUEUE_SIZE = 256  # Events buffered per subscribed client before dropping
+EVENT_MAX_DROPPED = 1024  # Consecutive dropped events before a subscriber is disconnected
+BURST_MAX_FRAMES = 3000  # Upper bound on frames in one snapshot burst
+BURST_MAX_IN_FLIGHT = 4  # Upper bound on concurrent captures of one burst
+RECONNECT_BASE_DELAY = 0.5  # Seconds before the first reconnect attempt, doubled per failure
+RECONNECT_MAX_DELAY = 30.0  # Upper bound on the delay between reconnect attempts
+REPLAY_QUEUE_SIZE = 256  # Idempotent requests held per target while OBS is reconnecting
+REPLAY_DEADLINE = 5.0  # Seconds a held request waits for OBS to come back
+HEALTH_INTERVAL = float(os.environ.get('OBS_SERVICE_HEALTH_INTERVAL', '2.0'))  # Seconds between GetStats samples per target, 0 = off
+HEALTH_SAMPLES = 300  # Samples kept per target
+HEALTH_WINDOW = 30.0  # Seconds covered by the rolling health values
+# Alert -> threshold of its rolling value, see obs_health.ALERTS
+HEALTH_THRESHOLDS = {
+    'dropped_frames': 0.01,  # Fraction of output frames skipped
+    'render_lag': 0.01,  # Fraction of frames skipped by the renderer
+    'frame_render_time': 20.0,  # Milliseconds
+    'disk_space': 5 * 1024,  # MB left on the recording disk
+    'bitrate': 100 * 1000,  # Bits per second while recording; lower means the file stopped growing
+}
+RULE_TIMER_RESOLUTION = 0.001  # Seconds per tick of the rule timer wheel
+RULE_TIMER_SLOTS = 4096  # Ticks per revolution of the rule timer wheel
+RULES_MAX_PER_TARGET = 256  # Rules outlive their clients, so they are capped per OBS target
+RULE_MIN_INTERVAL = 1.0  # Shortest period of a repeating rule, in seconds
 
 # Directories
 VIDEO_DIR = 'videos'
 SNAPSHOT_DIR = 'snapshots'
+CLIPS_DIR = 'clips'
 LOG_DIR = 'logs'
+ARTIFACT_INDEX = 'artifacts.jsonl'  # Append-only index of the recordings, replays and snapshots produced
+ARTIFACT_MAX_RECORDS = 10000  # Newest artifacts kept in the index; LIST_ARTIFACTS pages through these
+ARTIFACT_PAGE_SIZE = 100  # LIST_ARTIFACTS page size when the client does not ask for one
+ARTIFACT_MAX_PAGE_SIZE = 1000
+
+# 'sync' writes a plain log file per start from the event loop thread. 'async'
+# only enqueues on the loop; a background thread writes rotating JSON lines
+LOG_MODE = os.environ.get('OBS_SERVICE_LOG_MODE', 'sync')
+LOG_MAX_BYTES = 50 * 1024 * 1024  # Size at which the async log file is rotated
+LOG_MAX_AGE = 24 * 3600  # Seconds after which the async log file is rotated
+LOG_BACKUP_COUNT = 14  # Rotated log files kept
+LOG_SAMPLE_BURST = 20  # INFO records per logging call site per interval, the rest is sampled away
+LOG_SAMPLE_INTERVAL = 1.0
+
+PIPELINE_MAX_IN_FLIGHT = 16  # Commands of one client processed concurrently, 1 = strictly serial
+CLIENT_RATE_LIMIT = (50.0, 100)  # Commands per second and burst one client may send; per-command limits are registered with the commands
+OBS_MAX_PENDING_REQUESTS = 128  # OBS requests in flight across targets before sheddable commands are refused
+EXECUTOR_MAX_QUEUED = 32  # Executor jobs waiting before sheddable commands are refused
+OVERLOAD_RETRY_AFTER = 1.0  # Seconds a client refused under load is told to wait
+
+# Front-end worker processes accepting clients on one port (SO_REUSEPORT) and
+# relaying to this process, which owns the OBS sessions. 1 = serve clients here
+WORKERS = int(os.environ.get('OBS_SERVICE_WORKERS', '1'))
+WORKER_RESTART_DELAY = 1.0  # Seconds before a crashed worker is started again
+WORKER_CLIENT_MAX_QUEUED = 256  # Relayed messages of one client waiting here before it is disconnected
+
+# HTTP port serving /metrics; 0 leaves the instrumentation disabled
+METRICS_PORT = int(os.environ.get('OBS_SERVICE_METRICS_PORT', '0'))
+
+# HTTP port serving recordings and snapshots on /files/...; 0 disables it. May
+# be the same as METRICS_PORT. The service carries on without it if the port is taken
+HTTP_PORT = int(os.environ.get('OBS_SERVICE_HTTP_PORT', '0'))
+MAX_DOWNLOADS = 8  # Concurrent file downloads, further requests get 503
+MAX_DOWNLOADS_PER_CLIENT = 2  # Concurrent file downloads per remote address
+GROWING_FILE_IDLE = 5.0  # Seconds a followed recording may stop growing before its download ends
+
+# Saved replays are moved to CLIPS_DIR and finished recordings to VIDEO_DIR,
+# then these obs_clips.STAGES run on them; '' only moves the files
+CLIP_STAGES = [name for name in os.environ.get('OBS_SERVICE_CLIP_STAGES', 'checksum,remux,poster').split(',') if name]
+CLIP_PROCESSES = 2  # Worker processes running clip stages
+CLIP_MAX_JOBS = 2  # Saved files processed at the same time
+CLIP_MAX_QUEUED = 64  # Saved files waiting to be processed before new ones are skipped
+
+# Wire format of the OBS sessions: 'json' or 'msgpack' (needs the msgpack
+# package, falls back to json without it). Clients pick their own format
+# through the obs-service.json / obs-service.msgpack subprotocols
+OBS_SERIALIZER = get_serializer(os.environ.get('OBS_SERVICE_OBS_SERIALIZER', 'json'))
+
+# Named OBS targets fronted by this service, "name=[password@]host:port,..."
+OBS_TARGETS = parse_targets(os.environ.get('OBS_TARGETS', '')) or {
+    DEFAULT_TARGET: (DEFAULT_OBS_HOST, DEFAULT_OBS_PORT, DEFAULT_OBS_PASSWORD)
+}
+BIND_TARGET = next(iter(OBS_TARGETS))  # New clients are bound to the first configured target
+
+# Modules exposing register(registry) that add their own commands
+COMMAND_PLUGINS = [name for name in os.environ.get('OBS_SERVICE_PLUGINS', '').split(',') if name]
+
+# Service commands that map onto a single OBS request and may be used inside BATCH
+BATCH_COMMAND_REQUESTS = {
+    'START_RECORDING': 'StartRecord',
+    'STOP_RECORDING': 'StopRecord',
+    'PAUSE_RECORDING': 'PauseRecord',
+    'RESUME_RECORDING': 'ResumeRecord',
+    'GET_RECORD_STATUS': 'GetRecordStatus',
+    'START_REPLAY_BUFFER': 'StartReplayBuffer',
+    'STOP_REPLAY_BUFFER': 'StopReplayBuffer',
+    'SAVE_REPLAY_BUFFER': 'SaveReplayBuffer',
+    'GET_REPLAY_BUFFER_STATUS': 'GetReplayBufferStatus',
+}
+# Commands that act on the client's own session rather than an OBS target
+BROADCAST_EXCLUDED_COMMANDS = {'CONNECT_WEBSOCKET', 'DISCONNECT_WEBSOCKET', 'BROADCAST', 'SUBSCRIBE', 'UNSUBSCRIBE', 'STOP_SNAPSHOT_BURST'}
+# Commands a rule may not run: they act on the client's session or on rules
+RULE_EXCLUDED_COMMANDS = BROADCAST_EXCLUDED_COMMANDS | {'ADD_RULE', 'REMOVE_RULE', 'LIST_RULES'}
+BATCH_EXECUTION_TYPES = {
+    'SERIAL_REALTIME': RequestBatchExecutionType.SERIAL_REALTIME,
+    'SERIAL_FRAME': RequestBatchExecutionType.SERIAL_FRAME,
+    'PARALLEL': RequestBatchExecutionType.PARALLEL,
+}
 
 # Global variables
 clients = {}  # Stores client information
-obs_client = None  # OBS WebSocket client instance
-executor = concurrent.futures.ThreadPoolExecutor(max_workers=5)
+rule_subscribers = {}  # target name -> instance_ids that asked for the firings of every rule on it
+executor = concurrent.futures.ThreadPoolExecutor(max_workers=5)  # Blocking local work only (disk I/O)
+snapshot_engine = SnapshotEngine(SNAPSHOT_DIR, executor)  # Decodes and writes snapshots off the event loop
+# Each target owns its OBS session, state mirror, replay saver, event fan-out and preview cache
+targets = OBSTargetRegistry(
+    state_max_staleness=STATE_MAX_STALENESS,
+    replay_save_timeout=REPLAY_SAVE_TIMEOUT,
+    event_queue_size=EVENT_QUEUE_SIZE,
+    event_max_dropped=EVENT_MAX_DROPPED,
+    snapshot_cache_max_bytes=SNAPSHOT_CACHE_MAX_BYTES,
+    snapshot_cache_ttl=SNAPSHOT_CACHE_TTL,
+    executor=executor,
+    reconnect_base_delay=RECONNECT_BASE_DELAY,
+    reconnect_max_delay=RECONNECT_MAX_DELAY,
+    replay_queue_size=REPLAY_QUEUE_SIZE,
+    replay_deadline=REPLAY_DEADLINE,
+    serializer=OBS_SERIALIZER,
+    health_interval=HEALTH_INTERVAL,
+    health_samples=HEALTH_SAMPLES,
+    health_window=HEALTH_WINDOW,
+    health_thresholds=HEALTH_THRESHOLDS,
+)
+for name, (host, port, password) in OBS_TARGETS.items():
+    targets.add(name, host, port, password)
 
 def setup_logging():
+    if LOG_MODE == 'async':
+        setup_async_logging(
+            LOG_DIR,
+            max_bytes=LOG_MAX_BYTES,
+            max_age=LOG_MAX_AGE,
+            backup_count=LOG_BACKUP_COUNT,
+            sample_burst=LOG_SAMPLE_BURST,
+            sample_interval=LOG_SAMPLE_INTERVAL,
+        )
+        logging.info("Logging initialized.")
+        return
     if not os.path.exists(LOG_DIR):
         os.makedirs(LOG_DIR)
     log_filename = datetime.datetime.now().strftime("%Y%m%d%H%M%S") + '.log'
@@ -48,547 +211,1297 @@ def setup_logging():
     logging.getLogger().addHandler(console)
     logging.info("Logging initialized.")
 
-setup_logging()
-
 def ensure_directories():
-    for directory in [VIDEO_DIR, SNAPSHOT_DIR, LOG_DIR]:
+    for directory in [VIDEO_DIR, SNAPSHOT_DIR, CLIPS_DIR, LOG_DIR]:
         if not os.path.exists(directory):
             os.makedirs(directory)
     logging.info("Directories ensured.")
 
-ensure_directories()
+def is_recording(path):
+    # OBS reports the file of a recording when it starts; only that one is still being written
+    for target in targets:
+        output_path = target.state.record_output_path
+        if target.state.record_active and output_path and os.path.realpath(output_path) == path:
+            return True
+    return False
 
-def connect_to_obs(host=DEFAULT_OBS_HOST, port=DEFAULT_OBS_PORT, password=DEFAULT_OBS_PASSWORD):
-    global obs_client
-    try:
-        #obs_client = obs.ReqClient(host=host, port=port, password=password, timeout=10)
-        obs_client = obs.Client(host=host, port=port, password=password, timeout=10)
+artifacts = ArtifactIndex(ARTIFACT_INDEX, max_records=ARTIFACT_MAX_RECORDS)  # Outlives clients and restarts, unlike per-client state; loaded at startup
+file_server = ArtifactFileServer(
+    {'videos': VIDEO_DIR, 'clips': CLIPS_DIR, 'snapshots': SNAPSHOT_DIR},
+    max_downloads=MAX_DOWNLOADS,
+    max_downloads_per_client=MAX_DOWNLOADS_PER_CLIENT,
+    growing_idle=GROWING_FILE_IDLE,
+    executor=executor,
+    is_growing=is_recording,
+)
 
-        logging.info(f"Connected to OBS Studio at {host}:{port}")
-    except Exception as e:
-        logging.error(f"Failed to connect to OBS Studio: {e}")
-        obs_client = None
+def client_target(instance_id, parameters):
+    # A command may name a target explicitly, otherwise the client's binding applies
+    name = parameters.get('target') or clients[instance_id]['target']
+    return targets.get(name) if name else None
 
-def disconnect_from_obs():
-    global obs_client
-    if obs_client:
-        obs_client.disconnect()
-        obs_client = None
-        logging.info("Disconnected from OBS Studio.")
+def connected_target(instance_id, parameters):
+    # A target that is reconnecting still counts: its requests wait or fail on their own
+    target = client_target(instance_id, parameters)
+    return target if target is not None and (target.is_connected or target.is_supervised) else None
+
+def target_state(instance_id, target):
+    # Per-client bookkeeping (start times) is kept separately for every target;
+    # a rule running after its client disconnected gets none
+    client = clients.get(instance_id)
+    return client['state'].setdefault(target.name, {}) if client else {}
+
+def bind_client(instance_id, target):
+    previous = client_target(instance_id, {})
+    if previous is not None:
+        previous.bound_clients.discard(instance_id)
+    clients[instance_id]['target'] = target.name if target is not None else None
+    if target is not None:
+        target.bound_clients.add(instance_id)
+    return previous
 
 async def handle_client(websocket):
     # Assign a unique instance ID to the client
-    instance_id = str(uuid.uuid4())
+    await serve_client(str(uuid.uuid4()), websocket, websocket)
+
+async def serve_client(instance_id, websocket, messages):
+    # messages yields the client's raw messages (IPC encoded and already
+    # validated when relayed by a worker); websocket is used to answer
+    if isinstance(websocket, RemoteWebSocket):
+        serializer = websocket.serializer
+    else:
+        serializer = for_subprotocol(websocket.subprotocol)
     clients[instance_id] = {
         'websocket': websocket,
-        'state': {}
+        'serializer': serializer,
+        'target': None,
+        'state': {},
+        'bursts': {},
+        'limiter': RateLimiter(*CLIENT_RATE_LIMIT, commands.rate_limits()),
     }
+    bind_client(instance_id, targets.get(BIND_TARGET))
     logging.info(f"New client connected: {instance_id}")
 
+    # Commands are dispatched concurrently and answered out of order, keyed by
+    # command_uid. Commands with the same ordering key run one after another
+    in_flight = set()
+    ordering_tails = {}
+    slots = asyncio.Semaphore(PIPELINE_MAX_IN_FLIGHT)
+
+    def finished(task):
+        in_flight.discard(task)
+        slots.release()
+
     try:
-        async for message in websocket:
-            await process_message(instance_id, message)
+        async for message in messages:
+            try:
+                data = serializer.loads(message)
+                if not isinstance(data, dict):
+                    raise ValueError("message must be an object")
+            except (ValueError, TypeError) as e:
+                await websocket.send(serializer.dumps(error_response(instance_id, '', f"Error processing command: {str(e)}")))
+                continue
+            received = time.perf_counter() if obs_metrics.registry is not None else None
+            rejection = admit(instance_id, data.get('command'), data.get('command_uid'))
+            if rejection is not None:
+                await websocket.send(serializer.dumps(rejection))
+                continue
+            # Stop reading from this client while it has too many commands in flight
+            await slots.acquire()
+            key = data.get('ordering_key') or commands.ordering_key(data.get('command'))
+            previous = ordering_tails.get(key) if key else None
+            task = asyncio.get_running_loop().create_task(process_message(instance_id, websocket, data, previous, received, serializer))
+            in_flight.add(task)
+            task.add_done_callback(finished)
+            if key:
+                ordering_tails[key] = task
+                task.add_done_callback(lambda t, key=key: ordering_tails.pop(key) if ordering_tails.get(key) is t else None)
     except websockets.exceptions.ConnectionClosedOK:
         logging.info(f"Client {instance_id} disconnected normally.")
     except Exception as e:
         logging.error(f"Error with client {instance_id}: {e}")
     finally:
+        # Commands still in flight have nobody to answer to
+        for task in in_flight:
+            task.cancel()
         # Clean up client data
-        clients.pop(instance_id, None)
+        previous = bind_client(instance_id, None)
+        client = clients.pop(instance_id, None)
+        for target in targets:
+            target.broadcaster.unsubscribe(instance_id)
+        for subscribers in rule_subscribers.values():
+            subscribers.discard(instance_id)
+        if client:
+            for burst in client['bursts'].values():
+                burst.stop()
+        if previous is not None:
+            await release_target(previous)
         logging.info(f"Client {instance_id} cleaned up.")
 
-async def process_message(instance_id, message):
+def overload():
+    # Why the service should shed load right now, None when it is not overloaded
+    pending = sum(len(target.client.pending) for target in targets if target.client is not None)
+    if pending > OBS_MAX_PENDING_REQUESTS:
+        return f"{pending} OBS requests in flight"
+    # ThreadPoolExecutor has no public queue length
+    queued = executor._work_queue.qsize()
+    if queued > EXECUTOR_MAX_QUEUED:
+        return f"{queued} jobs waiting for the executor"
+    return None
+
+def admit(instance_id, command, command_uid):
+    # Error response for a command refused by the client's rate limits or
+    # shed under load, None when it may run
+    retry_after = clients[instance_id]['limiter'].check(command)
+    overloaded = None if retry_after or not commands.is_sheddable(command) else overload()
+    if retry_after:
+        reason = 'rate_limited'
+        message = f"Rate limit exceeded for {command}, retry in {retry_after:.3f}s"
+    elif overloaded is not None:
+        retry_after = OVERLOAD_RETRY_AFTER
+        reason = 'overloaded'
+        message = f"Service overloaded ({overloaded}), retry in {retry_after:.3f}s"
+    else:
+        return None
+    if obs_metrics.registry is not None:
+        obs_metrics.registry.inc('obs_service_commands_rejected_total', command=str(command), reason=reason)
+    return {**error_response(instance_id, command_uid, message), "reason": reason, "retry_after": retry_after}
+
+def success_response(instance_id, command_uid, message, data=None):
+    response = {
+        "status": "success",
+        "command_uid": command_uid,
+        "instance_id": instance_id,
+        "message": message
+    }
+    if data is not None:
+        response["data"] = data
+    return response
+
+def error_response(instance_id, command_uid, message):
+    return {
+        "status": "error",
+        "command_uid": command_uid,
+        "instance_id": instance_id,
+        "message": message
+    }
+
+async def process_message(instance_id, websocket, data, previous=None, received=None, serializer=JSON):
+    command = data.get('command')
+    command_uid = data.get('command_uid')
+    parameters = data.get('parameter', {})
     try:
-        data = json.loads(message)
-        command = data.get('command')
-        command_uid = data.get('command_uid')
-        parameters = data.get('parameter', {})
-        response = {}
-
-        if command == 'CONNECT_WEBSOCKET':
-            response = handle_connect_websocket(instance_id, command_uid, parameters)
-        elif command == 'DISCONNECT_WEBSOCKET':
-            response = handle_disconnect_websocket(instance_id, command_uid)
-        elif command == 'START_RECORDING':
-            response = await handle_start_recording(instance_id, command_uid)
-        elif command == 'STOP_RECORDING':
-            response = await handle_stop_recording(instance_id, command_uid)
-        elif command == 'PAUSE_RECORDING':
-            response = await handle_pause_recording(instance_id, command_uid)
-        elif command == 'RESUME_RECORDING':
-            response = await handle_resume_recording(instance_id, command_uid)
-        elif command == 'SAVE_IMAGE_SNAPSHOT':
-            response = await handle_save_image_snapshot(instance_id, command_uid)
-        elif command == 'START_REPLAY_BUFFER':
-            response = await handle_start_replay_buffer(instance_id, command_uid)
-        elif command == 'STOP_REPLAY_BUFFER':
-            response = await handle_stop_replay_buffer(instance_id, command_uid)
-        elif command == 'SAVE_REPLAY_BUFFER':
-            response = await handle_save_replay_buffer(instance_id, command_uid)
-        elif command == 'TEST_SAVE_IMAGE_SNAPSHOT':
-            response = await test_save_image_snapshot()
-        else:
-            response = {
-                "status": "error",
-                "command_uid": command_uid,
-                "instance_id": instance_id,
-                "message": f"Unknown command: {command}"
-            }
+        if previous is not None:
+            # Wait for the preceding command with the same ordering key
+            await asyncio.wait([previous])
+        timer = obs_metrics.start_command()
+        dispatched = time.perf_counter()
+        try:
+            response = await commands.dispatch(command, parameters, instance_id, command_uid)
+        except CommandError as e:
+            response = error_response(instance_id, command_uid, str(e))
         # Send response back to the client
-        await clients[instance_id]['websocket'].send(json.dumps(response))
-        logging.info(f"Processed command: {command} for client {instance_id}")
+        serialize_started = time.perf_counter()
+        payload = serializer.dumps(response)
+        finished = time.perf_counter()
+        timings = {'handler': serialize_started - dispatched, 'serialize': finished - serialize_started}
+        if timer is not None:
+            timings['queue'] = dispatched - received
+            timings['obs'] = timer.obs
+            obs_metrics.registry.observe_command(
+                str(command), timings['queue'], timer.obs, timings['serialize'], finished - received
+            )
+            obs_metrics.registry.inc('obs_service_commands_total', command=str(command), status=response.get('status'))
+        await websocket.send(payload)
+        logging.info(f"Processed command: {command} for client {instance_id}", extra={
+            'instance_id': instance_id,
+            'command_uid': command_uid,
+            'command': command,
+            'status': response.get('status'),
+            'timings': timings,
+        })
+    except asyncio.CancelledError:
+        raise
+    except websockets.exceptions.ConnectionClosed:
+        pass
     except Exception as e:
         logging.error(f"Error processing message from {instance_id}: {e}")
-        error_response = {
-            "status": "error",
-            "command_uid": data.get('command_uid', ''),
-            "instance_id": instance_id,
-            "message": f"Error processing command: {str(e)}"
-        }
-        await clients[instance_id]['websocket'].send(json.dumps(error_response))
-
-def handle_connect_websocket(instance_id, command_uid, parameters):
-    ip_address = parameters.get('ip_address', DEFAULT_OBS_HOST)
-    port = parameters.get('port', DEFAULT_OBS_PORT)
-    password = parameters.get('password', DEFAULT_OBS_PASSWORD)
-    # Reconnect to OBS with new parameters if needed
-    connect_to_obs(ip_address, port, password)
+        await websocket.send(serializer.dumps(error_response(instance_id, command_uid, f"Error processing command: {str(e)}")))
+
+async def send_to_client(instance_id, payload):
+    # Unsolicited message to a client; it may have disconnected meanwhile
+    client = clients.get(instance_id)
+    if client is None:
+        return
+    try:
+        await client['websocket'].send(client['serializer'].dumps(payload))
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+async def handle_connect_websocket(instance_id, command_uid, parameters):
+    # Binds this client to an OBS target: a configured one by name, or one
+    # created for ip_address/port. Other clients keep their own bindings
+    name = parameters.get('target')
+    target = targets.get(name) if name else None
+    if target is None and ('ip_address' in parameters or 'port' in parameters):
+        ip_address = parameters.get('ip_address', DEFAULT_OBS_HOST)
+        port = parameters.get('port', DEFAULT_OBS_PORT)
+        target = targets.find(ip_address, port) or targets.add(
+            name or f"{ip_address}:{port}", ip_address, port, parameters.get('password', DEFAULT_OBS_PASSWORD), configured=False
+        )
+    elif target is None:
+        target = targets.get(name or BIND_TARGET)
+    if target is None:
+        return error_response(instance_id, command_uid, f"Unknown OBS target: {name}")
+    previous = bind_client(instance_id, target)
+    if previous is not None and previous is not target:
+        await release_target(previous)
+    try:
+        await target.connect()
+    except Exception as e:
+        logging.error(f"Failed to connect to OBS Studio target {target.name}: {e}")
+        return error_response(instance_id, command_uid, f"Failed to connect to OBS Studio: {e}")
     response = {
         "status": "success",
         "command_uid": command_uid,
         "message": "WebSocket connected successfully",
         "data": {
-            "ip_address": ip_address,
-            "port": port,
+            "target": target.name,
+            "ip_address": target.host,
+            "port": target.port,
             "instance_id": instance_id
         }
     }
     return response
 
-def handle_disconnect_websocket(instance_id, command_uid):
-    # Disconnect from OBS
-    disconnect_from_obs()
-    response = {
-        "status": "success",
-        "command_uid": command_uid,
-        "instance_id": instance_id,
-        "message": f"WebSocket instance id {instance_id} disconnected successfully"
-    }
+async def handle_disconnect_websocket(instance_id, command_uid, parameters):
+    # Unbinds this client; the OBS session stays up for configured targets and
+    # is closed with the last client of one created by CONNECT_WEBSOCKET
+    previous = bind_client(instance_id, None)
+    if previous is not None:
+        await release_target(previous)
+    response = success_response(instance_id, command_uid, f"WebSocket instance id {instance_id} disconnected successfully")
     return response
 
-async def handle_start_recording(instance_id, command_uid):
-    if obs_client is None:
-        return {
-            "status": "error",
-            "command_uid": command_uid,
-            "instance_id": instance_id,
-            "message": "Not connected to OBS Studio"
-        }
+async def handle_start_recording(instance_id, command_uid, parameters):
+    target = connected_target(instance_id, parameters)
+    if target is None:
+        return error_response(instance_id, command_uid, "Not connected to OBS Studio")
     try:
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(executor, obs_client.start_record)
-        clients[instance_id]['state']['recording_start_time'] = datetime.datetime.now()
-        # Recording filename may not be available
-        response = {
-            "status": "success",
-            "command_uid": command_uid,
-            "instance_id": instance_id,
-            "message": "Video recording started successfully",
-            "data": {
-                # "file_path": "",  # Optional, remove or set to None
-                "datetime": datetime.datetime.now().isoformat()
-            }
-        }
+        await target.call('StartRecord')
+        target.state.update(record_active=True, record_paused=False)
+        # The file path is only known once the recording stops
+        artifact = artifacts.start_recording(target.name, instance_id)
+        response = success_response(instance_id, command_uid, "Video recording started successfully", {
+            "artifact_id": artifact['id'],
+            "datetime": datetime.datetime.now().isoformat()
+        })
     except Exception as e:
         logging.error(f"Failed to start recording: {e}")
-        response = {
-            "status": "error",
-            "command_uid": command_uid,
-            "instance_id": instance_id,
-            "message": f"Failed to start recording: {e}"
-        }
+        response = error_response(instance_id, command_uid, f"Failed to start recording: {e}")
     return response
 
-async def handle_stop_recording(instance_id, command_uid):
-    if obs_client is None:
-        return {
-            "status": "error",
-            "command_uid": command_uid,
-            "instance_id": instance_id,
-            "message": "Not connected to OBS Studio"
-        }
+async def handle_stop_recording(instance_id, command_uid, parameters):
+    target = connected_target(instance_id, parameters)
+    if target is None:
+        return error_response(instance_id, command_uid, "Not connected to OBS Studio")
     try:
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(executor, obs_client.stop_record)
-        start_time = clients[instance_id]['state'].get('recording_start_time')
-        if start_time:
-            duration = (datetime.datetime.now() - start_time).total_seconds()
-            clients[instance_id]['state'].pop('recording_start_time', None)
-        else:
-            duration = 0
-        response = {
-            "status": "success",
-            "command_uid": command_uid,
-            "instance_id": instance_id,
-            "message": "Video recording stopped successfully",
-            "data": {
-                # "file_path": "",  # Optional, remove or set to None
-                "duration": duration,
-                "datetime": datetime.datetime.now().isoformat()
-            }
-        }
+        # OBS reports the timecode right before stopping and the file path
+        # with the stop, in one round trip
+        record_status, action_result = await record_status_then(target, 'StopRecord')
+        raise_for_result(action_result)
+        target.state.update(record_active=False, record_paused=False)
+        file_path = action_result.get('responseData', {}).get('outputPath')
+        output_duration = record_status.get('outputDuration')
+        artifact = artifacts.finish_recording(
+            target.name,
+            file_path,
+            size=file_size(file_path),
+            timecode=record_status.get('outputTimecode'),
+            duration=output_duration / 1000 if output_duration else None,
+        )
+        job = clip_pipeline.claim(file_path, instance_id, command_uid, artifact['id'])
+        file_path = await clip_pipeline.wait_moved(file_path)
+        response = success_response(instance_id, command_uid, "Video recording stopped successfully", {
+            "artifact_id": artifact['id'],
+            "clip_job_id": job.job_id if job else None,
+            "file_path": file_path,
+            "url": file_server.url_for(file_path),
+            "size": artifact['size'],
+            "timecode": artifact['timecode'],
+            "duration": artifact['duration'] or 0,
+            "datetime": datetime.datetime.now().isoformat()
+        })
     except Exception as e:
         logging.error(f"Failed to stop recording: {e}")
-        response = {
-            "status": "error",
-            "command_uid": command_uid,
-            "instance_id": instance_id,
-            "message": f"Failed to stop recording: {e}"
-        }
+        response = error_response(instance_id, command_uid, f"Failed to stop recording: {e}")
     return response
 
 
-async def handle_pause_recording(instance_id, command_uid):
-    if obs_client is None:
-        return {
-            "status": "error",
-            "command_uid": command_uid,
-            "instance_id": instance_id,
-            "message": "Not connected to OBS Studio"
-        }
+async def handle_get_record_status(instance_id, command_uid, parameters):
+    target = connected_target(instance_id, parameters)
+    if target is None:
+        return error_response(instance_id, command_uid, "Not connected to OBS Studio")
+    try:
+        # Concurrent status queries for a target share one OBS request
+        status = await target.call('GetRecordStatus')
+        response = success_response(instance_id, command_uid, "Record status", {
+            "active": status.get('outputActive'),
+            "paused": status.get('outputPaused'),
+            "timecode": status.get('outputTimecode'),
+            "duration": (status.get('outputDuration') or 0) / 1000,
+            "bytes": status.get('outputBytes'),
+            "datetime": datetime.datetime.now().isoformat()
+        })
+    except Exception as e:
+        logging.error(f"Failed to get record status: {e}")
+        response = error_response(instance_id, command_uid, f"Failed to get record status: {e}")
+    return response
+
+async def record_status_then(target, request_type):
+    # Check-then-act in one round trip: the serial batch reports the record
+    # status as it was right before OBS executed the action
+    status_result, action_result = await target.call_batch([
+        {'requestType': 'GetRecordStatus'},
+        {'requestType': request_type},
+    ])
+    if not status_result['requestStatus']['result']:
+        status = status_result['requestStatus']
+        raise OBSRequestError('GetRecordStatus', status['code'], status.get('comment'))
+    return status_result.get('responseData', {}), action_result
+
+def raise_for_result(result):
+    status = result['requestStatus']
+    if not status['result']:
+        raise OBSRequestError(result.get('requestType'), status['code'], status.get('comment'))
+
+async def checked_record_action(target, request_type, precondition):
+    # precondition(record_status) returns an error message or None. With a fresh
+    # state mirror only the action goes to OBS, otherwise status and action share
+    # one batch. Returns the precondition error, if any
+    if target.state.is_fresh():
+        error = precondition(target.state.record_status())
+        if error is None:
+            await target.call(request_type)
+        return error
+    record_status, action_result = await record_status_then(target, request_type)
+    error = precondition(record_status)
+    if error is None:
+        raise_for_result(action_result)
+    return error
+
+def pause_precondition(record_status):
+    if not record_status['outputActive']:
+        return "No active recording session to pause"
+    if record_status['outputPaused']:
+        return "Video recording is already in pause state"
+    return None
+
+def resume_precondition(record_status):
+    if not record_status['outputActive']:
+        return "No active recording session to resume"
+    if not record_status['outputPaused']:
+        return "Video recording is currently not in pause state"
+    return None
+
+async def handle_pause_recording(instance_id, command_uid, parameters):
+    target = connected_target(instance_id, parameters)
+    if target is None:
+        return error_response(instance_id, command_uid, "Not connected to OBS Studio")
     try:
-        loop = asyncio.get_event_loop()
-        record_status = await loop.run_in_executor(executor, obs_client.get_record_status)
-        if not record_status.output_active:
-            return {
-                "status": "error",
-                "command_uid": command_uid,
-                "instance_id": instance_id,
-                "message": "No active recording session to pause"
-            }
-        if record_status.output_paused:
-            return {
-                "status": "error",
-                "command_uid": command_uid,
-                "instance_id": instance_id,
-                "message": "Video recording is already in pause state"
-            }
-        await loop.run_in_executor(executor, obs_client.pause_record)
+        error = await checked_record_action(target, 'PauseRecord', pause_precondition)
+        if error:
+            return error_response(instance_id, command_uid, error)
+        target.state.update(record_paused=True)
         # Calculate total duration until now
-        start_time = clients[instance_id]['state'].get('recording_start_time')
-        if start_time:
-            total_duration = (datetime.datetime.now() - start_time).total_seconds()
+        artifact = artifacts.active_recording(target.name)
+        if artifact:
+            total_duration = (datetime.datetime.now() - datetime.datetime.fromisoformat(artifact['started'])).total_seconds()
         else:
             total_duration = 0
-        response = {
-            "status": "success",
-            "command_uid": command_uid,
-            "instance_id": instance_id,
-            "message": "Video recording paused successfully",
-            "data": {
-                "total_duration": total_duration,
-                "datetime": datetime.datetime.now().isoformat()
-            }
-        }
+        response = success_response(instance_id, command_uid, "Video recording paused successfully", {
+            "total_duration": total_duration,
+            "datetime": datetime.datetime.now().isoformat()
+        })
     except Exception as e:
         logging.error(f"Failed to pause recording: {e}")
-        response = {
-            "status": "error",
-            "command_uid": command_uid,
-            "instance_id": instance_id,
-            "message": f"Failed to pause recording: {e}"
-        }
+        response = error_response(instance_id, command_uid, f"Failed to pause recording: {e}")
     return response
 
-async def handle_resume_recording(instance_id, command_uid):
-    if obs_client is None:
-        return {
-            "status": "error",
-            "command_uid": command_uid,
-            "instance_id": instance_id,
-            "message": "Not connected to OBS Studio"
-        }
+async def handle_resume_recording(instance_id, command_uid, parameters):
+    target = connected_target(instance_id, parameters)
+    if target is None:
+        return error_response(instance_id, command_uid, "Not connected to OBS Studio")
     try:
-        loop = asyncio.get_event_loop()
-        record_status = await loop.run_in_executor(executor, obs_client.get_record_status)
-        if not record_status.output_active:
-            return {
-                "status": "error",
-                "command_uid": command_uid,
-                "instance_id": instance_id,
-                "message": "No active recording session to resume"
-            }
-        if not record_status.output_paused:
-            return {
-                "status": "error",
-                "command_uid": command_uid,
-                "instance_id": instance_id,
-                "message": "Video recording is currently not in pause state"
-            }
-        await loop.run_in_executor(executor, obs_client.resume_record)
-        response = {
-            "status": "success",
-            "command_uid": command_uid,
-            "instance_id": instance_id,
-            "message": "Video recording session resumed successfully",
-            "data": {
-                "datetime": datetime.datetime.now().isoformat()
-            }
-        }
+        error = await checked_record_action(target, 'ResumeRecord', resume_precondition)
+        if error:
+            return error_response(instance_id, command_uid, error)
+        target.state.update(record_paused=False)
+        response = success_response(instance_id, command_uid, "Video recording session resumed successfully", {
+            "datetime": datetime.datetime.now().isoformat()
+        })
     except Exception as e:
         logging.error(f"Failed to resume recording: {e}")
-        response = {
-            "status": "error",
-            "command_uid": command_uid,
-            "instance_id": instance_id,
-            "message": f"Failed to resume recording: {e}"
-        }
+        response = error_response(instance_id, command_uid, f"Failed to resume recording: {e}")
     return response
 
-async def handle_save_image_snapshot(instance_id, command_uid):
-    global obs_client  # Ensure obs_client is accessible
-    if obs_client is None:
-        return {
-            'status': 'error',
-            'command_uid': command_uid,
-            'instance_id': instance_id,
-            'message': 'Not connected to OBS Studio'
-        }
+async def handle_batch(instance_id, command_uid, parameters):
+    target = connected_target(instance_id, parameters)
+    if target is None:
+        return error_response(instance_id, command_uid, "Not connected to OBS Studio")
+    # Each item is either a service command ({"command": "START_RECORDING"}) or a
+    # raw OBS request ({"request_type": "GetStats", "request_data": {...}})
+    items = parameters.get('commands', [])
+    execution_type = parameters.get('execution_type', 'SERIAL_REALTIME')
+    if not items:
+        return error_response(instance_id, command_uid, "BATCH requires a non-empty 'commands' list")
+    if execution_type not in BATCH_EXECUTION_TYPES:
+        return error_response(instance_id, command_uid, f"Unknown execution_type: {execution_type}")
+    # Malformed items get an error of their own in the results; the rest go to OBS
+    halt_on_failure = bool(parameters.get('halt_on_failure', False))
+    requests = []
+    item_errors = {}  # item index -> error message
+    for index, item in enumerate(items):
+        error = batch_item_error(item)
+        if error is not None:
+            item_errors[index] = error
+            if halt_on_failure:
+                break
+            continue
+        if 'command' in item:
+            request = {'requestType': BATCH_COMMAND_REQUESTS[item['command']]}
+        else:
+            request = {'requestType': item['request_type']}
+        if item.get('request_data'):
+            request['requestData'] = item['request_data']
+        requests.append(request)
     try:
-        # Connect to OBS if not already connected
-        if not obs_client.is_connected:
-            await obs_client.connect()
-
-        # Get the current program scene
-        resp = await obs_client.call('GetCurrentProgramScene')
-        scene_name = resp.current_program_scene_name
-
-        # Ensure the snapshot directory exists
-        if not os.path.exists(SNAPSHOT_DIR):
-            os.makedirs(SNAPSHOT_DIR)
-
-        # Define the file path where the image will be saved
-        filename = datetime.datetime.now().strftime('%Y%m%d%H%M%S') + '.png'
-        filepath = os.path.abspath(os.path.join(SNAPSHOT_DIR, filename))
-
-        # Prepare the request parameters
-        request_data = {
-            'sourceName': scene_name,
-            'imageFormat': 'png',
-            'imageWidth': 1920,
-            'imageHeight': 1080,
-            'imageCompressionQuality': 100
-        }
-
-        # Get the screenshot
-        screenshot_resp = await obs_client.call('GetSourceScreenshot', request_data)
-
-        # Access the base64 image data
-        img_data_base64 = screenshot_resp.image_data
+        results = []
+        if requests:
+            results = await target.call_batch(
+                requests,
+                execution_type=BATCH_EXECUTION_TYPES[execution_type],
+                halt_on_failure=halt_on_failure,
+            )
+        processed = iter(results)
+        item_results = []
+        for index in range(len(items)):
+            if index in item_errors:
+                item_results.append({
+                    "request_type": None,
+                    "status": "error",
+                    "code": None,
+                    "message": item_errors[index],
+                    "data": {}
+                })
+                if halt_on_failure:
+                    break
+                continue
+            result = next(processed, None)
+            if result is None:
+                break  # OBS halted the batch
+            item_results.append({
+                "request_type": result.get('requestType'),
+                "status": "success" if result['requestStatus']['result'] else "error",
+                "code": result['requestStatus']['code'],
+                "message": result['requestStatus'].get('comment', ''),
+                "data": result.get('responseData', {})
+            })
+        response = success_response(instance_id, command_uid, f"Batch of {len(items)} requests executed, {len(item_results)} processed", {
+            "results": item_results,
+            "datetime": datetime.datetime.now().isoformat()
+        })
+    except Exception as e:
+        logging.error(f"Failed to execute batch: {e}")
+        response = error_response(instance_id, command_uid, f"Failed to execute batch: {e}")
+    return response
 
-        if not img_data_base64:
-            raise Exception('No image data received from OBS.')
+def batch_item_error(item):
+    # Why a BATCH item cannot be sent to OBS, None if it can
+    if not isinstance(item, dict):
+        return "Batch item must be an object"
+    if 'command' in item:
+        if not isinstance(item['command'], str) or item['command'] not in BATCH_COMMAND_REQUESTS:
+            return f"Command not allowed in BATCH: {item['command']}"
+    elif not isinstance(item.get('request_type'), str) or not item['request_type']:
+        return "Batch item needs a 'command' or a 'request_type'"
+    if item.get('request_data') is not None and not isinstance(item['request_data'], dict):
+        return "Batch item 'request_data' must be an object"
+    return None
 
-        # Decode the base64 image data
-        img_data = base64.b64decode(img_data_base64)
+async def handle_save_image_snapshot(instance_id, command_uid, parameters):
+    target = connected_target(instance_id, parameters)
+    if target is None:
+        return error_response(instance_id, command_uid, 'Not connected to OBS Studio')
+    mode = parameters.get('mode', MODE_TRANSFER)
+    if mode not in SNAPSHOT_MODES:
+        return error_response(instance_id, command_uid, f'Unknown snapshot mode: {mode}')
+    try:
+        # Current program scene comes from the state mirror
+        scene_name = parameters.get('source_name') or await target.state.get_current_program_scene()
 
-        # Save the image to a file
-        with open(filepath, 'wb') as f:
-            f.write(img_data)
+        # 'transfer' pulls the image over the websocket and writes it here,
+        # 'obs_save' lets OBS write the file directly
+        snapshot = await snapshot_engine.capture(
+            target,
+            scene_name,
+            image_format=parameters.get('image_format', 'png'),
+            width=parameters.get('width', 1920),
+            height=parameters.get('height', 1080),
+            quality=parameters.get('quality', 100),
+            mode=mode,
+        )
 
-        response = {
-            'status': 'success',
-            'command_uid': command_uid,
-            'instance_id': instance_id,
-            'message': 'Image snapshot saved successfully',
-            'data': {
-                'file_path': filepath,
-                'datetime': datetime.datetime.now().isoformat()
-            }
-        }
+        artifact = artifacts.add('snapshot', target.name, instance_id, snapshot['file_path'],
+                                 snapshot['size'] if snapshot['size'] is not None else file_size(snapshot['file_path']))
+        response = success_response(instance_id, command_uid, 'Image snapshot saved successfully', {
+            'artifact_id': artifact['id'],
+            'file_path': snapshot['file_path'],
+            'url': file_server.url_for(snapshot['file_path']),
+            'size': snapshot['size'],
+            'timings': snapshot['timings'],
+            'datetime': datetime.datetime.now().isoformat()
+        })
     except Exception as e:
         logging.error(f'Failed to save image snapshot: {e}')
         logging.error(traceback.format_exc())
-        response = {
-            'status': 'error',
-            'command_uid': command_uid,
-            'instance_id': instance_id,
-            'message': f'Failed to save image snapshot: {e}'
-        }
-    finally:
-        # Disconnect from OBS if needed
-        if obs_client.is_connected:
-            await obs_client.disconnect()
+        response = error_response(instance_id, command_uid, f'Failed to save image snapshot: {e}')
     return response
 
-def test_save_image_snapshot():
-    obs_client = obs.ReqClient(host='localhost', port=4455, password='')
-    obs_client = obs.Client(host='localhost', port=4455, password='')
+async def handle_subscribe(instance_id, command_uid, parameters):
+    try:
+        mask = parse_event_subscriptions(parameters.get('event_subscriptions', ['All']))
+    except (TypeError, ValueError) as e:
+        return error_response(instance_id, command_uid, f'Invalid event_subscriptions: {e}')
+    target = client_target(instance_id, parameters)
+    if target is None:
+        return error_response(instance_id, command_uid, 'Not bound to an OBS target')
+    target.broadcaster.subscribe(instance_id, clients[instance_id]['websocket'], mask, clients[instance_id]['serializer'])
+    # Firings of rules other clients own are only sent on request
+    if parameters.get('rules'):
+        rule_subscribers.setdefault(target.name, set()).add(instance_id)
+    else:
+        rule_subscribers.get(target.name, set()).discard(instance_id)
+    # High volume events are only sent by OBS when explicitly subscribed to
+    if mask & ~target.event_subscriptions:
+        await target.reidentify(target.event_subscriptions | mask)
+    return success_response(instance_id, command_uid, 'Subscribed to OBS events', {
+        'target': target.name,
+        'event_subscriptions': mask,
+        'rules': bool(parameters.get('rules')),
+        'datetime': datetime.datetime.now().isoformat()
+    })
 
-    # Get the current program scene
-    resp = obs_client.call('GetCurrentProgramScene')
-    scene_name = resp['currentProgramSceneName']
+async def handle_unsubscribe(instance_id, command_uid, parameters):
+    # Without a target this drops the subscriptions on every target
+    name = parameters.get('target')
+    for target in targets:
+        if name is None or target.name == name:
+            target.broadcaster.unsubscribe(instance_id)
+            rule_subscribers.get(target.name, set()).discard(instance_id)
+    return success_response(instance_id, command_uid, 'Unsubscribed from OBS events', {
+        'datetime': datetime.datetime.now().isoformat()
+    })
 
-    # Prepare the request data
-    request_data = {
-        'sourceName': scene_name,
-        'imageFormat': 'png',
-        'imageCompressionQuality': 100
-    }
+async def handle_get_snapshot(instance_id, command_uid, parameters):
+    # Returns the image inline as a data URI; identical requests within the
+    # cache TTL are served from memory
+    target = connected_target(instance_id, parameters)
+    if target is None:
+        return error_response(instance_id, command_uid, 'Not connected to OBS Studio')
+    try:
+        scene_name = parameters.get('source_name') or await target.state.get_current_program_scene()
+        image_data, cache_hit = await target.snapshot_cache.get_image(
+            target,
+            scene_name,
+            image_format=parameters.get('image_format', 'png'),
+            width=int(parameters.get('width', BASE_WIDTH)),
+            height=int(parameters.get('height', BASE_HEIGHT)),
+            quality=int(parameters.get('quality', -1)),
+        )
+        response = success_response(instance_id, command_uid, 'Image snapshot captured successfully', {
+            'source_name': scene_name,
+            'image_data': image_data,
+            'cache_hit': cache_hit,
+            'datetime': datetime.datetime.now().isoformat()
+        })
+    except Exception as e:
+        logging.error(f'Failed to get image snapshot: {e}')
+        response = error_response(instance_id, command_uid, f'Failed to get image snapshot: {e}')
+    return response
 
-    # Send the request
-    resp = obs_client.call('GetSourceScreenshot', request_data)
+async def handle_start_snapshot_burst(instance_id, command_uid, parameters):
+    target = connected_target(instance_id, parameters)
+    if target is None:
+        return error_response(instance_id, command_uid, 'Not connected to OBS Studio')
+    try:
+        # Either interval (seconds) or fps, and either count or duration (seconds)
+        interval = float(parameters['interval']) if 'interval' in parameters else 1.0 / float(parameters.get('fps', 1))
+        count = int(parameters['count']) if 'count' in parameters else round(float(parameters.get('duration', 1)) / interval)
+        max_in_flight = int(parameters.get('max_in_flight', 2))
+        mode = parameters.get('mode', MODE_TRANSFER)
+    except (ValueError, ZeroDivisionError) as e:
+        return error_response(instance_id, command_uid, f'Invalid burst parameters: {e}')
+    if interval <= 0 or not 0 < count <= BURST_MAX_FRAMES or not 0 < max_in_flight <= BURST_MAX_IN_FLIGHT or mode not in SNAPSHOT_MODES:
+        return error_response(instance_id, command_uid, f'Invalid burst parameters: interval must be positive, count 1-{BURST_MAX_FRAMES}, '
+                   f'max_in_flight 1-{BURST_MAX_IN_FLIGHT}, mode one of {", ".join(SNAPSHOT_MODES)}')
+    try:
+        scene_name = parameters.get('source_name') or await target.state.get_current_program_scene()
+    except Exception as e:
+        logging.error(f'Failed to start snapshot burst: {e}')
+        return error_response(instance_id, command_uid, f'Failed to start snapshot burst: {e}')
 
-    # Check for errors
-    if 'status' in resp and resp['status'] != 'ok':
-        print(f"Failed to save snapshot: {resp.get('error', 'Unknown error')}")
-        return
+    # Frames are streamed back as they land, tagged with the START command_uid
+    async def on_frame(burst, frame, snapshot):
+        artifacts.add('snapshot', target.name, instance_id, snapshot['file_path'], snapshot['size'], burst_id=burst.burst_id)
+        await send_to_client(instance_id, success_response(instance_id, command_uid, 'Snapshot burst frame saved', {
+            'burst_id': burst.burst_id,
+            'frame': frame,
+            'file_path': snapshot['file_path'],
+            'timings': snapshot['timings'],
+            'datetime': datetime.datetime.now().isoformat()
+        }))
 
-    # Get the base64 image data
-    img_data_base64 = resp.get('imageData')
+    async def on_finished(burst):
+        client = clients.get(instance_id)
+        if client:
+            client['bursts'].pop(burst.burst_id, None)
+        await send_to_client(instance_id, success_response(instance_id, command_uid, 'Snapshot burst finished', {**burst.summary(), 'datetime': datetime.datetime.now().isoformat()}))
 
-    if not img_data_base64:
-        print("No image data received from OBS.")
-        return
+    burst = SnapshotBurst(
+        snapshot_engine,
+        target,
+        scene_name,
+        interval,
+        count,
+        max_in_flight=max_in_flight,
+        on_frame=on_frame,
+        on_finished=on_finished,
+        image_format=parameters.get('image_format', 'png'),
+        width=parameters.get('width', 1920),
+        height=parameters.get('height', 1080),
+        quality=parameters.get('quality', 100),
+        mode=mode,
+    )
+    client = clients.get(instance_id)
+    if client:  # Not for a rule whose client is gone; such a burst runs to its count
+        client['bursts'][burst.burst_id] = burst
+    burst.start()
+    return success_response(instance_id, command_uid, 'Snapshot burst started', {
+        'burst_id': burst.burst_id,
+        'interval': interval,
+        'count': count,
+        'datetime': datetime.datetime.now().isoformat()
+    })
 
-    # Decode the base64 image data
-    img_data = base64.b64decode(img_data_base64)
+async def handle_stop_snapshot_burst(instance_id, command_uid, parameters):
+    burst_id = parameters.get('burst_id')
+    burst = clients[instance_id]['bursts'].get(burst_id)
+    if burst is None:
+        return error_response(instance_id, command_uid, f'No running snapshot burst with id {burst_id}')
+    burst.stop()
+    return success_response(instance_id, command_uid, 'Snapshot burst stopped', {**burst.summary(), 'datetime': datetime.datetime.now().isoformat()})
 
-    # Define the file path
-    filepath = os.path.abspath('test_snapshot.png')
+async def handle_broadcast(instance_id, command_uid, parameters):
+    # Runs one command on several targets concurrently and aggregates the
+    # per-target responses; defaults to every configured target
+    command = parameters['command']
+    if command in BROADCAST_EXCLUDED_COMMANDS:
+        return error_response(instance_id, command_uid, f"Command not allowed in BROADCAST: {command}")
+    names = parameters.get('targets') or [target.name for target in targets if target.configured]
+    sub_parameters = parameters.get('parameter', {})
 
-    # Save the image to a file
-    with open(filepath, 'wb') as f:
-        f.write(img_data)
+    async def run(name):
+        try:
+            return await commands.dispatch(command, {**sub_parameters, 'target': name}, instance_id, command_uid)
+        except CommandError as e:
+            return error_response(instance_id, command_uid, str(e))
+        except Exception as e:
+            logging.error(f"Broadcast of {command} to {name} failed: {e}")
+            return error_response(instance_id, command_uid, f"Error processing command: {e}")
 
-    print(f"Snapshot saved successfully at {filepath}")
+    results = await asyncio.gather(*(run(name) for name in names))
+    failed = [name for name, result in zip(names, results) if result.get('status') == 'error']
+    return success_response(instance_id, command_uid, f"{command} broadcast to {len(names)} targets, {len(failed)} failed", {
+        "results": {name: result for name, result in zip(names, results)},
+        "failed": failed,
+        "datetime": datetime.datetime.now().isoformat()
+    })
 
-async def handle_start_replay_buffer(instance_id, command_uid):
-    if obs_client is None:
-        return {
-            "status": "error",
-            "command_uid": command_uid,
-            "instance_id": instance_id,
-            "message": "Not connected to OBS Studio"
-        }
+async def handle_list_targets(instance_id, command_uid, parameters):
+    return success_response(instance_id, command_uid, "OBS targets", {
+        "bound_target": clients.get(instance_id, {}).get('target'),
+        "targets": [target.describe() for target in targets],
+        "datetime": datetime.datetime.now().isoformat()
+    })
+
+async def handle_list_artifacts(instance_id, command_uid, parameters):
+    # Served from the index, newest first; pass next_cursor back as cursor
+    kind = parameters.get('kind')
+    if kind is not None and kind not in ARTIFACT_KINDS:
+        return error_response(instance_id, command_uid, f"Unknown artifact kind: {kind}, expected one of {', '.join(ARTIFACT_KINDS)}")
+    limit = parameters.get('limit', ARTIFACT_PAGE_SIZE)
+    if not 0 < limit <= ARTIFACT_MAX_PAGE_SIZE:
+        return error_response(instance_id, command_uid, f"limit must be between 1 and {ARTIFACT_MAX_PAGE_SIZE}")
+    items, next_cursor = artifacts.page(
+        kind=kind,
+        target=parameters.get('target'),
+        instance_id=parameters.get('instance_id'),
+        cursor=parameters.get('cursor'),
+        limit=limit,
+    )
+    return success_response(instance_id, command_uid, "Artifacts", {
+        "artifacts": [{**item, "url": file_server.url_for(item['file_path'])} for item in items],
+        "next_cursor": next_cursor,
+        "datetime": datetime.datetime.now().isoformat()
+    })
+
+async def handle_get_health(instance_id, command_uid, parameters):
+    # Rolling encoder and recording health from the background sampler;
+    # history=true adds the raw samples
+    target = client_target(instance_id, parameters)
+    if target is None:
+        return error_response(instance_id, command_uid, "No OBS target")
+    if not target.health.interval:
+        return error_response(instance_id, command_uid, "Health sampling is disabled")
+    return success_response(instance_id, command_uid, "Health", {
+        "target": target.name,
+        "connected": target.is_connected,
+        **target.health.report(history=parameters.get('history', False)),
+        "thresholds": target.health.thresholds,
+        "datetime": datetime.datetime.now().isoformat()
+    })
+
+async def handle_get_command_stats(instance_id, command_uid, parameters):
+    return success_response(instance_id, command_uid, "Command statistics", {
+        "commands": commands.stats(),
+        "datetime": datetime.datetime.now().isoformat()
+    })
+
+async def handle_start_replay_buffer(instance_id, command_uid, parameters):
+    target = connected_target(instance_id, parameters)
+    if target is None:
+        return error_response(instance_id, command_uid, "Not connected to OBS Studio")
     try:
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(executor, obs_client.start_replay_buffer)
-        clients[instance_id]['state']['replay_buffer_start_time'] = datetime.datetime.now()
-        response = {
-            "status": "success",
-            "command_uid": command_uid,
-            "instance_id": instance_id,
-            "message": "Video recording replay buffer started successfully",
-            "data": {
-                "current_duration": 0,
-                "datetime": datetime.datetime.now().isoformat()
-            }
-        }
+        await target.call('StartReplayBuffer')
+        target.state.update(replay_buffer_active=True)
+        target_state(instance_id, target)['replay_buffer_start_time'] = datetime.datetime.now()
+        response = success_response(instance_id, command_uid, "Video recording replay buffer started successfully", {
+            "current_duration": 0,
+            "datetime": datetime.datetime.now().isoformat()
+        })
     except Exception as e:
         logging.error(f"Failed to start replay buffer: {e}")
-        response = {
-            "status": "error",
-            "command_uid": command_uid,
-            "instance_id": instance_id,
-            "message": f"Failed to start replay buffer: {e}"
-        }
+        response = error_response(instance_id, command_uid, f"Failed to start replay buffer: {e}")
     return response
 
-async def handle_stop_replay_buffer(instance_id, command_uid):
-    if obs_client is None:
-        return {
-            "status": "error",
-            "command_uid": command_uid,
-            "instance_id": instance_id,
-            "message": "Not connected to OBS Studio"
-        }
+async def handle_stop_replay_buffer(instance_id, command_uid, parameters):
+    target = connected_target(instance_id, parameters)
+    if target is None:
+        return error_response(instance_id, command_uid, "Not connected to OBS Studio")
     try:
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(executor, obs_client.stop_replay_buffer)
-        start_time = clients[instance_id]['state'].get('replay_buffer_start_time')
+        await target.call('StopReplayBuffer')
+        target.state.update(replay_buffer_active=False)
+        start_time = target_state(instance_id, target).get('replay_buffer_start_time')
         if start_time:
             current_duration = (datetime.datetime.now() - start_time).total_seconds()
-            clients[instance_id]['state'].pop('replay_buffer_start_time', None)
+            target_state(instance_id, target).pop('replay_buffer_start_time', None)
         else:
             current_duration = 0
-        response = {
-            "status": "success",
-            "command_uid": command_uid,
-            "instance_id": instance_id,
-            "message": "Video recording replay buffer stopped successfully",
-            "data": {
-                "current_duration": current_duration,
-                "datetime": datetime.datetime.now().isoformat()
-            }
-        }
+        response = success_response(instance_id, command_uid, "Video recording replay buffer stopped successfully", {
+            "current_duration": current_duration,
+            "datetime": datetime.datetime.now().isoformat()
+        })
     except Exception as e:
         logging.error(f"Failed to stop replay buffer: {e}")
-        response = {
-            "status": "error",
-            "command_uid": command_uid,
-            "instance_id": instance_id,
-            "message": f"Failed to stop replay buffer: {e}"
-        }
+        response = error_response(instance_id, command_uid, f"Failed to stop replay buffer: {e}")
     return response
 
-async def handle_save_replay_buffer(instance_id, command_uid):
-    if obs_client is None:
-        return {
-            "status": "error",
-            "command_uid": command_uid,
-            "instance_id": instance_id,
-            "message": "Not connected to OBS Studio"
-        }
+async def handle_save_replay_buffer(instance_id, command_uid, parameters):
+    target = connected_target(instance_id, parameters)
+    if target is None:
+        return error_response(instance_id, command_uid, "Not connected to OBS Studio")
     try:
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(executor, obs_client.save_replay_buffer)
-        # There is no direct way to get the file path or duration
-        # after saving the replay buffer in OBS WebSockets
-        # So we'll return placeholders or estimations
-        current_duration = 0  # You might need to calculate this based on your settings
-        file_path = ""  # OBS does not provide the saved file path
-        response = {
-            "status": "success",
-            "command_uid": command_uid,
-            "instance_id": instance_id,
-            "message": "Video recording replay buffer saved successfully",
-            "data": {
-                "file_path": file_path,
-                "current_duration": current_duration,
-                "datetime": datetime.datetime.now().isoformat()
-            }
-        }
+        file_path, current_duration = await target.replay_saver.save()
+        artifact = artifacts.add('replay', target.name, instance_id, file_path, file_size(file_path), duration=current_duration)
+        # Progress of the move into clips/ and the clip stages follows as separate messages
+        job = clip_pipeline.claim(file_path, instance_id, command_uid, artifact['id'])
+        file_path = await clip_pipeline.wait_moved(file_path)
+        response = success_response(instance_id, command_uid, "Video recording replay buffer saved successfully", {
+            "artifact_id": artifact['id'],
+            "clip_job_id": job.job_id if job else None,
+            "file_path": file_path,
+            "url": file_server.url_for(file_path),
+            "current_duration": current_duration,
+            "datetime": datetime.datetime.now().isoformat()
+        })
     except Exception as e:
         logging.error(f"Failed to save replay buffer: {e}")
-        response = {
-            "status": "error",
-            "command_uid": command_uid,
-            "instance_id": instance_id,
-            "message": f"Failed to save replay buffer: {e}"
-        }
+        response = error_response(instance_id, command_uid, f"Failed to save replay buffer: {e}")
     return response
 
-async def start_server():
-    connect_to_obs()  # Connect to OBS Studio before starting the server
-    port = DEFAULT_WEBSOCKET_PORT
-    started = False
-    while not started:
+def parse_wall_clock(value):
+    # ISO 8601 (local time unless it has an offset) or Unix seconds -> Unix seconds
+    if isinstance(value, str):
+        return datetime.datetime.fromisoformat(value).timestamp()
+    return float(value)
+
+async def run_rule(rule, lateness):
+    # One firing: the rule's commands run in order as if its owner had sent them
+    instance_id = rule.owner
+    results = []
+    for step in rule.steps:
+        try:
+            result = await commands.dispatch(step['command'], {**step.get('parameter', {}), 'target': rule.target}, instance_id, rule.command_uid)
+        except CommandError as e:
+            result = error_response(instance_id, rule.command_uid, str(e))
+        except Exception as e:
+            logging.error(f"Rule {rule.rule_id} step {step['command']} failed: {e}")
+            result = error_response(instance_id, rule.command_uid, f"Error processing command: {e}")
+        results.append(result)
+        if result.get('status') == 'error':
+            break
+    succeeded = all(result.get('status') != 'error' for result in results)
+    message = success_response(instance_id, rule.command_uid, f"Rule {rule.rule_id} fired", {
+        "rule_id": rule.rule_id,
+        "results": results,
+        "succeeded": succeeded,
+        "lateness": lateness,
+        "remaining": rule.remaining,
+        "datetime": datetime.datetime.now().isoformat()
+    })
+    # Reported to the rule's owner if still connected and to the clients that
+    # subscribed to the target's rule firings
+    recipients = {instance_id, *rule_subscribers.get(rule.target, ())}
+    await asyncio.gather(*(send_to_client(recipient, message) for recipient in recipients))
+    return succeeded
+
+async def handle_add_rule(instance_id, command_uid, parameters):
+    # Runs `command` (or the `commands` list, in order) on the server: at a
+    # wall-clock time `at` or after `delay` seconds, optionally repeating
+    # `every` seconds up to `count` times, or whenever OBS sends `event_type`
+    # with `event_data` among its fields. Firings are reported under this command_uid.
+    # A rule keeps running after this client disconnects; only rules on a target
+    # created on the fly by CONNECT_WEBSOCKET end with it, when its last client
+    # leaves. Its owner is this connection or whoever presents `owner_key` (given,
+    # or generated and returned here): only the owner may remove it, and LIST_RULES
+    # with the key hands the rules' firings to a reconnected client. Other clients
+    # see its firings only after SUBSCRIBE with 'rules': true
+    target = client_target(instance_id, parameters)
+    if target is None:
+        return error_response(instance_id, command_uid, "No OBS target to attach the rule to")
+    steps = parameters.get('commands') or ([{'command': parameters['command'], 'parameter': parameters.get('parameter', {})}]
+                                           if 'command' in parameters else [])
+    if not steps:
+        return error_response(instance_id, command_uid, "ADD_RULE requires 'command' or a non-empty 'commands' list")
+    for step in steps:
+        if not isinstance(step, dict) or not isinstance(step.get('parameter', {}), dict):
+            return error_response(instance_id, command_uid, "Each rule step must be an object with 'command' and optional 'parameter'")
+        if step.get('command') not in commands.commands or step['command'] in RULE_EXCLUDED_COMMANDS:
+            return error_response(instance_id, command_uid, f"Command not allowed in a rule: {step.get('command')}")
+    if len(rule_engine.on_target(target.name)) >= RULES_MAX_PER_TARGET:
+        return error_response(instance_id, command_uid, f"At most {RULES_MAX_PER_TARGET} rules per OBS target")
+    event_type = parameters.get('event_type')
+    every = parameters.get('every')
+    count = parameters.get('count')
+    if event_type and any(name in parameters for name in ('at', 'delay', 'every')):
+        return error_response(instance_id, command_uid, "A rule is triggered either by an event or by time, not both")
+    if not event_type and not any(name in parameters for name in ('at', 'delay', 'every')):
+        return error_response(instance_id, command_uid, "ADD_RULE requires one of 'at', 'delay', 'every' or 'event_type'")
+    if every is not None and every < RULE_MIN_INTERVAL:
+        return error_response(instance_id, command_uid, f"every must be at least {RULE_MIN_INTERVAL} seconds")
+    if count is not None and count < 1:
+        return error_response(instance_id, command_uid, "count must be positive")
+    owner_key = parameters.get('owner_key') or uuid.uuid4().hex
+    now = asyncio.get_running_loop().time()
+    at = None
+    if not event_type:
         try:
-            async with websockets.serve(
-                handle_client, "0.0.0.0", port, origins=None
-            ):
-                logging.info(f"WebSocket server started on port {port}")
-                await asyncio.Future()  # Run forever
-                started = True
-        except OSError:
+            if 'at' in parameters:
+                at = now + parse_wall_clock(parameters['at']) - time.time()
+            else:
+                at = now + parameters.get('delay', every)
+        except (ValueError, TypeError) as e:
+            return error_response(instance_id, command_uid, f"Invalid rule time: {e}")
+        if at < now:
+            return error_response(instance_id, command_uid, "Rule time is in the past")
+    rule = rule_engine.add(Rule(
+        instance_id,
+        command_uid,
+        target.name,
+        steps,
+        at=at,
+        every=every,
+        count=count,
+        event_type=event_type,
+        event_data=parameters.get('event_data'),
+        cooldown=parameters.get('cooldown', 0.0),
+        owner_key=owner_key,
+    ))
+    return success_response(instance_id, command_uid, "Rule added", {
+        **rule.describe(now),
+        "owner_key": owner_key,
+        "datetime": datetime.datetime.now().isoformat()
+    })
+
+async def handle_remove_rule(instance_id, command_uid, parameters):
+    rule = rule_engine.rules.get(parameters['rule_id'])
+    if rule is None:
+        return error_response(instance_id, command_uid, f"No rule with id {parameters['rule_id']}")
+    if not rule.is_owned_by(instance_id, parameters.get('owner_key')):
+        return error_response(instance_id, command_uid, f"Rule {rule.rule_id} belongs to another client")
+    rule_engine.remove(rule.rule_id)
+    return success_response(instance_id, command_uid, "Rule removed", {
+        **rule.describe(asyncio.get_running_loop().time()),
+        "datetime": datetime.datetime.now().isoformat()
+    })
+
+async def handle_list_rules(instance_id, command_uid, parameters):
+    # Rules of the named or bound target, of every target when there is neither.
+    # With owner_key only the rules owned through it, which this client now owns
+    now = asyncio.get_running_loop().time()
+    if parameters.get('owner_key'):
+        rules = rule_engine.owned_by_key(parameters['owner_key'])
+        for rule in rules:
+            rule.owner = instance_id
+    else:
+        target = client_target(instance_id, parameters)
+        rules = rule_engine.on_target(target.name) if target is not None else list(rule_engine.rules.values())
+    return success_response(instance_id, command_uid, "Rules", {
+        "rules": [rule.describe(now) for rule in rules],
+        "datetime": datetime.datetime.now().isoformat()
+    })
+
+rule_engine = RuleEngine(run_rule, resolution=RULE_TIMER_RESOLUTION, wheel_size=RULE_TIMER_SLOTS)
+targets.event_handlers.append(rule_engine.on_event)
+
+async def release_target(target):
+    # A target created on the fly is closed with its last client, and its rules end with it
+    await targets.release_if_unused(target)
+    if targets.get(target.name) is not target:
+        rule_engine.remove_target(target.name)
+
+# Command table: name -> handler(instance_id, command_uid, parameters) and parameter schema
+commands = CommandRegistry(is_error=lambda response: response.get('status') == 'error')
+commands.register('CONNECT_WEBSOCKET', handle_connect_websocket, {'target': str, 'ip_address': str, 'port': int, 'password': str}, ordering_key='connection')
+commands.register('DISCONNECT_WEBSOCKET', handle_disconnect_websocket, ordering_key='connection')
+commands.register('START_RECORDING', handle_start_recording, {'target': str}, ordering_key='record')
+commands.register('STOP_RECORDING', handle_stop_recording, {'target': str}, ordering_key='record')
+commands.register('PAUSE_RECORDING', handle_pause_recording, {'target': str}, ordering_key='record')
+commands.register('RESUME_RECORDING', handle_resume_recording, {'target': str}, ordering_key='record')
+commands.register('GET_RECORD_STATUS', handle_get_record_status, {'target': str}, rate_limit=(10.0, 20), sheddable=True)
+commands.register('SAVE_IMAGE_SNAPSHOT', handle_save_image_snapshot, {
+    'target': str, 'mode': str, 'source_name': str, 'image_format': str, 'width': int, 'height': int, 'quality': int,
+}, rate_limit=(5.0, 10), sheddable=True)
+commands.register('GET_SNAPSHOT', handle_get_snapshot, {
+    'target': str, 'source_name': str, 'image_format': str, 'width': int, 'height': int, 'quality': int,
+}, rate_limit=(30.0, 30), sheddable=True)
+commands.register('START_SNAPSHOT_BURST', handle_start_snapshot_burst, {
+    'target': str, 'interval': float, 'fps': float, 'count': int, 'duration': float, 'max_in_flight': int, 'mode': str,
+    'source_name': str, 'image_format': str, 'width': int, 'height': int, 'quality': int,
+}, rate_limit=(1.0, 2), sheddable=True)
+commands.register('STOP_SNAPSHOT_BURST', handle_stop_snapshot_burst, {'burst_id': str}, required=('burst_id',))
+commands.register('SUBSCRIBE', handle_subscribe, {'target': str, 'event_subscriptions': (int, list), 'rules': bool})
+commands.register('UNSUBSCRIBE', handle_unsubscribe, {'target': str})
+commands.register('START_REPLAY_BUFFER', handle_start_replay_buffer, {'target': str}, ordering_key='replay_buffer')
+commands.register('STOP_REPLAY_BUFFER', handle_stop_replay_buffer, {'target': str}, ordering_key='replay_buffer')
+commands.register('SAVE_REPLAY_BUFFER', handle_save_replay_buffer, {'target': str})
+commands.register('BATCH', handle_batch, {
+    'target': str, 'commands': list, 'execution_type': str, 'halt_on_failure': bool,
+}, required=('commands',), rate_limit=(10.0, 20), sheddable=True)
+commands.register('BROADCAST', handle_broadcast, {
+    'command': str, 'parameter': dict, 'targets': list,
+}, required=('command',), rate_limit=(5.0, 10))
+commands.register('LIST_TARGETS', handle_list_targets)
+commands.register('LIST_ARTIFACTS', handle_list_artifacts, {
+    'kind': str, 'target': str, 'instance_id': str, 'cursor': int, 'limit': int,
+}, rate_limit=(10.0, 20))
+commands.register('ADD_RULE', handle_add_rule, {
+    'target': str, 'command': str, 'parameter': dict, 'commands': list, 'at': (str, float), 'delay': float,
+    'every': float, 'count': int, 'event_type': str, 'event_data': dict, 'cooldown': float, 'owner_key': str,
+})
+commands.register('REMOVE_RULE', handle_remove_rule, {'rule_id': str, 'owner_key': str}, required=('rule_id',))
+commands.register('LIST_RULES', handle_list_rules, {'target': str, 'owner_key': str})
+commands.register('GET_HEALTH', handle_get_health, {'target': str, 'history': bool}, rate_limit=(10.0, 20))
+commands.register('GET_COMMAND_STATS', handle_get_command_stats)
+commands.load_plugins(COMMAND_PLUGINS)
+
+async def on_clip_stage(job, stage, result, error):
+    if job.owner is None:
+        return
+    instance_id, command_uid, artifact_id = job.owner
+    artifact = artifacts.get(artifact_id)
+    if stage == 'move' and error is None and artifact is not None:
+        artifacts.update(artifact, file_path=job.file_path)
+    if error is not None:
+        await send_to_client(instance_id, error_response(instance_id, command_uid, f"Clip stage {stage} failed: {error}"))
+        return
+    await send_to_client(instance_id, success_response(instance_id, command_uid, f"Clip stage {stage} finished", {
+        "job_id": job.job_id,
+        "stage": stage,
+        "result": result,
+        "file_path": job.file_path,
+        "url": file_server.url_for(job.file_path),
+        "datetime": datetime.datetime.now().isoformat()
+    }))
+
+async def on_clip_finished(job):
+    if job.owner is None:
+        return
+    instance_id, command_uid, artifact_id = job.owner
+    artifact = artifacts.get(artifact_id)
+    if artifact is not None:
+        artifacts.update(artifact, processing={'results': job.results, 'errors': job.errors})
+    await send_to_client(instance_id, success_response(instance_id, command_uid, "Clip processing finished", {
+        **job.summary(),
+        "url": file_server.url_for(job.file_path),
+        "datetime": datetime.datetime.now().isoformat()
+    }))
+
+# Stages are looked up after the plugins had a chance to add theirs to obs_clips.STAGES
+clip_pipeline = ClipPipeline(
+    {name: STAGES[name] for name in CLIP_STAGES},
+    max_jobs=CLIP_MAX_JOBS,
+    max_queued=CLIP_MAX_QUEUED,
+    processes=CLIP_PROCESSES,
+    on_stage=on_clip_stage,
+    on_finished=on_clip_finished,
+    executor=executor,
+)
+
+def on_target_event(target, data):
+    # Saved replays and finished recordings are handed to the clip pipeline
+    event_type = data.get('eventType')
+    event_data = data.get('eventData', {})
+    if event_type == 'ReplayBufferSaved':
+        source, directory, kind = event_data.get('savedReplayPath'), CLIPS_DIR, 'replay'
+    elif event_type == 'RecordStateChanged' and event_data.get('outputState') == OUTPUT_STOPPED:
+        source, directory, kind = event_data.get('outputPath'), VIDEO_DIR, 'recording'
+    else:
+        return
+    # Files OBS writes on another machine are left alone
+    if source and os.path.isfile(source):
+        clip_pipeline.submit(source, directory, kind, target.name)
+
+targets.event_handlers.append(on_target_event)
+
+async def on_health_alert(target, alert, raised, value, threshold):
+    # Pushed to every client bound to the target, in the shape of an OBS event
+    message = {
+        'status': 'alert',
+        'target': target.name,
+        'alert': alert,
+        'state': 'raised' if raised else 'cleared',
+        'value': value,
+        'threshold': threshold,
+        'datetime': datetime.datetime.now().isoformat()
+    }
+    await asyncio.gather(*(send_to_client(instance_id, message) for instance_id in list(target.bound_clients)))
+
+targets.alert_handlers.append(on_health_alert)
+
+listening_workers = set()  # Links of the workers that reported their client port bound
+
+def end_relayed_session(queue):
+    # Messages still queued for a gone client are dropped; None ends its message stream
+    while not queue.empty():
+        queue.get_nowait()
+    queue.put_nowait(None)
+
+async def handle_worker(reader, writer):
+    # One front-end worker: its clients are served here as if connected directly
+    link = WorkerLink(writer)
+    sessions = {}  # instance_id -> (message queue, RemoteWebSocket)
+    # The worker validates commands against these before relaying them
+    writer.write(encode_frame('schema', '-', IPC.dumps(commands.schemas())))
+    try:
+        while True:
+            op, instance_id, payload = await read_frame(reader)
+            if op == 'open':
+                queue = asyncio.Queue(maxsize=WORKER_CLIENT_MAX_QUEUED)
+                websocket = RemoteWebSocket(link, instance_id, payload.decode() or None)
+                sessions[instance_id] = (queue, websocket)
+                asyncio.get_running_loop().create_task(serve_client(instance_id, websocket, queued_messages(queue)))
+            elif op == 'message' and instance_id in sessions:
+                queue, websocket = sessions[instance_id]
+                try:
+                    queue.put_nowait(payload)
+                except asyncio.QueueFull:
+                    # The worker keeps reading its socket, so a flooding client is
+                    # dropped rather than buffered without limit or left to stall
+                    # the worker's other clients
+                    logging.warning(f"Disconnecting client {instance_id}: {WORKER_CLIENT_MAX_QUEUED} messages queued")
+                    del sessions[instance_id]
+                    end_relayed_session(queue)
+                    asyncio.get_running_loop().create_task(websocket.close(1008, 'Too many queued messages'))
+            elif op == 'closed' and instance_id in sessions:
+                queue, websocket = sessions.pop(instance_id)
+                websocket.closed = True
+                end_relayed_session(queue)
+            elif op == 'listening':
+                listening_workers.add(link)
+                readiness.listening = len(listening_workers) >= WORKERS
+                readiness.update()
+    except (EOFError, asyncio.IncompleteReadError, ConnectionError):
+        logging.warning("Front-end worker disconnected")
+    finally:
+        listening_workers.discard(link)
+        readiness.listening = len(listening_workers) >= WORKERS
+        for queue, websocket in sessions.values():
+            websocket.closed = True
+            end_relayed_session(queue)
+        writer.close()
+
+async def run_worker_process(number, ipc_path):
+    # Keeps one front-end worker running, restarting it if it dies
+    worker_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'obs_worker.py')
+    while True:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, worker_script,
+            '--port', str(DEFAULT_WEBSOCKET_PORT), '--ipc', ipc_path, '--name', f"worker-{number}",
+        )
+        returncode = await process.wait()
+        logging.warning(f"Front-end worker {number} exited with code {returncode}, restarting")
+        await asyncio.sleep(WORKER_RESTART_DELAY)
+
+async def serve_workers():
+    ipc_path = os.path.join(tempfile.gettempdir(), f"obs-service-{os.getpid()}.sock")
+    server = await asyncio.start_unix_server(handle_worker, path=ipc_path, limit=IPC_READ_LIMIT)
+    workers = [asyncio.get_running_loop().create_task(run_worker_process(n, ipc_path)) for n in range(WORKERS)]
+    # Ready once every worker reports it is listening
+    logging.info(f"Serving clients on port {DEFAULT_WEBSOCKET_PORT} through {WORKERS} front-end workers")
+    try:
+        await asyncio.Future()  # Run forever
+    finally:
+        for worker in workers:
+            worker.cancel()
+        server.close()
+        os.unlink(ipc_path)
+
+def setup_metrics():
+    registry = obs_metrics.enable()
+    registry.gauge('obs_service_clients', 'Connected service clients', lambda: len(clients))
+    # ThreadPoolExecutor has no public queue length
+    registry.gauge('obs_service_executor_queue_depth', 'Jobs waiting for an executor thread', lambda: executor._work_queue.qsize())
+    registry.gauge('obs_service_target_connected', 'Whether the OBS target session is up',
+                   lambda: {(('target', t.name),): int(t.is_connected) for t in targets})
+    registry.gauge('obs_service_target_reconnects', 'OBS sessions lost and re-established',
+                   lambda: {(('target', t.name),): t.reconnects for t in targets})
+    registry.gauge('obs_service_replay_queue_waiting', 'Requests held while the OBS target reconnects',
+                   lambda: {(('target', t.name),): len(t.replay_queue.waiters) for t in targets})
+    registry.gauge('obs_service_event_subscribers', 'Clients subscribed to OBS events',
+                   lambda: {(('target', t.name),): len(t.broadcaster.subscribers) for t in targets})
+    registry.gauge('obs_service_events_dropped', 'Events dropped for subscribers whose queue was full',
+                   lambda: {(('target', t.name),): t.broadcaster.metrics['dropped'] for t in targets})
+    registry.gauge('obs_service_snapshot_cache_bytes', 'Bytes held by the preview cache',
+                   lambda: {(('target', t.name),): t.snapshot_cache.size for t in targets})
+    registry.describe('obs_service_commands_rejected_total', 'counter', 'Commands refused by rate limits or shed under load, by command and reason')
+    registry.gauge('obs_service_obs_requests_coalesced', 'OBS requests answered by an identical request already in flight',
+                   lambda: {(('target', t.name),): t.coalescer.metrics['coalesced'] for t in targets})
+    registry.gauge('obs_service_obs_dropped_frame_rate', 'Fraction of output frames OBS skipped over the health window',
+                   lambda: health_gauge('dropped_frame_rate'))
+    registry.gauge('obs_service_obs_render_lag_rate', 'Fraction of frames the OBS renderer skipped over the health window',
+                   lambda: health_gauge('render_lag_rate'))
+    registry.gauge('obs_service_obs_disk_space_megabytes', 'Space left on the OBS recording disk', lambda: health_gauge('disk_space'))
+    registry.gauge('obs_service_obs_record_bitrate', 'Recording bitrate over the health window, bits per second',
+                   lambda: health_gauge('bitrate'))
+    registry.gauge('obs_service_rules', 'Rules registered by clients', lambda: len(rule_engine.rules))
+    registry.gauge('obs_service_rules_skipped', 'Rule firings skipped: still running, cooling down or missed',
+                   lambda: rule_engine.metrics['skipped'])
+    registry.gauge('obs_service_clip_jobs_queued', 'Saved files waiting for the clip pipeline', lambda: clip_pipeline.queue.qsize())
+    registry.gauge('obs_service_time_to_ready_seconds', 'Seconds from process start until the service was first ready',
+                   lambda: readiness.time_to_ready if readiness.time_to_ready is not None else {})
+    registry.gauge('obs_service_downloads_active', 'File downloads in progress', lambda: file_server.active)
+    registry.gauge('obs_service_downloads_rejected', 'File downloads refused by the concurrency limits',
+                   lambda: file_server.metrics['rejected'])
+
+def health_gauge(field):
+    values = {}
+    for target in targets:
+        rolling = target.health.rolling()
+        if rolling is not None and rolling[field] is not None:
+            values[(('target', target.name),)] = rolling[field]
+    return values
+
+def check_ready():
+    # Ready once every configured OBS target is connected
+    connected = {target.name: target.is_connected for target in targets if target.configured}
+    return all(connected.values()), {'targets': connected}
+
+readiness = Readiness(check_ready, STARTED)
+
+async def watch_readiness():
+    await asyncio.gather(*(target.connected.wait() for target in targets if target.configured))
+    readiness.update()
+
+async def handle_metrics(request):
+    return web.Response(body=obs_metrics.registry.render().encode(), headers={'Content-Type': obs_metrics.CONTENT_TYPE})
+
+async def start_http_server(port, metrics=False, files=False):
+    app = web.Application()
+    readiness.add_routes(app)
+    if metrics:
+        app.router.add_get('/metrics', handle_metrics)
+    if files:
+        file_server.add_routes(app)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, '0.0.0.0', port).start()
+    except OSError as e:
+        # Downloads and probes are extras; the websocket service runs without them
+        logging.error(f"HTTP server not started, port {port} unavailable: {e}")
+        await runner.cleanup()
+        if files:
+            file_server.serving = False
+        return None
+    logging.info(f"HTTP server started on port {port}")
+    return runner
+
+async def bind_websocket_server():
+    for port in range(DEFAULT_WEBSOCKET_PORT, DEFAULT_WEBSOCKET_PORT + PORT_FALLBACK_ATTEMPTS):
+        try:
+            server = await websockets.serve(handle_client, "0.0.0.0", port, origins=None, select_subprotocol=select_subprotocol)
+        except OSError as e:
+            if PORT_FALLBACK_ATTEMPTS == 1:
+                raise OSError(f"Port {port} unavailable: {e}") from None
             logging.warning(f"Port {port} unavailable, trying next port...")
-            port += 1
+            continue
+        logging.info(f"WebSocket server started on port {port}")
+        return server
+    raise OSError(f"No free port between {DEFAULT_WEBSOCKET_PORT} and {DEFAULT_WEBSOCKET_PORT + PORT_FALLBACK_ATTEMPTS - 1}")
+
+async def start_server():
+    ensure_directories()
+    artifacts.load()
+    if METRICS_PORT:
+        setup_metrics()
+    # Probes answer from here on, also while OBS is being connected
+    if HTTP_PORT:
+        await start_http_server(HTTP_PORT, metrics=METRICS_PORT == HTTP_PORT, files=True)
+    if METRICS_PORT and METRICS_PORT != HTTP_PORT:
+        await start_http_server(METRICS_PORT, metrics=True)
+    asyncio.get_running_loop().create_task(watch_readiness())
+    if STARTUP_MODE == 'lazy':
+        targets.start_all()
+    else:
+        await targets.connect_all()  # Connect to every configured OBS target before starting the server
+    if WORKERS > 1:
+        await serve_workers()
+        return
+    server = await bind_websocket_server()
+    readiness.listening = True
+    readiness.update()
+    await server.serve_forever()
 
 if __name__ == "__main__":
+    setup_logging()
     try:
         asyncio.run(start_server())
     except KeyboardInterrupt:
         logging.info("Server shutdown requested by user.")
     except Exception as e:
         logging.error(f"Unexpected error: {e}")
+        sys.exit(1)
+    finally:
+        artifacts.close()
@@ -0,0 +1,289 @@
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import websockets
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Entry point and client port of each service under test
+SERVICES = {
+    'app2': ('app2.py', 8184),
+    'app': ('app.py', 8765),
+}
+
+# Default command mix per service: (command, parameter), picked uniformly
+MIXES = {
+    'app2': [
+        ('GET_SNAPSHOT', {}),
+        ('LIST_TARGETS', {}),
+        ('BATCH', {'commands': [{'request_type': 'GetStats'}, {'request_type': 'GetRecordStatus'}]}),
+    ],
+    'app': [
+        ('GET_POOL_STATS', {}),
+        ('TAKE_SNAPSHOT', {}),
+    ],
+}
+
+
+def percentile(sorted_values, p):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def rss_bytes(pid):
+    # Resident set size from /proc, None where that is not available
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def service_rss(pids):
+    sizes = [rss_bytes(pid) for pid in pids]
+    return None if not sizes or None in sizes else sum(sizes)
+
+
+def child_pids(pid):
+    # Front-end workers of app2 are children of the owner process
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)
+        self.errors = collections.Counter()
+
+    def add(self, command, elapsed, ok):
+        self.latencies[command].append(elapsed)
+        if not ok:
+            self.errors[command] += 1
+
+    def report(self, duration):
+        rows = {}
+        for command, values in sorted(self.latencies.items()):
+            values.sort()
+            rows[command] = {
+                'count': len(values),
+                'errors': self.errors[command],
+                'throughput': len(values) / duration,
+                'p50_ms': percentile(values, 50) * 1000,
+                'p95_ms': percentile(values, 95) * 1000,
+                'p99_ms': percentile(values, 99) * 1000,
+                'max_ms': values[-1] * 1000,
+            }
+        return rows
+
+
+def is_error(service, response):
+    if service == 'app':
+        return 'error' in response
+    return response.get('status') == 'error'
+
+
+async def run_client(url, service, mix, pipeline, recorder, connect_slots, connected, start, stop):
+    async with connect_slots:
+        ws = await websockets.connect(url, max_size=None, open_timeout=30)
+    async with ws:
+        connected.set_result(None)
+        await start.wait()
+        if service == 'app':
+            # app.py answers strictly in order and without a command_uid
+            while not stop.is_set():
+                command, parameter = random.choice(mix)
+                sent = time.perf_counter()
+                await ws.send(json.dumps({'command': command, 'parameter': parameter}))
+                response = json.loads(await ws.recv())
+                recorder.add(command, time.perf_counter() - sent, not is_error(service, response))
+            return
+        # app2 answers out of order, matched by command_uid
+        in_flight = {}
+
+        def send_one():
+            command, parameter = random.choice(mix)
+            command_uid = uuid.uuid4().hex
+            in_flight[command_uid] = (command, time.perf_counter())
+            return ws.send(json.dumps({'command': command, 'command_uid': command_uid, 'parameter': parameter}))
+
+        for _ in range(pipeline):
+            await send_one()
+        while in_flight:
+            response = json.loads(await ws.recv())
+            sent = in_flight.pop(response.get('command_uid'), None)
+            if sent is None:
+                continue  # Event or unsolicited message
+            command, sent_at = sent
+            recorder.add(command, time.perf_counter() - sent_at, not is_error(service, response))
+            if not stop.is_set():
+                await send_one()
+
+
+async def wait_for_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+def port_in_use(port):
+    with socket.socket() as sock:
+        return sock.connect_ex(('127.0.0.1', port)) == 0
+
+
+def spawn_processes(args, port):
+    # Fake OBS plus the service under test, both in a scratch directory
+    if port_in_use(port):
+        raise RuntimeError(f"Port {port} is already in use; stop that service or pass --port")
+    workdir = tempfile.mkdtemp(prefix='obs-bench-')
+    fake_obs = subprocess.Popen([
+        sys.executable, os.path.join(BASE_DIR, 'fake_obs.py'),
+        '--port', str(args.obs_port),
+        '--response_delay', str(args.response_delay),
+        '--jitter', str(args.jitter),
+        '--event_rate', str(args.event_rate),
+    ], cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    script = SERVICES[args.service][0]
+    env = {**os.environ, 'PYTHONPATH': BASE_DIR}
+    command = [sys.executable, os.path.join(BASE_DIR, script)]
+    if args.service == 'app2':
+        env['OBS_TARGETS'] = f"default=127.0.0.1:{args.obs_port}"
+        env['OBS_SERVICE_WORKERS'] = str(args.workers)
+        # A taken port makes the service fail instead of moving to another one
+        env['OBS_SERVICE_PORT'] = str(port)
+        env['OBS_SERVICE_HTTP_PORT'] = '0'
+    else:
+        command += ['--obs_host', '127.0.0.1', '--obs_port', str(args.obs_port), '--ws_port', str(port)]
+    service = subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return fake_obs, service
+
+
+async def benchmark(args):
+    port = args.port or SERVICES[args.service][1]
+    mix = [(name, {}) for name in args.commands.split(',')] if args.commands else MIXES[args.service]
+    processes = spawn_processes(args, port) if args.spawn else ()
+    try:
+        await wait_for_port(port)
+        if args.spawn:
+            await asyncio.sleep(1.0)  # Let the service finish connecting to OBS
+            if processes[1].poll() is not None:
+                raise RuntimeError(f"{args.service} exited with code {processes[1].returncode}")
+        service_pid = processes[1].pid if processes else args.service_pid
+        pids = [service_pid, *child_pids(service_pid)] if service_pid else []
+        rss_idle = service_rss(pids)
+
+        url = f"ws://127.0.0.1:{port}/"
+        recorder = Recorder()
+        start, stop = asyncio.Event(), asyncio.Event()
+        loop = asyncio.get_running_loop()
+        connected = [loop.create_future() for _ in range(args.clients)]
+        connect_slots = asyncio.Semaphore(args.connect_concurrency)
+
+        tasks = [
+            loop.create_task(run_client(url, args.service, mix, args.pipeline, recorder, connect_slots, connected[i], start, stop))
+            for i in range(args.clients)
+        ]
+        all_connected = asyncio.gather(*connected)
+        await asyncio.wait([all_connected, *tasks], return_when=asyncio.FIRST_COMPLETED)
+        if not all_connected.done():
+            # A client finished before the load started, so it failed to connect
+            all_connected.cancel()
+            stop.set()
+            start.set()
+            for task in tasks:
+                if task.done() and task.exception():
+                    raise task.exception()
+        rss_connected = service_rss(pids)
+
+        start.set()
+        started = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        stop.set()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+        rows = recorder.report(elapsed)
+        total = sum(row['count'] for row in rows.values())
+        per_connection = (rss_connected - rss_idle) / args.clients if None not in (rss_idle, rss_connected) else None
+        return {
+            'service': args.service,
+            'clients': args.clients,
+            'pipeline': args.pipeline if args.service == 'app2' else 1,
+            'workers': args.workers if args.service == 'app2' else 1,
+            'duration': elapsed,
+            'throughput': total / elapsed,
+            'errors': sum(row['errors'] for row in rows.values()),
+            'rss_idle_bytes': rss_idle,
+            'rss_connected_bytes': rss_connected,
+            'rss_per_connection_bytes': per_connection,
+            'commands': rows,
+        }
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+def print_report(result):
+    print(f"{result['service']}: {result['clients']} clients, pipeline {result['pipeline']}, "
+          f"{result['workers']} workers, {result['duration']:.1f}s")
+    print(f"{'command':<24}{'count':>9}{'errors':>8}{'cmd/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for command, row in result['commands'].items():
+        print(f"{command:<24}{row['count']:>9}{row['errors']:>8}{row['throughput']:>10.1f}"
+              f"{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}{row['max_ms']:>9.2f}")
+    print(f"total: {result['throughput']:.1f} commands/s, {result['errors']} errors")
+    if result['rss_per_connection_bytes'] is not None:
+        print(f"memory: {result['rss_idle_bytes'] / 2**20:.1f} MiB idle, "
+              f"{result['rss_connected_bytes'] / 2**20:.1f} MiB connected, "
+              f"{result['rss_per_connection_bytes'] / 1024:.1f} KiB per connection")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load generator and latency benchmark for the OBS WebSocket Service')
+    parser.add_argument('--service', choices=sorted(SERVICES), default='app2', help='Service protocol to drive')
+    parser.add_argument('--spawn', action='store_true', help='Start a fake OBS and the service in a scratch directory')
+    parser.add_argument('--port', type=int, default=None, help='Service port (default: the service default)')
+    parser.add_argument('--service_pid', type=int, default=None, help='PID of an already running service, for memory figures')
+    parser.add_argument('--obs_port', type=int, default=4465, help='Port of the spawned fake OBS')
+    parser.add_argument('--response_delay', type=float, default=0.001, help='Fake OBS response delay in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Fake OBS response delay jitter in seconds')
+    parser.add_argument('--event_rate', type=float, default=0.0, help='Fake OBS events per second')
+    parser.add_argument('--workers', type=int, default=1, help='Front-end workers of a spawned app2')
+    parser.add_argument('--clients', type=int, default=500, help='Concurrent service clients')
+    parser.add_argument('--pipeline', type=int, default=1, help='Commands in flight per client (app2 only)')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds of measured load')
+    parser.add_argument('--connect_concurrency', type=int, default=64, help='Clients connecting at the same time')
+    parser.add_argument('--commands', type=str, default=None, help='Comma separated commands to send instead of the default mix')
+    parser.add_argument('--json', type=str, default=None, help='Also write the results to this file')
+    args = parser.parse_args()
+    result = asyncio.run(benchmark(args))
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,160 @@
+import bisect
+import builtins
+import importlib
+import logging
+import time
+
+# Upper bounds (seconds) of the per-command latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class CommandError(Exception):
+    pass
+
+
+class UnknownCommandError(CommandError):
+    def __init__(self, name):
+        self.name = name
+        super().__init__(f"Unknown command: {name}")
+
+
+class CommandStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # Last bucket is +Inf
+
+    def observe(self, elapsed, error):
+        self.count += 1
+        self.errors += error
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'avg_time': self.total_time / self.count if self.count else 0.0,
+            'max_time': self.max_time,
+            'histogram': {
+                **{str(bound): n for bound, n in zip(LATENCY_BUCKETS, self.buckets)},
+                '+Inf': self.buckets[-1],
+            },
+        }
+
+
+class Command:
+    def __init__(self, name, handler, params=None, required=(), ordering_key=None, rate_limit=None, sheddable=False):
+        self.name = name
+        self.handler = handler
+        self.params = params or {}  # parameter name -> expected type (or tuple of types)
+        self.required = tuple(required)
+        self.ordering_key = ordering_key  # Commands sharing a key never run concurrently
+        self.rate_limit = rate_limit  # (commands per second, burst) allowed per client
+        self.sheddable = sheddable  # Refused while the service is overloaded
+        self.stats = CommandStats()
+
+    def validate(self, parameters):
+        if not isinstance(parameters, dict):
+            raise CommandError(f"{self.name}: 'parameter' must be an object")
+        for name in self.required:
+            if name not in parameters:
+                raise CommandError(f"{self.name}: missing parameter '{name}'")
+        for name, expected in self.params.items():
+            if name not in parameters:
+                continue
+            value = parameters[name]
+            types = expected if isinstance(expected, tuple) else (expected,)
+            # bool is an int subclass but never a valid number here
+            if isinstance(value, bool) and bool not in types:
+                raise CommandError(f"{self.name}: parameter '{name}' has the wrong type")
+            if float in types and isinstance(value, int):
+                continue
+            if not isinstance(value, types):
+                raise CommandError(f"{self.name}: parameter '{name}' has the wrong type")
+
+
+class CommandRegistry:
+    """Maps command names to handlers with a declared parameter schema.
+
+    Handlers are called as `handler(*context, parameters)` once the parameters
+    have been validated. `is_error(result)` tells the registry whether a
+    returned response counts as an error in the per-command stats.
+    """
+
+    def __init__(self, is_error=None):
+        self.commands = {}
+        self.is_error = is_error
+
+    def register(self, name, handler, params=None, required=(), ordering_key=None, rate_limit=None, sheddable=False):
+        if name in self.commands:
+            logging.warning(f"Command {name} re-registered")
+        self.commands[name] = Command(name, handler, params, required, ordering_key, rate_limit, sheddable)
+
+    def command(self, name, params=None, required=(), ordering_key=None, rate_limit=None, sheddable=False):
+        def decorator(handler):
+            self.register(name, handler, params, required, ordering_key, rate_limit, sheddable)
+            return handler
+        return decorator
+
+    def ordering_key(self, name):
+        command = self.commands.get(name)
+        return command.ordering_key if command is not None else None
+
+    def rate_limits(self):
+        return {name: command.rate_limit for name, command in self.commands.items() if command.rate_limit}
+
+    def is_sheddable(self, name):
+        command = self.commands.get(name)
+        return command is not None and command.sheddable
+
+    def load_plugins(self, module_names):
+        # A plugin module exposes register(registry) and adds its own commands
+        for module_name in module_names:
+            module = importlib.import_module(module_name)
+            module.register(self)
+            logging.info(f"Loaded command plugin {module_name}")
+
+    def validate(self, name, parameters):
+        command = self.commands.get(name)
+        if command is None:
+            raise UnknownCommandError(name)
+        command.validate(parameters)
+        return command
+
+    def schemas(self):
+        # Parameter schemas as plain data, so another process can validate commands
+        return {
+            name: {
+                'params': {param: [t.__name__ for t in (expected if isinstance(expected, tuple) else (expected,))]
+                           for param, expected in command.params.items()},
+                'required': list(command.required),
+            }
+            for name, command in self.commands.items()
+        }
+
+    @classmethod
+    def from_schemas(cls, schemas):
+        # Validation only: the handlers of the returned registry are never called
+        registry = cls()
+        for name, schema in schemas.items():
+            params = {param: tuple(getattr(builtins, t) for t in types) for param, types in schema['params'].items()}
+            registry.register(name, None, params, schema['required'])
+        return registry
+
+    async def dispatch(self, name, parameters, *context):
+        command = self.validate(name, parameters)
+        started = time.perf_counter()
+        error = True
+        try:
+            result = await command.handler(*context, parameters)
+            error = self.is_error is not None and self.is_error(result)
+            return result
+        finally:
+            command.stats.observe(time.perf_counter() - started, error)
+
+    def stats(self):
+        return {name: command.stats.as_dict() for name, command in self.commands.items() if command.stats.count}
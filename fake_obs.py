@@ -0,0 +1,362 @@
+import argparse
+import asyncio
+import base64
+import logging
+import os
+import random
+import struct
+import time
+import zlib
+
+import websockets
+
+from obs_async import (
+    OP_EVENT, OP_HELLO, OP_IDENTIFIED, OP_IDENTIFY, OP_REIDENTIFY, OP_REQUEST, OP_REQUEST_BATCH,
+    OP_REQUEST_BATCH_RESPONSE, OP_REQUEST_RESPONSE, RPC_VERSION, EventSubscription, make_authentication,
+)
+from obs_serializer import OBS_SUBPROTOCOL_PREFIX, SERIALIZERS, for_subprotocol
+
+# RequestStatus codes used by the stand-in
+STATUS_SUCCESS = 100
+STATUS_UNKNOWN_REQUEST_TYPE = 204
+STATUS_OUTPUT_RUNNING = 500
+STATUS_OUTPUT_NOT_RUNNING = 501
+STATUS_OUTPUT_PAUSED = 502
+STATUS_OUTPUT_NOT_PAUSED = 503
+
+OUTPUT_STARTED = 'OBS_WEBSOCKET_OUTPUT_STARTED'
+OUTPUT_STOPPED = 'OBS_WEBSOCKET_OUTPUT_STOPPED'
+OUTPUT_PAUSED = 'OBS_WEBSOCKET_OUTPUT_PAUSED'
+OUTPUT_RESUMED = 'OBS_WEBSOCKET_OUTPUT_RESUMED'
+
+OBS_SUBPROTOCOLS = [OBS_SUBPROTOCOL_PREFIX + name for name in SERIALIZERS]
+
+
+def serializer_of(websocket):
+    return for_subprotocol(websocket.subprotocol, OBS_SUBPROTOCOL_PREFIX)
+
+
+def make_png(width, height):
+    # A valid, solid grey PNG so clients can decode and resize it
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    raw = b''.join(b'\x00' + b'\x80' * (width * 3) for _ in range(height))
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        + chunk(b'IDAT', zlib.compress(raw))
+        + chunk(b'IEND', b'')
+    )
+
+
+class FakeOBSServer:
+    """Local stand-in for an obs-websocket 5.x server, for benchmarks.
+
+    Speaks Hello/Identify/Reidentify, answers Requests and RequestBatches
+    after `response_delay` (+/- `jitter`) seconds from a small simulated
+    record/replay-buffer state, and emits `event_rate` events per second to
+    every session subscribed to them.
+    """
+
+    def __init__(self, host='127.0.0.1', port=4455, password='', response_delay=0.0, jitter=0.0,
+                 event_rate=0.0, screenshot_size=(160, 90), output_dir=None, skipped_frames=0.0, record_bitrate=6e6):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.response_delay = response_delay
+        self.jitter = jitter
+        self.event_rate = event_rate
+        self.output_dir = output_dir or os.getcwd()
+        self.screenshot = make_png(*screenshot_size)
+        self.screenshot_data = 'data:image/png;base64,' + base64.b64encode(self.screenshot).decode()
+        self.sessions = {}  # websocket -> event subscription mask
+        self.record_active = False
+        self.record_paused = False
+        self.replay_buffer_active = False
+        self.skipped_frames = skipped_frames  # Fraction of output frames reported as skipped
+        self.record_bitrate = record_bitrate  # Bits per second the recording grows by
+        self.started = time.monotonic()
+        self.recorded = 0.0  # Seconds recorded up to the last pause
+        self.resumed_at = None
+        self.scene = 'Scene'
+        self.saved = 0
+        self.metrics = {'sessions': 0, 'requests': 0, 'batches': 0, 'events': 0}
+
+    async def serve(self):
+        async with websockets.serve(self.handler, self.host, self.port, subprotocols=OBS_SUBPROTOCOLS, max_size=None):
+            logging.info(f"Fake OBS listening on {self.host}:{self.port}")
+            emitter = asyncio.get_running_loop().create_task(self.emit_events()) if self.event_rate > 0 else None
+            try:
+                await asyncio.Future()
+            finally:
+                if emitter is not None:
+                    emitter.cancel()
+
+    async def handler(self, websocket):
+        hello = {'obsWebSocketVersion': '5.5.0', 'rpcVersion': RPC_VERSION}
+        if self.password:
+            salt, challenge = base64.b64encode(os.urandom(16)).decode(), base64.b64encode(os.urandom(16)).decode()
+            hello['authentication'] = {'salt': salt, 'challenge': challenge}
+        serializer = serializer_of(websocket)
+        await websocket.send(serializer.dumps({'op': OP_HELLO, 'd': hello}))
+        identify = serializer.loads(await websocket.recv())
+        if identify.get('op') != OP_IDENTIFY:
+            await websocket.close(4002, 'Expected Identify')
+            return
+        data = identify['d']
+        if self.password and data.get('authentication') != make_authentication(self.password, salt, challenge):
+            await websocket.close(4009, 'Authentication failed')
+            return
+        self.sessions[websocket] = data.get('eventSubscriptions', EventSubscription.ALL)
+        self.metrics['sessions'] += 1
+        await websocket.send(serializer.dumps({'op': OP_IDENTIFIED, 'd': {'negotiatedRpcVersion': RPC_VERSION}}))
+        try:
+            async for raw in websocket:
+                message = serializer.loads(raw)
+                op, data = message.get('op'), message.get('d', {})
+                if op == OP_REQUEST:
+                    asyncio.get_running_loop().create_task(self.respond(websocket, data))
+                elif op == OP_REQUEST_BATCH:
+                    asyncio.get_running_loop().create_task(self.respond_batch(websocket, data))
+                elif op == OP_REIDENTIFY:
+                    self.sessions[websocket] = data.get('eventSubscriptions', EventSubscription.ALL)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            self.sessions.pop(websocket, None)
+
+    async def delay(self):
+        delay = self.response_delay + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def respond(self, websocket, data):
+        self.metrics['requests'] += 1
+        await self.delay()
+        result = self.execute(data.get('requestType'), data.get('requestData', {}))
+        result['requestId'] = data.get('requestId')
+        try:
+            await websocket.send(serializer_of(websocket).dumps({'op': OP_REQUEST_RESPONSE, 'd': result}))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def respond_batch(self, websocket, data):
+        self.metrics['batches'] += 1
+        await self.delay()
+        results = []
+        for request in data.get('requests', []):
+            result = self.execute(request.get('requestType'), request.get('requestData', {}))
+            results.append(result)
+            if data.get('haltOnFailure') and not result['requestStatus']['result']:
+                break
+        try:
+            await websocket.send(serializer_of(websocket).dumps({'op': OP_REQUEST_BATCH_RESPONSE, 'd': {'requestId': data.get('requestId'), 'results': results}}))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    def execute(self, request_type, request_data):
+        handler = getattr(self, f"request_{request_type}", None)
+        if handler is None:
+            return self.result(request_type, STATUS_UNKNOWN_REQUEST_TYPE, comment=f"Unknown request type: {request_type}")
+        code, response_data = handler(request_data)
+        return self.result(request_type, code, response_data)
+
+    @staticmethod
+    def result(request_type, code, response_data=None, comment=None):
+        status = {'result': code == STATUS_SUCCESS, 'code': code}
+        if comment:
+            status['comment'] = comment
+        result = {'requestType': request_type, 'requestStatus': status}
+        if response_data:
+            result['responseData'] = response_data
+        return result
+
+    def broadcast(self, intent, event_type, event_data):
+        event = {'op': OP_EVENT, 'd': {'eventType': event_type, 'eventIntent': intent, 'eventData': event_data}}
+        encoded = {}  # serializer -> message
+        for websocket, mask in list(self.sessions.items()):
+            if mask & intent:
+                serializer = serializer_of(websocket)
+                if serializer not in encoded:
+                    encoded[serializer] = serializer.dumps(event)
+                self.metrics['events'] += 1
+                asyncio.get_running_loop().create_task(self._send_quietly(websocket, encoded[serializer]))
+
+    @staticmethod
+    async def _send_quietly(websocket, message):
+        try:
+            await websocket.send(message)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def emit_events(self):
+        # Steady event load: scene switches for Scenes subscribers
+        interval = 1.0 / self.event_rate
+        loop = asyncio.get_running_loop()
+        next_at = loop.time()
+        while True:
+            next_at += interval
+            await asyncio.sleep(max(next_at - loop.time(), 0))
+            self.broadcast(EventSubscription.SCENES, 'CurrentProgramSceneChanged', {'sceneName': self.scene})
+
+    def record_changed(self, state):
+        now = time.monotonic()
+        if state == OUTPUT_STARTED:
+            self.recorded, self.resumed_at = 0.0, now
+        elif state == OUTPUT_RESUMED:
+            self.resumed_at = now
+        elif self.resumed_at is not None:
+            self.recorded += now - self.resumed_at
+            self.resumed_at = None
+        data = {'outputActive': self.record_active, 'outputState': state}
+        if state == OUTPUT_STOPPED:
+            data['outputPath'] = self.write_output('fake_recording.mkv')
+        self.broadcast(EventSubscription.OUTPUTS, 'RecordStateChanged', data)
+
+    def write_output(self, name):
+        # A small placeholder, so post-save processing has a file to work on
+        path = os.path.join(self.output_dir, name)
+        with open(path, 'wb') as f:
+            f.write(os.urandom(64 * 1024))
+        return path
+
+    # Requests, named request_<requestType>: return (status code, responseData)
+
+    def request_GetVersion(self, data):
+        return STATUS_SUCCESS, {'obsVersion': '30.0.0', 'obsWebSocketVersion': '5.5.0', 'rpcVersion': RPC_VERSION}
+
+    def recorded_seconds(self):
+        return self.recorded + (time.monotonic() - self.resumed_at if self.resumed_at is not None else 0.0)
+
+    def request_GetStats(self, data):
+        # Frame counters advance at 60 fps from startup
+        frames = int((time.monotonic() - self.started) * 60)
+        return STATUS_SUCCESS, {
+            'cpuUsage': 1.0, 'memoryUsage': 256.0, 'availableDiskSpace': 100000.0, 'activeFps': 60.0,
+            'averageFrameRenderTime': 1.0, 'renderSkippedFrames': 0, 'renderTotalFrames': frames,
+            'outputSkippedFrames': int(frames * self.skipped_frames), 'outputTotalFrames': frames,
+            'webSocketSessionIncomingMessages': self.metrics['requests'], 'webSocketSessionOutgoingMessages': self.metrics['requests'],
+        }
+
+    def request_GetRecordStatus(self, data):
+        seconds = self.recorded_seconds() if self.record_active else 0.0
+        return STATUS_SUCCESS, {
+            'outputActive': self.record_active, 'outputPaused': self.record_paused,
+            'outputTimecode': time.strftime('%H:%M:%S', time.gmtime(seconds)) + f".{int(seconds % 1 * 1000):03d}",
+            'outputDuration': int(seconds * 1000), 'outputBytes': int(seconds * self.record_bitrate / 8),
+        }
+
+    def request_SetRecordDirectory(self, data):
+        return STATUS_SUCCESS, None
+
+    def request_StartRecord(self, data):
+        if self.record_active:
+            return STATUS_OUTPUT_RUNNING, None
+        self.record_active, self.record_paused = True, False
+        self.record_changed(OUTPUT_STARTED)
+        return STATUS_SUCCESS, None
+
+    def request_StopRecord(self, data):
+        if not self.record_active:
+            return STATUS_OUTPUT_NOT_RUNNING, None
+        self.record_active, self.record_paused = False, False
+        self.record_changed(OUTPUT_STOPPED)
+        return STATUS_SUCCESS, {'outputPath': os.path.join(self.output_dir, 'fake_recording.mkv')}
+
+    def request_PauseRecord(self, data):
+        if not self.record_active:
+            return STATUS_OUTPUT_NOT_RUNNING, None
+        if self.record_paused:
+            return STATUS_OUTPUT_PAUSED, None
+        self.record_paused = True
+        self.record_changed(OUTPUT_PAUSED)
+        return STATUS_SUCCESS, None
+
+    def request_ResumeRecord(self, data):
+        if not self.record_paused:
+            return STATUS_OUTPUT_NOT_PAUSED, None
+        self.record_paused = False
+        self.record_changed(OUTPUT_RESUMED)
+        return STATUS_SUCCESS, None
+
+    def request_ToggleRecordPause(self, data):
+        if not self.record_active:
+            return STATUS_OUTPUT_NOT_RUNNING, None
+        self.record_paused = not self.record_paused
+        self.record_changed(OUTPUT_PAUSED if self.record_paused else OUTPUT_RESUMED)
+        return STATUS_SUCCESS, None
+
+    def request_GetReplayBufferStatus(self, data):
+        return STATUS_SUCCESS, {'outputActive': self.replay_buffer_active}
+
+    def request_StartReplayBuffer(self, data):
+        if self.replay_buffer_active:
+            return STATUS_OUTPUT_RUNNING, None
+        self.replay_buffer_active = True
+        self.broadcast(EventSubscription.OUTPUTS, 'ReplayBufferStateChanged', {'outputActive': True, 'outputState': OUTPUT_STARTED})
+        return STATUS_SUCCESS, None
+
+    def request_StopReplayBuffer(self, data):
+        if not self.replay_buffer_active:
+            return STATUS_OUTPUT_NOT_RUNNING, None
+        self.replay_buffer_active = False
+        self.broadcast(EventSubscription.OUTPUTS, 'ReplayBufferStateChanged', {'outputActive': False, 'outputState': OUTPUT_STOPPED})
+        return STATUS_SUCCESS, None
+
+    def request_SaveReplayBuffer(self, data):
+        if not self.replay_buffer_active:
+            return STATUS_OUTPUT_NOT_RUNNING, None
+        self.saved += 1
+        path = self.write_output(f"fake_replay_{self.saved}.mkv")
+        self.broadcast(EventSubscription.OUTPUTS, 'ReplayBufferSaved', {'savedReplayPath': path})
+        return STATUS_SUCCESS, None
+
+    def request_GetProfileParameter(self, data):
+        values = {('Output', 'Mode'): 'Simple', ('SimpleOutput', 'RecRBTime'): '20'}
+        value = values.get((data.get('parameterCategory'), data.get('parameterName')))
+        return STATUS_SUCCESS, {'parameterValue': value, 'defaultParameterValue': value}
+
+    def request_GetCurrentProgramScene(self, data):
+        return STATUS_SUCCESS, {'sceneName': self.scene, 'currentProgramSceneName': self.scene}
+
+    def request_SetCurrentProgramScene(self, data):
+        self.scene = data.get('sceneName', self.scene)
+        self.broadcast(EventSubscription.SCENES, 'CurrentProgramSceneChanged', {'sceneName': self.scene})
+        return STATUS_SUCCESS, None
+
+    def request_GetSourceScreenshot(self, data):
+        return STATUS_SUCCESS, {'imageData': self.screenshot_data}
+
+    def request_SaveSourceScreenshot(self, data):
+        with open(data['imageFilePath'], 'wb') as f:
+            f.write(self.screenshot)
+        return STATUS_SUCCESS, None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Stand-in obs-websocket 5.x server for benchmarks')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Host to listen on')
+    parser.add_argument('--port', type=int, default=4455, help='Port to listen on')
+    parser.add_argument('--password', type=str, default='', help='Require authentication with this password')
+    parser.add_argument('--response_delay', type=float, default=0.0, help='Seconds before each response is sent')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random +/- seconds added to the response delay')
+    parser.add_argument('--event_rate', type=float, default=0.0, help='Events per second sent to subscribed sessions')
+    parser.add_argument('--screenshot_width', type=int, default=160, help='Width of the returned screenshots')
+    parser.add_argument('--screenshot_height', type=int, default=90, help='Height of the returned screenshots')
+    parser.add_argument('--skipped_frames', type=float, default=0.0, help='Fraction of output frames reported as skipped')
+    parser.add_argument('--record_bitrate', type=float, default=6e6, help='Bits per second a recording grows by')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s [fake-obs] %(message)s')
+    server = FakeOBSServer(
+        args.host, args.port, args.password,
+        response_delay=args.response_delay,
+        jitter=args.jitter,
+        event_rate=args.event_rate,
+        screenshot_size=(args.screenshot_width, args.screenshot_height),
+        skipped_frames=args.skipped_frames,
+        record_bitrate=args.record_bitrate,
+    )
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst):
+        self.rate = rate  # Tokens added per second
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def wait(self, now):
+        # Seconds until a token is available, 0 when one is available now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Token buckets of one client: one for all its commands, one per limited command.
+
+    A command is admitted only when every bucket it draws from has a token,
+    and only then are the tokens taken, so a refused command costs nothing.
+    """
+
+    def __init__(self, rate, burst, command_limits=None):
+        self.bucket = TokenBucket(rate, burst)
+        self.command_limits = command_limits or {}  # command -> (rate, burst)
+        self.command_buckets = {}
+        self.rejected = 0
+
+    def check(self, command):
+        # Returns 0 when admitted, otherwise the seconds to wait before retrying
+        buckets = [self.bucket]
+        limit = self.command_limits.get(command)
+        if limit is not None:
+            bucket = self.command_buckets.get(command)
+            if bucket is None:
+                bucket = self.command_buckets[command] = TokenBucket(*limit)
+            buckets.append(bucket)
+        now = time.monotonic()
+        retry_after = max(bucket.wait(now) for bucket in buckets)
+        if retry_after:
+            self.rejected += 1
+            return retry_after
+        for bucket in buckets:
+            bucket.tokens -= 1
+        return 0.0
+
+
+class Coalescer:
+    """Lets identical concurrent calls share one execution.
+
+    The first call for a key runs; calls with the same key made while it is
+    in flight wait for its result instead of running again. The shared call
+    is shielded, so a caller giving up does not cancel it for the others,
+    and every caller gets the same result object, which must not be modified.
+    """
+
+    def __init__(self):
+        self.in_flight = {}  # key -> task
+        self.metrics = {'calls': 0, 'coalesced': 0}
+
+    async def run(self, key, call):
+        # call() creates the coroutine to run when nothing is in flight for key
+        self.metrics['calls'] += 1
+        task = self.in_flight.get(key)
+        if task is None:
+            task = self.in_flight[key] = asyncio.get_running_loop().create_task(call())
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.metrics['coalesced'] += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        if self.in_flight.get(key) is task:
+            del self.in_flight[key]
+        if not task.cancelled():
+            task.exception()  # Retrieved here in case every caller gave up
@@ -0,0 +1,193 @@
+import bisect
+import datetime
+import json
+import logging
+import os
+import queue
+import threading
+import uuid
+
+ARTIFACT_KINDS = ('recording', 'replay', 'snapshot')
+
+# status of a recording artifact
+STATUS_RECORDING = 'recording'
+STATUS_COMPLETE = 'complete'
+STATUS_ABANDONED = 'abandoned'  # A new recording started on the target before this one was stopped through the service
+
+
+def file_size(path):
+    # None when OBS wrote the file somewhere this process cannot see
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return None
+
+
+class ArtifactIndex:
+    """Recordings, replays and snapshots the service produced, kept in memory
+    and persisted to an append-only JSON-lines file.
+
+    Every change appends the whole record, so the last line for an id wins
+    when the file is loaded again; superseded lines are compacted away on
+    load once they make up most of the file. Lines are written and flushed
+    by a background thread, so the index never blocks the event loop on disk.
+    Only the newest `max_records` are kept; older ones are forgotten, except
+    a recording still in progress, and leave the file at the next compaction.
+    """
+
+    def __init__(self, path, max_records=10000):
+        self.path = path
+        self.max_records = max_records
+        self.records = {}  # id -> record
+        self.order = []  # records by ascending seq, for paging
+        self.seqs = []
+        self.active = {}  # target -> id of its recording in progress
+        self.file = None
+        self.lines = queue.SimpleQueue()  # Serialized records for the writer, None stops it
+        self.writer = None
+
+    def load(self):
+        lines = 0
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        logging.warning(f"Skipping corrupt line {lines} of {self.path}")
+                        continue
+                    self.records[record['id']] = record
+        except FileNotFoundError:
+            pass
+        # A record is re-appended on update, so its creation order is its seq
+        self.order = sorted(self.records.values(), key=lambda record: record['seq'])
+        self.seqs = [record['seq'] for record in self.order]
+        for record in self.order:
+            if record['kind'] == 'recording' and record['status'] == STATUS_RECORDING:
+                self.active[record['target']] = record['id']
+        self._trim()
+        if lines > 2 * len(self.records) + 100:
+            self.compact()
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self.writer = threading.Thread(target=self._write_lines, name='artifact-index', daemon=True)
+        self.writer.start()
+        logging.info(f"Loaded {len(self.records)} artifacts from {self.path}")
+        return self
+
+    def compact(self):
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            for record in self.order:
+                f.write(json.dumps(record) + '\n')
+        os.replace(temporary, self.path)
+
+    def close(self):
+        # Waits for the lines already queued to be written
+        if self.writer is not None:
+            self.lines.put(None)
+            self.writer.join()
+            self.writer = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _write(self, record):
+        # Serialized here, as the record may change again before the writer gets to it
+        self.lines.put(json.dumps(record) + '\n')
+
+    def _write_lines(self):
+        # Writer thread; lines queued up meanwhile go out with a single flush
+        while True:
+            lines = [self.lines.get()]
+            while not self.lines.empty():
+                lines.append(self.lines.get())
+            try:
+                self.file.writelines(line for line in lines if line is not None)
+                self.file.flush()
+            except OSError as e:
+                logging.error(f"Failed to write {self.path}: {e}")
+            if None in lines:
+                return
+
+    def add(self, kind, target, instance_id, file_path=None, size=None, **fields):
+        record = {
+            'id': uuid.uuid4().hex,
+            'seq': self.seqs[-1] + 1 if self.seqs else 0,
+            'kind': kind,
+            'target': target,
+            'instance_id': instance_id,
+            'file_path': file_path,
+            'size': size,
+            'created': datetime.datetime.now().isoformat(),
+            **fields,
+        }
+        self.records[record['id']] = record
+        self.order.append(record)
+        self.seqs.append(record['seq'])
+        # Trimmed in chunks, so the cost per add stays constant
+        if len(self.order) > self.max_records + self.max_records // 10:
+            self._trim()
+        self._write(record)
+        return record
+
+    def _trim(self):
+        excess = len(self.order) - self.max_records
+        if excess <= 0:
+            return
+        active = set(self.active.values())
+        for record in self.order[:excess]:
+            if record['id'] not in active:
+                del self.records[record['id']]
+        del self.order[:excess]
+        del self.seqs[:excess]
+
+    def get(self, artifact_id):
+        return self.records.get(artifact_id)
+
+    def update(self, record, **fields):
+        record.update(fields)
+        self._write(record)
+        return record
+
+    def start_recording(self, target, instance_id):
+        previous = self.active_recording(target)
+        if previous is not None:
+            self.update(previous, status=STATUS_ABANDONED)
+        record = self.add('recording', target, instance_id, status=STATUS_RECORDING,
+                          started=datetime.datetime.now().isoformat())
+        self.active[target] = record['id']
+        return record
+
+    def active_recording(self, target):
+        artifact_id = self.active.get(target)
+        return self.records.get(artifact_id) if artifact_id else None
+
+    def finish_recording(self, target, file_path, size=None, timecode=None, duration=None):
+        # Returns the completed record; one is created if the recording was
+        # started outside the service
+        record = self.records.get(self.active.pop(target, None))
+        if record is None:
+            record = self.add('recording', target, None, status=STATUS_RECORDING)
+        stopped = datetime.datetime.now()
+        if duration is None and record.get('started'):
+            duration = (stopped - datetime.datetime.fromisoformat(record['started'])).total_seconds()
+        return self.update(record, status=STATUS_COMPLETE, file_path=file_path, size=size,
+                           timecode=timecode, duration=duration, stopped=stopped.isoformat())
+
+    def page(self, kind=None, target=None, instance_id=None, cursor=None, limit=100):
+        # Newest first; cursor is the seq of the last record of the previous page
+        items = []
+        end = bisect.bisect_left(self.seqs, cursor) if cursor is not None else len(self.order)
+        for position in range(end - 1, -1, -1):
+            record = self.order[position]
+            if kind and record['kind'] != kind:
+                continue
+            if target and record['target'] != target:
+                continue
+            if instance_id and record['instance_id'] != instance_id:
+                continue
+            if len(items) == limit:
+                return items, items[-1]['seq']
+            items.append(record)
+        return items, None
@@ -0,0 +1,244 @@
+import asyncio
+import base64
+import hashlib
+import logging
+import time
+import uuid
+
+import websockets
+
+import obs_metrics
+from obs_serializer import JSON, OBS_SUBPROTOCOL_PREFIX
+
+# WebSocketOpCode values from the obs-websocket 5.x protocol (see readme.md)
+OP_HELLO = 0
+OP_IDENTIFY = 1
+OP_IDENTIFIED = 2
+OP_REIDENTIFY = 3
+OP_EVENT = 5
+OP_REQUEST = 6
+OP_REQUEST_RESPONSE = 7
+OP_REQUEST_BATCH = 8
+OP_REQUEST_BATCH_RESPONSE = 9
+
+RPC_VERSION = 1
+
+
+class EventSubscription:
+    NONE = 0
+    GENERAL = 1 << 0
+    CONFIG = 1 << 1
+    SCENES = 1 << 2
+    INPUTS = 1 << 3
+    TRANSITIONS = 1 << 4
+    FILTERS = 1 << 5
+    OUTPUTS = 1 << 6
+    SCENE_ITEMS = 1 << 7
+    MEDIA_INPUTS = 1 << 8
+    VENDORS = 1 << 9
+    UI = 1 << 10
+    ALL = (GENERAL | CONFIG | SCENES | INPUTS | TRANSITIONS | FILTERS
+           | OUTPUTS | SCENE_ITEMS | MEDIA_INPUTS | VENDORS | UI)
+    INPUT_VOLUME_METERS = 1 << 16
+    INPUT_ACTIVE_STATE_CHANGED = 1 << 17
+    INPUT_SHOW_STATE_CHANGED = 1 << 18
+    SCENE_ITEM_TRANSFORM_CHANGED = 1 << 19
+
+
+class RequestBatchExecutionType:
+    NONE = -1
+    SERIAL_REALTIME = 0
+    SERIAL_FRAME = 1
+    PARALLEL = 2
+
+
+class OBSRequestError(Exception):
+    def __init__(self, request_type, code, comment=None):
+        self.request_type = request_type
+        self.code = code
+        self.comment = comment
+        message = f"Request {request_type} returned code {code}"
+        if comment:
+            message += f": {comment}"
+        super().__init__(message)
+
+
+def make_authentication(password, salt, challenge):
+    secret = base64.b64encode(hashlib.sha256((password + salt).encode()).digest())
+    return base64.b64encode(hashlib.sha256(secret + challenge.encode()).digest()).decode()
+
+
+class AsyncOBSClient:
+    """obs-websocket 5.x client running entirely on the event loop.
+
+    Requests are multiplexed over one socket and matched to their responses
+    by `requestId`, so any number of them can be in flight at once. With the
+    msgpack serializer the session uses the `obswebsocket.msgpack`
+    subprotocol and binary frames.
+    """
+
+    def __init__(self, host='localhost', port=4455, password='', event_subscriptions=EventSubscription.ALL, timeout=10,
+                 serializer=JSON):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.event_subscriptions = event_subscriptions
+        self.timeout = timeout
+        self.serializer = serializer
+        self.ws = None
+        self.negotiated_rpc_version = None
+        self.pending = {}
+        self.event_handlers = {}
+        self.raw_event_handlers = ()
+        self.reader_task = None
+
+    def __repr__(self):
+        return f"AsyncOBSClient(host='{self.host}', port={self.port})"
+
+    @property
+    def is_connected(self):
+        return self.ws is not None and self.reader_task is not None and not self.reader_task.done()
+
+    async def connect(self):
+        uri = f"ws://{self.host}:{self.port}"
+        self.ws = await asyncio.wait_for(
+            websockets.connect(uri, subprotocols=[OBS_SUBPROTOCOL_PREFIX + self.serializer.name], max_size=None),
+            self.timeout,
+        )
+        try:
+            await asyncio.wait_for(self._identify(), self.timeout)
+        except BaseException:
+            await self.ws.close()
+            self.ws = None
+            raise
+        self.reader_task = asyncio.get_running_loop().create_task(self._read_loop())
+        logging.info(f"Identified with OBS at {self.host}:{self.port} using RPC version {self.negotiated_rpc_version}")
+        return self
+
+    async def _identify(self):
+        hello = self.serializer.loads(await self.ws.recv())
+        if hello.get('op') != OP_HELLO:
+            raise ConnectionError(f"Expected Hello from OBS, got op {hello.get('op')}")
+        identify = {
+            'rpcVersion': RPC_VERSION,
+            'eventSubscriptions': self.event_subscriptions,
+        }
+        auth = hello['d'].get('authentication')
+        if auth:
+            identify['authentication'] = make_authentication(self.password, auth['salt'], auth['challenge'])
+        await self.ws.send(self.serializer.dumps({'op': OP_IDENTIFY, 'd': identify}))
+        identified = self.serializer.loads(await self.ws.recv())
+        if identified.get('op') != OP_IDENTIFIED:
+            raise ConnectionError(f"Expected Identified from OBS, got op {identified.get('op')}")
+        self.negotiated_rpc_version = identified['d']['negotiatedRpcVersion']
+
+    async def disconnect(self):
+        if self.ws is not None:
+            await self.ws.close()
+        if self.reader_task is not None:
+            try:
+                await self.reader_task
+            except Exception:
+                pass
+        self.ws = None
+        self.reader_task = None
+
+    async def _read_loop(self):
+        error = ConnectionError("Connection to OBS closed")
+        try:
+            async for raw in self.ws:
+                message = self.serializer.loads(raw)
+                op = message.get('op')
+                data = message.get('d', {})
+                if op in (OP_REQUEST_RESPONSE, OP_REQUEST_BATCH_RESPONSE):
+                    future = self.pending.pop(data.get('requestId'), None)
+                    if future is not None and not future.done():
+                        future.set_result(data)
+                elif op == OP_EVENT:
+                    self._dispatch_event(data)
+        except websockets.exceptions.ConnectionClosed as e:
+            error = ConnectionError(f"Connection to OBS closed: {e}")
+        except Exception as e:
+            logging.error(f"OBS reader failed: {e}")
+            error = ConnectionError(f"OBS reader failed: {e}")
+        finally:
+            pending, self.pending = self.pending, {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(error)
+
+    def _dispatch_event(self, data):
+        event_type = data.get('eventType')
+        event_data = data.get('eventData', {})
+        for callback in self.raw_event_handlers:
+            try:
+                callback(data)
+            except Exception as e:
+                logging.error(f"OBS raw event handler for {event_type} failed: {e}")
+        for callback in self.event_handlers.get(event_type, ()) + self.event_handlers.get(None, ()):
+            try:
+                result = callback(event_type, event_data)
+                if asyncio.iscoroutine(result):
+                    asyncio.get_running_loop().create_task(result)
+            except Exception as e:
+                logging.error(f"OBS event handler for {event_type} failed: {e}")
+
+    def register_event(self, callback, event_type=None):
+        # event_type=None receives every event
+        self.event_handlers[event_type] = self.event_handlers.get(event_type, ()) + (callback,)
+
+    def unregister_event(self, callback, event_type=None):
+        handlers = self.event_handlers.get(event_type, ())
+        self.event_handlers[event_type] = tuple(h for h in handlers if h != callback)
+
+    def register_raw_event(self, callback):
+        # callback(data) receives the whole Event payload, including eventIntent
+        self.raw_event_handlers += (callback,)
+
+    def unregister_raw_event(self, callback):
+        self.raw_event_handlers = tuple(h for h in self.raw_event_handlers if h != callback)
+
+    async def _send_and_wait(self, op, data, timeout):
+        if not self.is_connected:
+            raise ConnectionError("Not connected to OBS Studio")
+        request_id = data['requestId']
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        started = time.perf_counter() if obs_metrics.registry is not None else None
+        try:
+            await self.ws.send(self.serializer.dumps({'op': op, 'd': data}))
+            return await asyncio.wait_for(future, timeout if timeout is not None else self.timeout)
+        finally:
+            self.pending.pop(request_id, None)
+            if started is not None:
+                elapsed = time.perf_counter() - started
+                obs_metrics.registry.observe('obs_service_obs_request_seconds', elapsed, request_type=data.get('requestType', 'RequestBatch'))
+                timer = obs_metrics.command_timer.get()
+                if timer is not None:
+                    timer.obs += elapsed
+
+    async def call(self, request_type, request_data=None, timeout=None):
+        data = {'requestType': request_type, 'requestId': uuid.uuid4().hex}
+        if request_data:
+            data['requestData'] = request_data
+        response = await self._send_and_wait(OP_REQUEST, data, timeout)
+        status = response['requestStatus']
+        if not status['result']:
+            raise OBSRequestError(request_type, status['code'], status.get('comment'))
+        return response.get('responseData', {})
+
+    async def call_batch(self, requests, execution_type=RequestBatchExecutionType.SERIAL_REALTIME, halt_on_failure=False, timeout=None):
+        # requests: list of {'requestType': ..., 'requestData': ...}. Returns the raw
+        # per-request results; failed items are reported, not raised
+        data = {
+            'requestId': uuid.uuid4().hex,
+            'haltOnFailure': halt_on_failure,
+            'executionType': execution_type,
+            'requests': requests,
+        }
+        response = await self._send_and_wait(OP_REQUEST_BATCH, data, timeout)
+        return response.get('results', [])
+
+    async def reidentify(self, event_subscriptions):
+        self.event_subscriptions = event_subscriptions
+        await self.ws.send(self.serializer.dumps({'op': OP_REIDENTIFY, 'd': {'eventSubscriptions': event_subscriptions}}))
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import os
+import uuid
+
+
+class SnapshotBurst:
+    """Captures `count` snapshots, one every `interval` seconds, on the server.
+
+    Frames are scheduled against absolute deadlines so slow captures do not
+    shift the schedule. When `max_in_flight` captures are still running at a
+    deadline, or deadlines have already passed, those frames are dropped
+    rather than queued, so a slow OBS never builds up a backlog.
+    """
+
+    def __init__(self, engine, client, source_name, interval, count, max_in_flight=2,
+                 on_frame=None, on_finished=None, **capture_options):
+        self.burst_id = uuid.uuid4().hex[:8]
+        self.engine = engine
+        self.client = client
+        self.source_name = source_name
+        self.interval = interval
+        self.count = count
+        self.max_in_flight = max_in_flight
+        self.on_frame = on_frame
+        self.on_finished = on_finished
+        self.capture_options = capture_options
+        self.in_flight = set()
+        self.task = None
+        self.captured = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self.run())
+        return self.task
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    def summary(self):
+        return {
+            'burst_id': self.burst_id,
+            'requested': self.count,
+            'captured': self.captured,
+            'dropped': self.dropped,
+            'failed': self.failed,
+        }
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        frame = 0
+        try:
+            while frame < self.count:
+                deadline = started + frame * self.interval
+                delay = deadline - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    # Behind schedule: coalesce every deadline already missed into this one
+                    missed = min(int(-delay / self.interval), self.count - frame - 1)
+                    self.dropped += missed
+                    frame += missed
+                if len(self.in_flight) >= self.max_in_flight:
+                    self.dropped += 1
+                else:
+                    task = loop.create_task(self.capture(frame))
+                    self.in_flight.add(task)
+                    task.add_done_callback(self.in_flight.discard)
+                frame += 1
+            if self.in_flight:
+                await asyncio.wait(self.in_flight)
+        finally:
+            for task in self.in_flight:
+                task.cancel()
+            if self.on_finished is not None:
+                await self.on_finished(self)
+
+    async def capture(self, frame):
+        image_format = self.capture_options.get('image_format', 'png')
+        file_path = os.path.abspath(os.path.join(
+            self.engine.snapshot_dir, f"burst_{self.burst_id}_{frame:05d}.{image_format}"
+        ))
+        try:
+            snapshot = await self.engine.capture(self.client, self.source_name, file_path=file_path, **self.capture_options)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            logging.error(f"Burst {self.burst_id} frame {frame} failed: {e}")
+            return
+        self.captured += 1
+        if self.on_frame is not None:
+            await self.on_frame(self, frame, snapshot)
@@ -0,0 +1,271 @@
+import asyncio
+import collections
+import concurrent.futures
+import hashlib
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import uuid
+
+FFMPEG_TIMEOUT = 600  # Seconds one ffmpeg stage may run
+CHECKSUM_BLOCK_SIZE = 1024 * 1024
+
+
+# Stages are stage(path) -> JSON-serialisable dict, run in a pool of worker
+# processes. They are pickled by module and name, so they must be module-level
+# functions; plugins add their own to STAGES
+
+def move_file(source, directory):
+    # Moves source into directory without overwriting; returns the new path
+    if os.path.dirname(os.path.realpath(source)) == os.path.realpath(directory):
+        return source
+    name, extension = os.path.splitext(os.path.basename(source))
+    directory = os.path.abspath(directory)
+    destination = os.path.join(directory, name + extension)
+    counter = 1
+    while os.path.exists(destination):
+        destination = os.path.join(directory, f"{name}-{counter}{extension}")
+        counter += 1
+    shutil.move(source, destination)
+    return destination
+
+
+def checksum_stage(path):
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHECKSUM_BLOCK_SIZE), b''):
+            digest.update(block)
+            size += len(block)
+    return {'sha256': digest.hexdigest(), 'size': size}
+
+
+def run_ffmpeg(arguments):
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        return False
+    subprocess.run([ffmpeg, '-nostdin', '-loglevel', 'error', '-y', *arguments],
+                   check=True, capture_output=True, timeout=FFMPEG_TIMEOUT)
+    return True
+
+
+def remux_stage(path):
+    # Copies the streams into an MP4 with the index up front, for web playback
+    base, extension = os.path.splitext(path)
+    if extension.lower() == '.mp4':
+        return {'skipped': 'already mp4'}
+    output = base + '.mp4'
+    if not run_ffmpeg(['-i', path, '-c', 'copy', '-movflags', '+faststart', output]):
+        return {'skipped': 'ffmpeg not available'}
+    return {'remux_path': output}
+
+
+def poster_stage(path):
+    output = os.path.splitext(path)[0] + '.poster.jpg'
+    if not run_ffmpeg(['-ss', '1', '-i', path, '-frames:v', '1', '-q:v', '3', output]):
+        return {'skipped': 'ffmpeg not available'}
+    return {'poster_path': output}
+
+
+STAGES = {
+    'checksum': checksum_stage,
+    'remux': remux_stage,
+    'poster': poster_stage,
+}
+
+
+class ClipJob:
+    def __init__(self, source, directory, kind, target):
+        self.job_id = uuid.uuid4().hex
+        self.source = source
+        self.directory = directory
+        self.kind = kind  # 'replay' or 'recording'
+        self.target = target
+        self.file_path = source  # Where the file is now
+        self.move_task = None
+        self.owner = None  # (instance_id, command_uid, artifact_id) of the client that asked for it
+        self.results = {}
+        self.errors = {}
+
+    def summary(self):
+        return {
+            'job_id': self.job_id,
+            'kind': self.kind,
+            'target': self.target,
+            'file_path': self.file_path,
+            'results': self.results,
+            'errors': self.errors,
+        }
+
+
+class ClipPipeline:
+    """Moves saved replays and recordings into place and post-processes them.
+
+    A submitted file is moved into its directory right away, in the thread
+    `executor`, so `wait_moved` can tell a client the final path. The job
+    then waits in a bounded queue; `max_jobs` of them are processed at a time,
+    their configured stages running concurrently in a pool of `processes`
+    worker processes that is reused across jobs. The workers are spawned,
+    not forked, so the service's sockets and threads stay out of them. The
+    coroutines `on_stage(job, stage, result, error)` and `on_finished(job)`
+    report progress. A full queue refuses new jobs instead of letting them
+    pile up.
+
+    OBS reports a saved file through an event, while the client that asked
+    for it learns the path from its command: `claim` records that client as
+    the owner, before or after the event created the job.
+    """
+
+    def __init__(self, stages, max_jobs=2, max_queued=64, processes=2, on_stage=None, on_finished=None, executor=None):
+        self.stages = stages  # name -> stage(path)
+        self.max_jobs = max_jobs
+        self.processes = processes
+        self.on_stage = on_stage
+        self.on_finished = on_finished
+        self.executor = executor
+        self.pool = None
+        self.queue = asyncio.Queue(maxsize=max_queued)
+        self.jobs = {}  # source path -> job, while queued or running
+        self.owners = collections.OrderedDict()  # source path -> owner claimed before the job existed
+        self.destinations = collections.OrderedDict()  # source path -> path it was moved to
+        self.move_waiters = {}  # source path -> futures of wait_moved callers
+        self.workers = []
+        self.metrics = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0}
+
+    def start(self):
+        if not self.workers:
+            self.workers = [asyncio.get_running_loop().create_task(self._worker()) for _ in range(self.max_jobs)]
+
+    def _pool(self):
+        if self.pool is None:
+            self.pool = concurrent.futures.ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('spawn'))
+        return self.pool
+
+    async def close(self):
+        for worker in self.workers:
+            worker.cancel()
+        self.workers = []
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    def submit(self, source, directory, kind, target=None):
+        if source in self.jobs:
+            return self.jobs[source]
+        job = ClipJob(source, directory, kind, target)
+        job.owner = self.owners.pop(source, None)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.metrics['rejected'] += 1
+            logging.warning(f"Clip pipeline is full, not processing {source}")
+            return None
+        self.start()
+        self.jobs[source] = job
+        job.move_task = asyncio.get_running_loop().create_task(self._move(job))
+        self.metrics['submitted'] += 1
+        return job
+
+    async def wait_moved(self, source, timeout=2.0):
+        # Where a saved file ends up; the event that submits it may trail the
+        # command that reported it. source itself when no job moves it in time
+        if source in self.destinations:
+            return self.destinations[source]
+        if source not in self.jobs and not (source and os.path.isfile(source)):
+            return source  # Written on another machine or already gone
+        future = asyncio.get_running_loop().create_future()
+        self.move_waiters.setdefault(source, []).append(future)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return self.destinations.get(source, source)
+        finally:
+            waiters = self.move_waiters.get(source)
+            if waiters and future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self.move_waiters[source]
+
+    async def _move(self, job):
+        loop = asyncio.get_running_loop()
+        try:
+            job.file_path = await loop.run_in_executor(self.executor, move_file, job.source, job.directory)
+        finally:
+            self.destinations[job.source] = job.file_path
+            while len(self.destinations) > self.queue.maxsize:
+                self.destinations.popitem(last=False)
+            for future in self.move_waiters.pop(job.source, []):
+                if not future.done():
+                    future.set_result(job.file_path)
+
+    def claim(self, source, instance_id, command_uid, artifact_id=None):
+        owner = (instance_id, command_uid, artifact_id)
+        job = self.jobs.get(source)
+        if job is not None:
+            job.owner = owner
+            # Stages that finished before the claim are reported to the owner now
+            finished = [(stage, result, None) for stage, result in job.results.items()]
+            finished += [(stage, None, error) for stage, error in job.errors.items()]
+            if finished and self.on_stage is not None:
+                asyncio.get_running_loop().create_task(self._catch_up(job, finished))
+            return job
+        self.owners[source] = owner
+        while len(self.owners) > self.queue.maxsize:
+            self.owners.popitem(last=False)
+        return None
+
+    async def _catch_up(self, job, finished):
+        for stage, result, error in finished:
+            await self.on_stage(job, stage, result, error)
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await job.move_task
+                await self._report(job, 'move', {'file_path': job.file_path}, None)
+                await asyncio.gather(*(self._run_stage(job, name, stage) for name, stage in self.stages.items()))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Clip job for {job.source} failed: {e}")
+                await self._report(job, 'move', None, str(e))
+            finally:
+                self.jobs.pop(job.source, None)
+            self.metrics['failed' if job.errors else 'completed'] += 1
+            if self.on_finished is not None:
+                await self.on_finished(job)
+
+    async def _run_stage(self, job, name, stage):
+        try:
+            result = await self.run_process(stage, job.file_path)
+        except Exception as e:
+            logging.error(f"Clip stage {name} failed for {job.file_path}: {e}")
+            await self._report(job, name, None, str(e) or type(e).__name__)
+        else:
+            await self._report(job, name, result, None)
+
+    async def run_process(self, stage, *arguments):
+        # At most `processes` stages run at a time; the rest wait in the pool
+        pool = self._pool()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, stage, *arguments)
+        except concurrent.futures.process.BrokenProcessPool:
+            # A worker died (killed, out of memory); the next stage gets a fresh pool
+            if self.pool is pool:
+                self.pool = None
+            raise RuntimeError("clip worker process died") from None
+
+    async def _report(self, job, stage, result, error):
+        if error is None:
+            job.results[stage] = result
+        else:
+            job.errors[stage] = error
+        if self.on_stage is not None:
+            await self.on_stage(job, stage, result, error)
+
+    def stats(self):
+        return {**self.metrics, 'queued': self.queue.qsize(), 'running': len(self.jobs) - self.queue.qsize()}
+
@@ -0,0 +1,158 @@
+import asyncio
+import datetime
+import logging
+import time
+
+import websockets
+
+import obs_metrics
+from obs_async import EventSubscription
+from obs_serializer import JSON
+
+# Categories a client may name instead of passing a raw EventSubscription bitmask
+EVENT_CATEGORIES = {
+    'General': EventSubscription.GENERAL,
+    'Config': EventSubscription.CONFIG,
+    'Scenes': EventSubscription.SCENES,
+    'Inputs': EventSubscription.INPUTS,
+    'Transitions': EventSubscription.TRANSITIONS,
+    'Filters': EventSubscription.FILTERS,
+    'Outputs': EventSubscription.OUTPUTS,
+    'SceneItems': EventSubscription.SCENE_ITEMS,
+    'MediaInputs': EventSubscription.MEDIA_INPUTS,
+    'Vendors': EventSubscription.VENDORS,
+    'Ui': EventSubscription.UI,
+    'All': EventSubscription.ALL,
+    'InputVolumeMeters': EventSubscription.INPUT_VOLUME_METERS,
+    'InputActiveStateChanged': EventSubscription.INPUT_ACTIVE_STATE_CHANGED,
+    'InputShowStateChanged': EventSubscription.INPUT_SHOW_STATE_CHANGED,
+    'SceneItemTransformChanged': EventSubscription.SCENE_ITEM_TRANSFORM_CHANGED,
+}
+
+
+def parse_event_subscriptions(value):
+    # Accepts a bitmask or a list of category names
+    if isinstance(value, int):
+        return value
+    mask = 0
+    for name in value:
+        if name not in EVENT_CATEGORIES:
+            raise ValueError(f"Unknown event category: {name}")
+        mask |= EVENT_CATEGORIES[name]
+    return mask
+
+
+class Subscriber:
+    def __init__(self, instance_id, websocket, mask, queue_size, serializer=JSON):
+        self.instance_id = instance_id
+        self.websocket = websocket
+        self.mask = mask
+        self.serializer = serializer
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.sent = 0
+        self.writer_task = None
+
+
+class EventBroadcaster:
+    """Pushes OBS events to the service clients that subscribed to them.
+
+    Each event is serialised once per wire format in use and the same encoded
+    message is queued for every matching subscriber. Every subscriber has its
+    own bounded queue drained by its own writer task, so a slow client only
+    loses its own events; one that drops more than `max_dropped` in a row is
+    disconnected.
+    """
+
+    def __init__(self, queue_size=256, max_dropped=1024, target=None):
+        self.target = target  # Name of the OBS target the events come from
+        self.queue_size = queue_size
+        self.max_dropped = max_dropped
+        self.subscribers = {}
+        self.client = None
+        self.metrics = {'events': 0, 'encoded': 0, 'delivered': 0, 'dropped': 0, 'slow_consumers': 0}
+
+    def attach(self, client):
+        self.detach()
+        self.client = client
+        client.register_raw_event(self.on_event)
+
+    def detach(self):
+        if self.client is not None:
+            self.client.unregister_raw_event(self.on_event)
+        self.client = None
+
+    def subscribe(self, instance_id, websocket, mask, serializer=JSON):
+        subscriber = self.subscribers.get(instance_id)
+        if subscriber is None:
+            subscriber = Subscriber(instance_id, websocket, mask, self.queue_size, serializer)
+            subscriber.writer_task = asyncio.get_running_loop().create_task(self._writer(subscriber))
+            self.subscribers[instance_id] = subscriber
+        subscriber.mask = mask
+        return subscriber
+
+    def unsubscribe(self, instance_id):
+        subscriber = self.subscribers.pop(instance_id, None)
+        if subscriber is not None:
+            subscriber.writer_task.cancel()
+
+    def subscribed_mask(self):
+        mask = 0
+        for subscriber in self.subscribers.values():
+            mask |= subscriber.mask
+        return mask
+
+    def on_event(self, data):
+        self.metrics['events'] += 1
+        intent = data.get('eventIntent', 0)
+        targets = [s for s in self.subscribers.values() if s.mask & intent]
+        if not targets:
+            return
+        event = {
+            'status': 'event',
+            'target': self.target,
+            'event_type': data.get('eventType'),
+            'event_intent': intent,
+            'data': data.get('eventData', {}),
+            'datetime': datetime.datetime.now().isoformat()
+        }
+        encoded = {}  # serializer -> message
+        received = time.perf_counter() if obs_metrics.registry is not None else None
+        for subscriber in targets:
+            message = encoded.get(subscriber.serializer)
+            if message is None:
+                message = encoded[subscriber.serializer] = subscriber.serializer.dumps(event)
+                self.metrics['encoded'] += 1
+            try:
+                subscriber.queue.put_nowait((message, received))
+                subscriber.dropped = 0
+            except asyncio.QueueFull:
+                subscriber.dropped += 1
+                self.metrics['dropped'] += 1
+                if subscriber.dropped > self.max_dropped:
+                    self._drop_slow_consumer(subscriber)
+
+    def _drop_slow_consumer(self, subscriber):
+        logging.warning(f"Disconnecting slow event subscriber {subscriber.instance_id}")
+        self.metrics['slow_consumers'] += 1
+        self.unsubscribe(subscriber.instance_id)
+        asyncio.get_running_loop().create_task(subscriber.websocket.close(1008, 'Slow event consumer'))
+
+    async def _writer(self, subscriber):
+        try:
+            while True:
+                message, received = await subscriber.queue.get()
+                await subscriber.websocket.send(message)
+                subscriber.sent += 1
+                self.metrics['delivered'] += 1
+                if received is not None:
+                    obs_metrics.registry.observe('obs_service_event_fanout_lag_seconds', time.perf_counter() - received, target=self.target)
+        except websockets.exceptions.ConnectionClosed:
+            self.subscribers.pop(subscriber.instance_id, None)
+
+    def stats(self):
+        return {
+            **self.metrics,
+            'subscribers': len(self.subscribers),
+            'queued': sum(s.queue.qsize() for s in self.subscribers.values()),
+        }
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import mimetypes
+import os
+import time
+
+from aiohttp import web
+
+CHUNK_SIZE = 256 * 1024  # Bytes read per step while following a growing file
+POLL_INTERVAL = 0.5  # Seconds between checks for new data in a growing file
+
+
+class PreparedFileResponse(web.FileResponse):
+    # aiohttp prepares the response a handler returns; FileResponse would send
+    # the file a second time
+    async def prepare(self, request):
+        if self.prepared:
+            return None
+        return await super().prepare(request)
+
+
+class ArtifactFileServer:
+    """Serves the files below a few named directories on /files/<root>/<path>.
+
+    Finished files go out through FileResponse, which uses sendfile and
+    answers Range requests, so clients can scrub. A recording still in
+    progress (`is_growing(path)` is true) or a file requested with ?follow=1,
+    when asked for without a Range, is followed instead: sent in chunks as OBS
+    appends to it until it has not grown for `growing_idle` seconds.
+    Downloads beyond the global or per-client limit are refused rather than
+    queued.
+    """
+
+    def __init__(self, roots, max_downloads=8, max_downloads_per_client=2, growing_idle=5.0, executor=None,
+                 is_growing=None):
+        self.roots = {name: os.path.realpath(directory) for name, directory in roots.items()}
+        self.max_downloads = max_downloads
+        self.max_downloads_per_client = max_downloads_per_client
+        self.growing_idle = growing_idle
+        self.executor = executor
+        self.is_growing = is_growing
+        self.serving = False  # Whether the routes are on a running server
+        self.active = 0
+        self.per_client = {}
+        self.metrics = {'downloads': 0, 'followed': 0, 'rejected': 0, 'not_found': 0}
+
+    def add_routes(self, app):
+        app.router.add_get('/files/{root}/{path:.+}', self.handle)
+        self.serving = True
+
+    def url_for(self, file_path):
+        # Path of the download route for a local file, None if it is not served
+        if not file_path or not self.serving:
+            return None
+        real = os.path.realpath(file_path)
+        for name, directory in self.roots.items():
+            if real.startswith(directory + os.sep):
+                return f"/files/{name}/{os.path.relpath(real, directory).replace(os.sep, '/')}"
+        return None
+
+    def resolve(self, root, path):
+        directory = self.roots.get(root)
+        if directory is None:
+            return None
+        real = os.path.realpath(os.path.join(directory, path))
+        # Refuse anything that escapes the root through .. or symlinks
+        if not real.startswith(directory + os.sep) or not os.path.isfile(real):
+            return None
+        return real
+
+    async def handle(self, request):
+        path = self.resolve(request.match_info['root'], request.match_info['path'])
+        if path is None:
+            self.metrics['not_found'] += 1
+            raise web.HTTPNotFound()
+        client = request.remote
+        if self.active >= self.max_downloads or self.per_client.get(client, 0) >= self.max_downloads_per_client:
+            self.metrics['rejected'] += 1
+            raise web.HTTPServiceUnavailable(headers={'Retry-After': '1'}, text='Too many concurrent downloads')
+        self.active += 1
+        self.per_client[client] = self.per_client.get(client, 0) + 1
+        self.metrics['downloads'] += 1
+        try:
+            if request.method == 'GET' and 'Range' not in request.headers and (
+                    request.query.get('follow') == '1' or (self.is_growing is not None and self.is_growing(path))):
+                return await self.follow(request, path)
+            # Sent here rather than after the handler, so the slot is held for the whole transfer
+            response = PreparedFileResponse(path, chunk_size=CHUNK_SIZE)
+            await response.prepare(request)
+            return response
+        finally:
+            self.active -= 1
+            self.per_client[client] -= 1
+            if not self.per_client[client]:
+                del self.per_client[client]
+
+    async def follow(self, request, path):
+        # Length unknown up front, so the body is sent chunked
+        self.metrics['followed'] += 1
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        response = web.StreamResponse(headers={'Content-Type': content_type, 'Cache-Control': 'no-store'})
+        await response.prepare(request)
+        loop = asyncio.get_running_loop()
+        with open(path, 'rb') as f:
+            last_growth = time.monotonic()
+            while True:
+                chunk = await loop.run_in_executor(self.executor, f.read, CHUNK_SIZE)
+                if chunk:
+                    try:
+                        await response.write(chunk)
+                    except ConnectionResetError:
+                        logging.info(f"Client stopped following {path}")
+                        return response
+                    last_growth = time.monotonic()
+                elif time.monotonic() - last_growth >= self.growing_idle:
+                    break
+                else:
+                    await asyncio.sleep(POLL_INTERVAL)
+        await response.write_eof()
+        logging.info(f"Finished following {path}")
+        return response
+
+    def stats(self):
+        return {**self.metrics, 'active': self.active}
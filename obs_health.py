@@ -0,0 +1,221 @@
+import array
+import asyncio
+import datetime
+import logging
+import time
+
+# One ring per sampled value; counters are cumulative as OBS reports them.
+# Windows are measured in 'monotonic' seconds, 'time' is the wall clock for display
+SAMPLE_FIELDS = (
+    'time', 'monotonic', 'cpu_usage', 'memory_usage', 'disk_space', 'active_fps', 'frame_render_time',
+    'render_skipped', 'render_total', 'output_skipped', 'output_total',
+    'record_active', 'record_paused', 'record_bytes', 'record_duration',
+)
+
+# alert -> (rolling value it watches, whether it fires above or below the threshold)
+ALERTS = {
+    'dropped_frames': ('dropped_frame_rate', 'above'),
+    'render_lag': ('render_lag_rate', 'above'),
+    'frame_render_time': ('average_frame_render_time', 'above'),
+    'disk_space': ('disk_space', 'below'),
+    'bitrate': ('bitrate', 'below'),  # Only while recording
+}
+
+
+class RingBuffer:
+    """A fixed number of floats in one preallocated array; the oldest is overwritten first."""
+
+    def __init__(self, size):
+        self.data = array.array('d', bytes(8 * size))
+        self.size = size
+        self.count = 0
+        self.head = 0  # Next write position
+
+    def __len__(self):
+        return self.count
+
+    def append(self, value):
+        self.data[self.head] = value
+        self.head = (self.head + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def __getitem__(self, index):
+        # 0 is the oldest value, -1 the newest
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return self.data[(self.head - self.count + index) % self.size]
+
+    def values(self):
+        start = (self.head - self.count) % self.size
+        if start + self.count <= self.size:
+            return self.data[start:start + self.count].tolist()
+        return self.data[start:].tolist() + self.data[:self.head].tolist()
+
+
+class HealthMonitor:
+    """Samples GetStats and GetRecordStatus of one OBS target every `interval` seconds.
+
+    Samples go into ring buffers holding the last `size` of them. Rolling
+    values (dropped-frame and render-lag rates, frame render time, bitrate,
+    disk space) cover the last `window` seconds. `thresholds` maps ALERTS
+    names to limits. The coroutine `on_alert(monitor, alert, raised, value,
+    threshold)` runs as a task of its own when a rolling value crosses a
+    limit and again when it recovers, so a slow client does not hold up
+    sampling.
+    """
+
+    def __init__(self, target, interval=2.0, size=300, window=30.0, thresholds=None, on_alert=None):
+        self.target = target
+        self.interval = interval
+        self.window = window
+        self.thresholds = thresholds or {}
+        self.on_alert = on_alert
+        self.rings = {field: RingBuffer(size) for field in SAMPLE_FIELDS}
+        self.raised = {}  # alert -> value when it was raised
+        self.alert_tasks = set()
+        self.task = None
+        self.failures = 0
+
+    def start(self):
+        if self.interval and self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while True:
+            if self.target.is_connected:
+                try:
+                    await self.sample()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.failures += 1
+                    logging.warning(f"Health sample of OBS target {self.target.name} failed: {e}")
+            # Absolute deadlines; a slow sample skips the ticks it overran
+            deadline += self.interval
+            now = loop.time()
+            if deadline < now:
+                deadline += (now - deadline) // self.interval * self.interval + self.interval
+            await asyncio.sleep(deadline - now)
+
+    async def sample(self):
+        stats, record = await self.target.call_batch([{'requestType': 'GetStats'}, {'requestType': 'GetRecordStatus'}])
+        if not stats['requestStatus']['result'] or not record['requestStatus']['result']:
+            raise RuntimeError("OBS refused the statistics requests")
+        stats = stats.get('responseData', {})
+        record = record.get('responseData', {})
+        values = {
+            'time': time.time(),
+            'monotonic': time.monotonic(),
+            'cpu_usage': stats.get('cpuUsage', 0.0),
+            'memory_usage': stats.get('memoryUsage', 0.0),
+            'disk_space': stats.get('availableDiskSpace', 0.0),
+            'active_fps': stats.get('activeFps', 0.0),
+            'frame_render_time': stats.get('averageFrameRenderTime', 0.0),
+            'render_skipped': stats.get('renderSkippedFrames', 0),
+            'render_total': stats.get('renderTotalFrames', 0),
+            'output_skipped': stats.get('outputSkippedFrames', 0),
+            'output_total': stats.get('outputTotalFrames', 0),
+            'record_active': bool(record.get('outputActive')),
+            'record_paused': bool(record.get('outputPaused')),
+            'record_bytes': record.get('outputBytes') or 0,
+            'record_duration': (record.get('outputDuration') or 0) / 1000,
+        }
+        for field, ring in self.rings.items():
+            ring.append(values[field])
+        self.check()
+
+    def _first_in_window(self):
+        times = self.rings['monotonic']
+        newest = times[-1]
+        first = len(times) - 1
+        while first > 0 and newest - times[first - 1] <= self.window:
+            first -= 1
+        return first
+
+    def _delta(self, field, first):
+        # Counters restart with OBS; a negative difference counts as no change
+        ring = self.rings[field]
+        return max(ring[-1] - ring[first], 0.0)
+
+    def rolling(self):
+        # Rolling values over the window, None before the first sample
+        times = self.rings['monotonic']
+        if not len(times):
+            return None
+        first = self._first_in_window()
+        elapsed = times[-1] - times[first]
+        output_total = self._delta('output_total', first)
+        render_total = self._delta('render_total', first)
+        render_times = self.rings['frame_render_time']
+        # Bitrate covers the part of the window the recording has been running
+        recording = len(times)
+        while recording > first and self.rings['record_active'][recording - 1] and not self.rings['record_paused'][recording - 1]:
+            recording -= 1
+        recorded = times[-1] - times[recording] if recording < len(times) - 1 else 0.0
+        bitrate = self._delta('record_bytes', recording) * 8 / recorded if recorded else None
+        disk_space = self.rings['disk_space'][-1]
+        return {
+            'window': elapsed,
+            'samples': len(times) - first,
+            'dropped_frame_rate': self._delta('output_skipped', first) / output_total if output_total else 0.0,
+            'render_lag_rate': self._delta('render_skipped', first) / render_total if render_total else 0.0,
+            'average_frame_render_time': sum(render_times[i] for i in range(first, len(times))) / (len(times) - first),
+            'active_fps': self.rings['active_fps'][-1],
+            'cpu_usage': self.rings['cpu_usage'][-1],
+            'memory_usage': self.rings['memory_usage'][-1],
+            'disk_space': disk_space,
+            'bitrate': bitrate,
+            # disk_space is in MB
+            'disk_time_left': disk_space * 1024 * 1024 * 8 / bitrate if bitrate else None,
+            'record_active': bool(self.rings['record_active'][-1]),
+            'record_duration': self.rings['record_duration'][-1],
+        }
+
+    def check(self):
+        rolling = self.rolling()
+        for alert, threshold in self.thresholds.items():
+            field, direction = ALERTS[alert]
+            value = rolling[field]
+            if value is None:
+                crossed = False
+            else:
+                crossed = value > threshold if direction == 'above' else value < threshold
+            if crossed == (alert in self.raised):
+                continue
+            if crossed:
+                self.raised[alert] = value
+                logging.warning(f"OBS target {self.target.name}: {alert} alert, {field} {value:.4g} {direction} {threshold}")
+            else:
+                del self.raised[alert]
+                logging.info(f"OBS target {self.target.name}: {alert} recovered")
+            if self.on_alert is not None:
+                task = asyncio.get_running_loop().create_task(self.on_alert(self, alert, crossed, value, threshold))
+                self.alert_tasks.add(task)
+                task.add_done_callback(self._alert_done)
+
+    def _alert_done(self, task):
+        self.alert_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Health alert handler of OBS target {self.target.name} failed: {task.exception()}")
+
+    def report(self, history=False):
+        times = self.rings['time']
+        report = {
+            'interval': self.interval,
+            'sampled_at': datetime.datetime.fromtimestamp(times[-1]).isoformat() if len(times) else None,
+            'rolling': self.rolling(),
+            'alerts': dict(self.raised),
+            'failures': self.failures,
+        }
+        if history:
+            report['history'] = {field: ring.values() for field, ring in self.rings.items()}
+        return report
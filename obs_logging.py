@@ -0,0 +1,132 @@
+import atexit
+import datetime
+import glob
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+
+# Attributes passed with extra={...} that are copied into the JSON record
+STRUCTURED_FIELDS = ('instance_id', 'command_uid', 'command', 'target', 'status', 'timings', 'suppressed')
+
+
+class JsonFormatter(logging.Formatter):
+    # One compact JSON object per line; runs in the listener thread
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+        for name in STRUCTURED_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Lets at most `burst` records per call site through every `interval`.
+
+    Sampling is per logging call site, since messages are pre-formatted
+    f-strings. Warnings and errors always pass. The first record let through
+    after a quiet spell carries the number of records that were suppressed.
+    """
+
+    def __init__(self, burst=20, interval=1.0):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.sites = {}  # (pathname, lineno) -> [window_start, passed, suppressed]
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        now = time.monotonic()
+        site = self.sites.get((record.pathname, record.lineno))
+        if site is None or now - site[0] >= self.interval:
+            suppressed = site[2] if site is not None else 0
+            self.sites[(record.pathname, record.lineno)] = [now, 1, 0]
+            if suppressed:
+                record.suppressed = suppressed
+            return True
+        if site[1] < self.burst:
+            site[1] += 1
+            return True
+        site[2] += 1
+        return False
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    # The queue never leaves the process, so the record is handed over as is
+    # and all formatting happens in the listener thread
+    def prepare(self, record):
+        return record
+
+
+class RotatingLogFileHandler(logging.handlers.BaseRotatingHandler):
+    """Writes `<directory>/<name>.log`, rotating it when it grows past
+    `max_bytes` or gets older than `max_age` seconds. Rotated files are named
+    `<name>-<timestamp>.log`; only the newest `backup_count` are kept.
+    """
+
+    def __init__(self, directory, name='service', max_bytes=50 * 1024 * 1024, max_age=24 * 3600, backup_count=14):
+        self.directory = directory
+        self.name_stem = name
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backup_count = backup_count
+        super().__init__(os.path.join(directory, f"{name}.log"), 'a', encoding='utf-8')
+        self.opened_at = time.time()
+
+    def shouldRollover(self, record):
+        if self.stream is None:
+            return False
+        if self.max_age and time.time() - self.opened_at >= self.max_age:
+            return True
+        return bool(self.max_bytes) and self.stream.tell() >= self.max_bytes
+
+    def doRollover(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        stamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+        target = os.path.join(self.directory, f"{self.name_stem}-{stamp}.log")
+        counter = 1
+        while os.path.exists(target):
+            target = os.path.join(self.directory, f"{self.name_stem}-{stamp}-{counter}.log")
+            counter += 1
+        if os.path.exists(self.baseFilename):
+            os.rename(self.baseFilename, target)
+        rotated = sorted(glob.glob(os.path.join(self.directory, f"{self.name_stem}-*.log")), key=os.path.getmtime)
+        for old in rotated[:max(len(rotated) - self.backup_count, 0)]:
+            os.remove(old)
+        self.stream = self._open()
+        self.opened_at = time.time()
+
+
+def setup_async_logging(directory, level=logging.INFO, max_bytes=50 * 1024 * 1024, max_age=24 * 3600,
+                        backup_count=14, sample_burst=20, sample_interval=1.0):
+    # The calling thread only filters and enqueues; a QueueListener thread
+    # formats, writes the rotating JSON log and echoes to the console
+    os.makedirs(directory, exist_ok=True)
+    file_handler = RotatingLogFileHandler(directory, max_bytes=max_bytes, max_age=max_age, backup_count=backup_count)
+    file_handler.setFormatter(JsonFormatter())
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+
+    records = queue.SimpleQueue()
+    handler = DeferredQueueHandler(records)
+    handler.addFilter(SamplingFilter(burst=sample_burst, interval=sample_interval))
+    listener = logging.handlers.QueueListener(records, file_handler, console, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(handler)
+    return listener
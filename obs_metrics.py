@@ -0,0 +1,131 @@
+import bisect
+import contextvars
+
+from command_registry import LATENCY_BUCKETS
+
+# Prometheus text exposition format served on /metrics
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+registry = None  # Set by enable(); every instrumentation point is skipped while None
+
+# Per-command accumulator of the time spent waiting on OBS, inherited by the
+# tasks a handler spawns
+command_timer = contextvars.ContextVar('command_timer', default=None)
+
+
+class CommandTimer:
+    __slots__ = ('obs',)
+
+    def __init__(self):
+        self.obs = 0.0
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def format_labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class MetricsRegistry:
+    """Counters, histograms and callback gauges rendered in Prometheus format.
+
+    Gauges are collected at scrape time from callables returning a number or
+    a {labels tuple: number} dict, so nothing is updated on the hot path.
+    """
+
+    def __init__(self):
+        self.descriptions = {}  # name -> (type, help)
+        self.counters = {}  # name -> {labels: value}
+        self.histograms = {}  # name -> {labels: Histogram}
+        self.gauges = {}  # name -> collect()
+
+    def describe(self, name, kind, help_text):
+        self.descriptions[name] = (kind, help_text)
+
+    def inc(self, name, amount=1, **labels):
+        series = self.counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        series = self.histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+        histogram.observe(value)
+
+    def gauge(self, name, help_text, collect):
+        self.describe(name, 'gauge', help_text)
+        self.gauges[name] = collect
+
+    def observe_command(self, command, queue, obs, serialize, total):
+        # One histogram, split by phase; 'handler' is what is left of the total
+        self.observe('obs_service_command_seconds', queue, command=command, phase='queue')
+        self.observe('obs_service_command_seconds', obs, command=command, phase='obs')
+        self.observe('obs_service_command_seconds', serialize, command=command, phase='serialize')
+        self.observe('obs_service_command_seconds', max(total - queue - obs - serialize, 0.0), command=command, phase='handler')
+        self.observe('obs_service_command_seconds', total, command=command, phase='total')
+
+    def render(self):
+        lines = []
+        for name, collect in self.gauges.items():
+            self._header(lines, name)
+            value = collect()
+            for labels, number in (value.items() if isinstance(value, dict) else (((), value),)):
+                lines.append(f"{name}{format_labels(labels)} {number}")
+        for name, series in self.counters.items():
+            self._header(lines, name)
+            for labels, number in series.items():
+                lines.append(f"{name}{format_labels(labels)} {number}")
+        for name, series in self.histograms.items():
+            self._header(lines, name)
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{format_labels(labels, (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_bucket{format_labels(labels, (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def _header(self, lines, name):
+        kind, help_text = self.descriptions.get(name, ('untyped', ''))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+
+def enable():
+    global registry
+    if registry is None:
+        registry = MetricsRegistry()
+        registry.describe('obs_service_command_seconds', 'histogram', 'Service command latency by phase: queue, obs, serialize, handler, total')
+        registry.describe('obs_service_obs_request_seconds', 'histogram', 'OBS request round-trip time by request type')
+        registry.describe('obs_service_event_fanout_lag_seconds', 'histogram', 'Time from an OBS event arriving to it being written to a subscriber')
+        registry.describe('obs_service_commands_total', 'counter', 'Service commands processed, by command and status')
+    return registry
+
+
+def start_command():
+    # Called at the start of a command's task; returns None while disabled
+    if registry is None:
+        return None
+    timer = CommandTimer()
+    command_timer.set(timer)
+    return timer
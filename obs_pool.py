@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import time
+
+
+class PooledSession:
+    def __init__(self, key, client, handshake_time):
+        self.key = key
+        self.client = client
+        self.refcount = 0
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.last_health_check = self.created_at
+        self.handshake_time = handshake_time
+
+
+class OBSConnectionPool:
+    """Process-wide pool of identified OBS sessions keyed by (host, port, password).
+
+    `factory(host, port, password)` must be a coroutine function returning a
+    connected client, `closer(client)` a coroutine function tearing it down and
+    `health_check(client)` a coroutine function raising if the session is dead.
+    """
+
+    def __init__(self, factory, closer, health_check=None, idle_timeout=300.0, health_interval=30.0):
+        self.factory = factory
+        self.closer = closer
+        self.health_check = health_check
+        self.idle_timeout = idle_timeout
+        self.health_interval = health_interval
+        self.sessions = {}
+        self.locks = {}
+        self.eviction_task = None
+        self.metrics = {
+            "hits": 0,
+            "misses": 0,
+            "handshakes": 0,
+            "handshake_time_total": 0.0,
+            "handshake_time_max": 0.0,
+            "handshake_failures": 0,
+            "health_check_failures": 0,
+            "evictions": 0,
+        }
+
+    def _lock_for(self, key):
+        lock = self.locks.get(key)
+        if lock is None:
+            lock = self.locks[key] = asyncio.Lock()
+        return lock
+
+    async def acquire(self, host, port, password):
+        key = (host, port, password)
+        # Serialise per key so concurrent first-time clients share one handshake
+        async with self._lock_for(key):
+            session = self.sessions.get(key)
+            if session is not None and not await self._is_healthy(session):
+                await self._close_session(session)
+                session = None
+            if session is None:
+                self.metrics["misses"] += 1
+                session = await self._open_session(key)
+                self.sessions[key] = session
+            else:
+                self.metrics["hits"] += 1
+            session.refcount += 1
+            session.last_used = time.monotonic()
+            return session.client
+
+    async def release(self, client):
+        for session in self.sessions.values():
+            if session.client is client:
+                session.refcount = max(0, session.refcount - 1)
+                session.last_used = time.monotonic()
+                return
+        logging.warning("Released an OBS client that is not managed by the pool")
+
+    async def _open_session(self, key):
+        host, port, password = key
+        started = time.perf_counter()
+        try:
+            client = await self.factory(host, port, password)
+        except Exception:
+            self.metrics["handshake_failures"] += 1
+            raise
+        elapsed = time.perf_counter() - started
+        self.metrics["handshakes"] += 1
+        self.metrics["handshake_time_total"] += elapsed
+        self.metrics["handshake_time_max"] = max(self.metrics["handshake_time_max"], elapsed)
+        logging.info(f"Opened pooled OBS session to {host}:{port} in {elapsed * 1000:.1f} ms")
+        return PooledSession(key, client, elapsed)
+
+    async def _is_healthy(self, session):
+        # A session whose socket is gone is never handed out again
+        if not session.client.is_connected:
+            return False
+        if self.health_check is None:
+            return True
+        now = time.monotonic()
+        if now - session.last_health_check < self.health_interval:
+            return True
+        try:
+            await self.health_check(session.client)
+        except Exception as e:
+            self.metrics["health_check_failures"] += 1
+            logging.warning(f"Pooled OBS session to {session.key[0]}:{session.key[1]} failed health check: {e}")
+            return False
+        session.last_health_check = now
+        return True
+
+    async def _close_session(self, session):
+        if self.sessions.get(session.key) is session:
+            del self.sessions[session.key]
+        try:
+            await self.closer(session.client)
+        except Exception as e:
+            logging.warning(f"Error closing pooled OBS session: {e}")
+
+    async def evict_idle(self):
+        now = time.monotonic()
+        for key, session in list(self.sessions.items()):
+            if session.refcount > 0 or now - session.last_used < self.idle_timeout:
+                continue
+            async with self._lock_for(key):
+                # Re-check under the lock, a client may have grabbed it meanwhile
+                if session.refcount > 0 or self.sessions.get(key) is not session:
+                    continue
+                self.metrics["evictions"] += 1
+                logging.info(f"Evicting idle OBS session to {key[0]}:{key[1]}")
+                await self._close_session(session)
+
+    async def _eviction_loop(self):
+        interval = max(1.0, min(self.idle_timeout, self.health_interval) / 2)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.evict_idle()
+            except Exception as e:
+                logging.error(f"OBS pool eviction failed: {e}")
+
+    def start(self):
+        if self.eviction_task is None:
+            self.eviction_task = asyncio.get_running_loop().create_task(self._eviction_loop())
+
+    async def close(self):
+        if self.eviction_task is not None:
+            self.eviction_task.cancel()
+            self.eviction_task = None
+        for session in list(self.sessions.values()):
+            await self._close_session(session)
+
+    def stats(self):
+        handshakes = self.metrics["handshakes"]
+        return {
+            **self.metrics,
+            "handshake_time_avg": self.metrics["handshake_time_total"] / handshakes if handshakes else 0.0,
+            "sessions": [
+                {
+                    "host": session.key[0],
+                    "port": session.key[1],
+                    "refcount": session.refcount,
+                    "age": time.monotonic() - session.created_at,
+                    "idle": time.monotonic() - session.last_used,
+                }
+                for session in self.sessions.values()
+            ],
+        }
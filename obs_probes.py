@@ -0,0 +1,45 @@
+import logging
+import time
+
+from aiohttp import web
+
+
+class Readiness:
+    """Liveness and readiness probes for container orchestration.
+
+    /healthz answers 200 whenever the event loop is running. /readyz answers
+    200 once the service is listening and `check()` reports OBS reachable,
+    503 otherwise; `check()` returns (ready, details) and the details go in
+    the body either way. The first time the service is found ready, the
+    seconds since `started` are kept as time_to_ready.
+    """
+
+    def __init__(self, check, started=None):
+        self.check = check
+        self.started = started if started is not None else time.monotonic()
+        self.listening = False
+        self.time_to_ready = None
+
+    def add_routes(self, app):
+        app.router.add_get('/healthz', self.handle_healthz)
+        app.router.add_get('/readyz', self.handle_readyz)
+
+    def update(self):
+        ready, details = self.check()
+        ready = ready and self.listening
+        if ready and self.time_to_ready is None:
+            self.time_to_ready = time.monotonic() - self.started
+            logging.info(f"Service ready {self.time_to_ready:.3f}s after start")
+        return ready, details
+
+    async def handle_healthz(self, request):
+        return web.json_response({'status': 'ok', 'uptime': time.monotonic() - self.started})
+
+    async def handle_readyz(self, request):
+        ready, details = self.update()
+        return web.json_response({
+            'status': 'ready' if ready else 'not ready',
+            'listening': self.listening,
+            'time_to_ready': self.time_to_ready,
+            **details,
+        }, status=200 if ready else 503)
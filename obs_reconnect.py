@@ -0,0 +1,94 @@
+import asyncio
+import collections
+import random
+
+# OBS requests that may be sent again when the session drops before their
+# response arrives; any Get* request is read-only and safe as well
+IDEMPOTENT_REQUESTS = {
+    'SetRecordDirectory',
+    'SaveSourceScreenshot',
+    'SetCurrentProgramScene',
+    'SetProfileParameter',
+}
+
+# Read-only requests whose every call must reach OBS: each one samples a new
+# moment (burst frames requested in the same tick must not share an image)
+UNCOALESCED_REQUESTS = {
+    'GetSourceScreenshot',
+}
+
+
+def is_read_only(request_type):
+    return request_type.startswith('Get')
+
+
+def is_coalescable(request_type):
+    # Identical calls in flight at the same time may share one OBS request
+    return is_read_only(request_type) and request_type not in UNCOALESCED_REQUESTS
+
+
+def is_idempotent(request_type):
+    return is_read_only(request_type) or request_type in IDEMPOTENT_REQUESTS
+
+
+def backoff_delays(base=0.5, cap=30.0, factor=2.0):
+    # Exponential backoff with full jitter, so a rack of services does not
+    # reconnect to a restarted OBS in lockstep
+    attempt = 0
+    while True:
+        yield random.uniform(0, min(cap, base * factor ** attempt))
+        attempt += 1
+
+
+class ReplayQueue:
+    """Requests parked while their OBS session is down.
+
+    Waiters are released in arrival order once the session is back, or fail
+    with ConnectionError when their deadline passes or the queue is full.
+    """
+
+    def __init__(self, max_size=256, deadline=5.0):
+        self.max_size = max_size
+        self.deadline = deadline
+        self.waiters = collections.deque()
+        self.metrics = {'held': 0, 'released': 0, 'expired': 0, 'rejected': 0}
+
+    def new_deadline(self):
+        return asyncio.get_running_loop().time() + self.deadline
+
+    async def wait(self, deadline):
+        if len(self.waiters) >= self.max_size:
+            self.metrics['rejected'] += 1
+            raise ConnectionError("OBS is reconnecting and the replay queue is full")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.waiters.append(future)
+        self.metrics['held'] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            self.metrics['expired'] += 1
+            raise ConnectionError(f"OBS did not reconnect within {self.deadline}s") from None
+        finally:
+            if not future.done():
+                future.cancel()
+            try:
+                self.waiters.remove(future)
+            except ValueError:
+                pass
+
+    def release(self):
+        while self.waiters:
+            future = self.waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                self.metrics['released'] += 1
+
+    def fail(self, error):
+        while self.waiters:
+            future = self.waiters.popleft()
+            if not future.done():
+                future.set_exception(error)
+
+    def stats(self):
+        return {**self.metrics, 'waiting': len(self.waiters)}
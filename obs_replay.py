@@ -0,0 +1,104 @@
+import asyncio
+import collections
+import logging
+import time
+
+from obs_state import OUTPUT_STARTED, OUTPUT_STOPPED
+
+
+class ReplayBufferSaver:
+    """Routes ReplayBufferSaved events to pending SaveReplayBuffer requests.
+
+    One pair of event handlers lives as long as the OBS session. OBS completes
+    saves in the order they were requested, so pending saves form a FIFO queue
+    and each event resolves the oldest one still waiting. A save that timed
+    out or was cancelled leaves the queue, so an event OBS never sends cannot
+    hold up the saves after it.
+    """
+
+    def __init__(self, timeout=10.0):
+        self.timeout = timeout
+        self.client = None
+        self.pending = collections.deque()
+        self.started_at = None
+        self.max_seconds = None
+
+    def attach(self, client):
+        self.detach()
+        self.client = client
+        client.register_event(self.on_saved, 'ReplayBufferSaved')
+        client.register_event(self.on_state_changed, 'ReplayBufferStateChanged')
+
+    def detach(self):
+        if self.client is not None:
+            self.client.unregister_event(self.on_saved, 'ReplayBufferSaved')
+            self.client.unregister_event(self.on_state_changed, 'ReplayBufferStateChanged')
+        self.client = None
+        self.max_seconds = None
+        while self.pending:
+            future = self.pending.popleft()
+            if not future.done():
+                future.set_exception(ConnectionError("OBS session closed before the replay buffer was saved"))
+
+    def on_saved(self, event_type, event_data):
+        saved_path = event_data.get('savedReplayPath')
+        while self.pending:
+            future = self.pending.popleft()
+            if not future.done():
+                future.set_result(saved_path)
+                return
+        logging.info(f"Replay buffer saved outside of the service at: {saved_path}")
+
+    def on_state_changed(self, event_type, event_data):
+        state = event_data.get('outputState')
+        if state == OUTPUT_STARTED:
+            self.started_at = time.monotonic()
+        elif state == OUTPUT_STOPPED:
+            self.started_at = None
+
+    async def get_max_seconds(self):
+        if self.max_seconds is None:
+            if self.client is None:
+                raise ConnectionError("Not connected to OBS Studio")
+            mode = await self.client.call('GetProfileParameter', {'parameterCategory': 'Output', 'parameterName': 'Mode'})
+            category = 'AdvOut' if mode.get('parameterValue') == 'Advanced' else 'SimpleOutput'
+            value = await self.client.call('GetProfileParameter', {'parameterCategory': category, 'parameterName': 'RecRBTime'})
+            self.max_seconds = float(value.get('parameterValue') or value.get('defaultParameterValue') or 0)
+        return self.max_seconds
+
+    async def clip_duration(self):
+        try:
+            max_seconds = await self.get_max_seconds()
+        except Exception as e:
+            logging.warning(f"Could not read replay buffer length: {e}")
+            max_seconds = 0.0
+        if self.started_at is None:
+            return max_seconds
+        buffered = time.monotonic() - self.started_at
+        return min(buffered, max_seconds) if max_seconds else buffered
+
+    async def save(self):
+        # Returns (saved_path, clip_duration_seconds)
+        # Detached while the target reconnects; SaveReplayBuffer is not replayed
+        if self.client is None:
+            raise ConnectionError("Not connected to OBS Studio")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append(future)
+        # The buffer length lookup overlaps with the save instead of delaying it
+        duration_task = loop.create_task(self.clip_duration())
+        try:
+            await self.client.call('SaveReplayBuffer')
+            saved_path = await asyncio.wait_for(future, self.timeout)
+        except BaseException as e:
+            duration_task.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                raise TimeoutError(f"No ReplayBufferSaved event within {self.timeout} seconds")
+            raise
+        finally:
+            # Refused, timed out or cancelled: the next event is not this save's
+            if not future.done():
+                future.cancel()
+            if future in self.pending:
+                self.pending.remove(future)
+        return saved_path, await duration_task
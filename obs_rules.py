@@ -0,0 +1,279 @@
+import asyncio
+import datetime
+import hmac
+import logging
+import math
+import time
+import uuid
+
+
+class Timer:
+    __slots__ = ('when', 'tick', 'callback', 'args', 'cancelled')
+
+    def __init__(self, when, tick, callback, args):
+        self.when = when  # Event loop time
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+
+class TimerWheel:
+    """Hashed timing wheel: many timers driven by one event loop callback.
+
+    A timer lands in slot `tick % size`, a tick being `resolution` seconds of
+    loop time, so adding and cancelling are O(1) however many timers exist.
+    Only the earliest due slot is armed with `loop.call_at`; timers more than
+    one revolution away wake the wheel once per revolution, never per timer.
+    """
+
+    def __init__(self, resolution=0.001, size=4096):
+        self.resolution = resolution
+        self.size = size
+        self.slots = [{} for _ in range(size)]  # timer -> None, ordered and O(1) to remove from
+        self.count = 0
+        self.loop = None
+        self.position = None  # First tick not processed yet
+        self.handle = None
+        self.armed_tick = None
+
+    def __len__(self):
+        return self.count
+
+    def call_at(self, when, callback, *args):
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+            self.position = math.floor(self.loop.time() / self.resolution)
+        # Rounded up, so a timer never fires before its time
+        tick = max(math.ceil(when / self.resolution), self.position)
+        timer = Timer(when, tick, callback, args)
+        self.slots[tick % self.size][timer] = None
+        self.count += 1
+        self._arm(tick)
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(asyncio.get_running_loop().time() + delay, callback, *args)
+
+    def cancel(self, timer):
+        if timer.cancelled:
+            return
+        timer.cancelled = True
+        slot = self.slots[timer.tick % self.size]
+        if timer in slot:
+            del slot[timer]
+            self.count -= 1
+        # An armed wake-up for a slot left empty is harmless; it finds nothing to fire
+
+    def _arm(self, tick):
+        if self.handle is not None and self.armed_tick <= tick:
+            return
+        if self.handle is not None:
+            self.handle.cancel()
+        self.armed_tick = tick
+        self.handle = self.loop.call_at(tick * self.resolution, self._advance)
+
+    def _advance(self):
+        self.handle = None
+        current = math.floor(self.loop.time() / self.resolution)
+        due = []
+        # After a stall longer than a revolution every slot is visited once
+        for tick in range(max(self.position, current - self.size + 1), current + 1):
+            slot = self.slots[tick % self.size]
+            for timer in [timer for timer in slot if timer.tick <= current]:
+                del slot[timer]
+                due.append(timer)
+        self.position = max(self.position, current + 1)
+        self.count -= len(due)
+        due.sort(key=lambda timer: timer.when)
+        for timer in due:
+            timer.cancelled = True
+            try:
+                timer.callback(*timer.args)
+            except Exception as e:
+                logging.error(f"Timer callback failed: {e}")
+        self._arm_next()
+
+    def _arm_next(self):
+        # Callbacks may have armed the wheel for their new timer, which need
+        # not be the earliest one
+        if not self.count:
+            return
+        for tick in range(self.position, self.position + self.size):
+            if any(timer.tick == tick for timer in self.slots[tick % self.size]):
+                self._arm(tick)
+                return
+        # Only timers beyond this revolution: look again one revolution later
+        self._arm(self.position + self.size)
+
+
+class Rule:
+    def __init__(self, owner, command_uid, target, steps, at=None, every=None, count=None,
+                 event_type=None, event_data=None, cooldown=0.0, owner_key=None):
+        self.rule_id = uuid.uuid4().hex[:8]
+        self.owner = owner  # instance_id of the client that registered the rule; it may be gone
+        self.owner_key = owner_key  # Secret a reconnected owner proves itself with; never described
+        self.command_uid = command_uid  # Firings are reported under the ADD_RULE command_uid
+        self.target = target
+        self.steps = steps  # [{'command': ..., 'parameter': {...}}], run in order
+        self.at = at  # Loop time of the first firing of a timed rule
+        self.every = every
+        self.remaining = count if count is not None else (None if every or event_type else 1)
+        self.event_type = event_type
+        self.event_data = event_data or {}
+        self.cooldown = cooldown
+        self.created = datetime.datetime.now().isoformat()
+        self.timer = None
+        self.task = None
+        self.last_fired = None
+        self.fired = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def has_key(self, owner_key):
+        return owner_key is not None and self.owner_key is not None and hmac.compare_digest(owner_key.encode(), self.owner_key.encode())
+
+    def is_owned_by(self, instance_id, owner_key=None):
+        return self.owner == instance_id or self.has_key(owner_key)
+
+    def matches(self, event_data):
+        return all(event_data.get(key) == value for key, value in self.event_data.items())
+
+    def describe(self, loop_time):
+        next_run = None
+        if self.timer is not None:
+            next_run = datetime.datetime.fromtimestamp(time.time() + self.timer.when - loop_time).isoformat()
+        return {
+            'rule_id': self.rule_id,
+            'owner': self.owner,
+            'command_uid': self.command_uid,
+            'target': self.target,
+            'steps': self.steps,
+            'every': self.every,
+            'event_type': self.event_type,
+            'event_data': self.event_data,
+            'cooldown': self.cooldown,
+            'remaining': self.remaining,
+            'next_run': next_run,
+            'fired': self.fired,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'created': self.created,
+        }
+
+
+class RuleEngine:
+    """Runs client rules on the service's event loop.
+
+    A rule fires at a loop time (`at`, repeating `every` seconds, at most
+    `remaining` times) or whenever an OBS event of `event_type` whose data
+    contains `event_data` arrives from its target. Timed rules sit in one
+    TimerWheel, event rules in a table keyed by (target, event_type), so
+    nothing is polled. Repeating deadlines are absolute: a late firing does
+    not shift the ones after it, and a rule still running when it is due
+    again skips that firing. `run(rule, lateness)` is the coroutine that
+    executes a firing; it returns False when the firing failed.
+    """
+
+    def __init__(self, run, resolution=0.001, wheel_size=4096):
+        self.run = run
+        self.wheel = TimerWheel(resolution=resolution, size=wheel_size)
+        self.rules = {}  # rule_id -> rule
+        self.by_event = {}  # (target, event_type) -> {rule_id: rule}
+        self.metrics = {'added': 0, 'fired': 0, 'skipped': 0, 'failed': 0}
+
+    def add(self, rule):
+        self.rules[rule.rule_id] = rule
+        self.metrics['added'] += 1
+        if rule.event_type:
+            self.by_event.setdefault((rule.target, rule.event_type), {})[rule.rule_id] = rule
+        else:
+            rule.timer = self.wheel.call_at(rule.at, self._due, rule, rule.at)
+        return rule
+
+    def remove(self, rule_id):
+        rule = self.rules.pop(rule_id, None)
+        if rule is None:
+            return None
+        if rule.timer is not None:
+            self.wheel.cancel(rule.timer)
+            rule.timer = None
+        if rule.event_type:
+            handlers = self.by_event.get((rule.target, rule.event_type), {})
+            handlers.pop(rule_id, None)
+            if not handlers:
+                self.by_event.pop((rule.target, rule.event_type), None)
+        if rule.task is not None:
+            rule.task.cancel()
+        return rule
+
+    def owned_by_key(self, owner_key):
+        return [rule for rule in self.rules.values() if rule.has_key(owner_key)]
+
+    def remove_target(self, target):
+        for rule in self.on_target(target):
+            self.remove(rule.rule_id)
+
+    def on_target(self, target):
+        return [rule for rule in self.rules.values() if rule.target == target]
+
+    def on_event(self, target, data):
+        rules = self.by_event.get((target.name, data.get('eventType')))
+        if not rules:
+            return
+        event_data = data.get('eventData', {})
+        now = asyncio.get_running_loop().time()
+        for rule in list(rules.values()):
+            if not rule.matches(event_data):
+                continue
+            if rule.last_fired is not None and now - rule.last_fired < rule.cooldown:
+                rule.skipped += 1
+                self.metrics['skipped'] += 1
+                continue
+            self._fire(rule, now)
+
+    def _due(self, rule, deadline):
+        rule.timer = None
+        loop = asyncio.get_running_loop()
+        self._fire(rule, deadline)
+        if rule.every and rule.rule_id in self.rules and rule.remaining != 0:
+            deadline += rule.every
+            now = loop.time()
+            if deadline < now:
+                # Behind schedule: deadlines already missed are skipped, not replayed
+                missed = math.ceil((now - deadline) / rule.every)
+                rule.skipped += missed
+                self.metrics['skipped'] += missed
+                deadline += missed * rule.every
+            rule.timer = self.wheel.call_at(deadline, self._due, rule, deadline)
+
+    def _fire(self, rule, deadline):
+        loop = asyncio.get_running_loop()
+        if rule.task is not None and not rule.task.done():
+            rule.skipped += 1
+            self.metrics['skipped'] += 1
+            return
+        rule.last_fired = loop.time()
+        if rule.remaining is not None:
+            rule.remaining -= 1
+        rule.task = loop.create_task(self._run(rule, rule.last_fired - deadline))
+
+    async def _run(self, rule, lateness):
+        rule.fired += 1
+        self.metrics['fired'] += 1
+        try:
+            succeeded = await self.run(rule, lateness)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Rule {rule.rule_id} failed: {e}")
+            succeeded = False
+        if not succeeded:
+            rule.failed += 1
+            self.metrics['failed'] += 1
+        if rule.remaining == 0 and self.rules.get(rule.rule_id) is rule:
+            rule.task = None  # Finished, nothing to cancel
+            self.remove(rule.rule_id)
+
+    def stats(self):
+        return {**self.metrics, 'rules': len(self.rules), 'timers': len(self.wheel)}
@@ -0,0 +1,79 @@
+import json
+import logging
+import marshal
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, stdlib json is used without it
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, without it only JSON is offered
+    msgpack = None
+
+
+class Serializer:
+    """Encodes messages for one wire format.
+
+    `binary` serializers produce bytes sent as binary WebSocket frames, the
+    others produce str sent as text frames. `loads` accepts str or bytes.
+    """
+
+    def __init__(self, name, dumps, loads, binary):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+        self.binary = binary
+
+    def __repr__(self):
+        return f"Serializer({self.name!r})"
+
+
+if orjson is not None:
+    JSON = Serializer('json', lambda obj: orjson.dumps(obj).decode(), orjson.loads, binary=False)
+else:
+    JSON = Serializer('json', json.dumps, json.loads, binary=False)
+
+if msgpack is not None:
+    MSGPACK = Serializer('msgpack', msgpack.packb, lambda data: msgpack.unpackb(data, raw=False), binary=True)
+else:
+    MSGPACK = None
+
+SERIALIZERS = {s.name: s for s in (JSON, MSGPACK) if s is not None}
+
+# Owner <-> front-end worker channel only, never offered to clients: the
+# workers decode and encode the client's own format, so the owner's loop
+# only pays for marshal
+IPC = Serializer('ipc', marshal.dumps, marshal.loads, binary=True)
+
+# Subprotocols offered to service clients; a client that asks for none gets JSON
+CLIENT_SUBPROTOCOL_PREFIX = 'obs-service.'
+CLIENT_SUBPROTOCOLS = [CLIENT_SUBPROTOCOL_PREFIX + name for name in SERIALIZERS]
+
+# Subprotocols of obs-websocket itself (see readme.md, Connection steps)
+OBS_SUBPROTOCOL_PREFIX = 'obswebsocket.'
+
+
+def for_subprotocol(subprotocol, prefix=CLIENT_SUBPROTOCOL_PREFIX):
+    if subprotocol and subprotocol.startswith(prefix):
+        return SERIALIZERS.get(subprotocol[len(prefix):], JSON)
+    return JSON
+
+
+def select_subprotocol(connection, subprotocols):
+    # websockets server hook; clients that offer no known subprotocol get JSON
+    # instead of being refused
+    for subprotocol in subprotocols:
+        if subprotocol in CLIENT_SUBPROTOCOLS:
+            return subprotocol
+    return None
+
+
+def get_serializer(name):
+    # Falls back to JSON when the requested backend is not installed
+    serializer = SERIALIZERS.get(name)
+    if serializer is None:
+        logging.warning(f"Serializer {name} is not available, using json")
+        return JSON
+    return serializer
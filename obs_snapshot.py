@@ -0,0 +1,86 @@
+import asyncio
+import binascii
+import datetime
+import os
+import time
+import uuid
+
+MODE_TRANSFER = 'transfer'  # GetSourceScreenshot, image travels over the websocket
+MODE_OBS_SAVE = 'obs_save'  # SaveSourceScreenshot, OBS writes the file itself
+SNAPSHOT_MODES = (MODE_TRANSFER, MODE_OBS_SAVE)
+
+DECODE_CHUNK_SIZE = 1 << 20  # Base64 characters per decode step, a multiple of 4
+
+
+def decode_base64_into(image_data, chunk_size=DECODE_CHUNK_SIZE):
+    # OBS returns a data URI ("data:image/png;base64,....")
+    start = image_data.find(',') + 1 if image_data.startswith('data:') else 0
+    # Decode in chunks straight into one preallocated buffer instead of building
+    # a full-size bytes object and copying it
+    buffer = bytearray((len(image_data) - start) // 4 * 3)
+    view = memoryview(buffer)
+    written = 0
+    for offset in range(start, len(image_data), chunk_size):
+        decoded = binascii.a2b_base64(image_data[offset:offset + chunk_size])
+        view[written:written + len(decoded)] = decoded
+        written += len(decoded)
+    return view[:written]
+
+
+def decode_and_write(image_data, file_path):
+    # Runs in the executor; returns (decode_seconds, write_seconds, size)
+    started = time.perf_counter()
+    image = decode_base64_into(image_data)
+    decoded = time.perf_counter()
+    with open(file_path, 'wb') as f:
+        f.write(image)
+    return decoded - started, time.perf_counter() - decoded, len(image)
+
+
+class SnapshotEngine:
+    def __init__(self, snapshot_dir, executor=None):
+        self.snapshot_dir = snapshot_dir
+        self.executor = executor
+
+    def make_file_path(self, image_format):
+        # Milliseconds plus a random suffix, as pipelined snapshots often land in the same second
+        timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')[:-3]
+        filename = f"{timestamp}_{uuid.uuid4().hex[:8]}.{image_format}"
+        return os.path.abspath(os.path.join(self.snapshot_dir, filename))
+
+    async def capture(self, client, source_name, image_format='png', width=1920, height=1080,
+                      quality=100, mode=MODE_TRANSFER, file_path=None):
+        # Returns {'file_path', 'size', 'timings': {'request', 'decode', 'write'}} in seconds
+        if mode not in SNAPSHOT_MODES:
+            raise ValueError(f"Unknown snapshot mode: {mode}")
+        file_path = file_path or self.make_file_path(image_format)
+        request_data = {
+            'sourceName': source_name,
+            'imageFormat': image_format,
+            'imageWidth': width,
+            'imageHeight': height,
+            'imageCompressionQuality': quality,
+        }
+        started = time.perf_counter()
+        if mode == MODE_OBS_SAVE:
+            request_data['imageFilePath'] = file_path
+            await client.call('SaveSourceScreenshot', request_data)
+            return {
+                'file_path': file_path,
+                'size': None,
+                'timings': {'request': time.perf_counter() - started, 'decode': 0.0, 'write': 0.0},
+            }
+        resp = await client.call('GetSourceScreenshot', request_data)
+        request_time = time.perf_counter() - started
+        image_data = resp.get('imageData')
+        if not image_data:
+            raise Exception('No image data received from OBS.')
+        loop = asyncio.get_running_loop()
+        decode_time, write_time, size = await loop.run_in_executor(
+            self.executor, decode_and_write, image_data, file_path
+        )
+        return {
+            'file_path': file_path,
+            'size': size,
+            'timings': {'request': request_time, 'decode': decode_time, 'write': write_time},
+        }
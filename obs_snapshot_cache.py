@@ -0,0 +1,127 @@
+import asyncio
+import base64
+import collections
+import io
+import time
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional, without it every size is captured by OBS
+    Image = None
+
+# Resolution of the shared frame that downscaled variants are derived from
+BASE_WIDTH = 1920
+BASE_HEIGHT = 1080
+
+PIL_FORMATS = {'png': 'PNG', 'jpg': 'JPEG', 'jpeg': 'JPEG', 'webp': 'WEBP', 'bmp': 'BMP'}
+
+
+def resize_data_uri(image_data, image_format, width, height, quality):
+    # Runs in the executor: decode the base frame, downscale and re-encode it
+    encoded = image_data[image_data.find(',') + 1:]
+    image = Image.open(io.BytesIO(base64.b64decode(encoded)))
+    image = image.resize((width, height), Image.LANCZOS)
+    pil_format = PIL_FORMATS[image_format]
+    if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    out = io.BytesIO()
+    options = {'quality': quality} if pil_format in ('JPEG', 'WEBP') and 0 <= quality <= 100 else {}
+    image.save(out, pil_format, **options)
+    return f"data:image/{image_format};base64," + base64.b64encode(out.getvalue()).decode()
+
+
+class SnapshotCache:
+    """Short-lived cache of screenshots as the data URIs OBS returns.
+
+    Entries are keyed by (source, format, width, height, quality), expire after
+    `ttl` seconds and are evicted least-recently-used once their total size
+    exceeds `max_bytes`. Concurrent requests for the same key share one
+    capture, and with Pillow installed smaller sizes are derived from one
+    full-resolution frame instead of separate OBS captures.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=1.0, executor=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.executor = executor
+        self.entries = collections.OrderedDict()  # key -> (expires_at, image_data)
+        self.size = 0
+        self.in_flight = {}
+        self.metrics = {'hits': 0, 'misses': 0, 'coalesced': 0, 'captures': 0, 'derived': 0, 'evictions': 0}
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, image_data = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return image_data
+
+    def put(self, key, image_data):
+        if key in self.entries:
+            self._remove(key)
+        if len(image_data) > self.max_bytes:
+            return
+        self.entries[key] = (time.monotonic() + self.ttl, image_data)
+        self.size += len(image_data)
+        while self.size > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.metrics['evictions'] += 1
+
+    def _remove(self, key):
+        _, image_data = self.entries.pop(key)
+        self.size -= len(image_data)
+
+    async def get_image(self, client, source_name, image_format='png', width=BASE_WIDTH, height=BASE_HEIGHT, quality=-1):
+        # Returns (image_data, cache_hit)
+        key = (source_name, image_format, width, height, quality)
+        image_data = self.get(key)
+        if image_data is not None:
+            self.metrics['hits'] += 1
+            return image_data, True
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.metrics['coalesced'] += 1
+        else:
+            self.metrics['misses'] += 1
+            future = asyncio.get_running_loop().create_task(self._produce(client, key))
+            self.in_flight[key] = future
+            future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        return await asyncio.shield(future), False
+
+    async def _produce(self, client, key):
+        source_name, image_format, width, height, quality = key
+        derivable = (
+            Image is not None
+            and image_format in PIL_FORMATS
+            and (width, height) != (BASE_WIDTH, BASE_HEIGHT)
+            and width <= BASE_WIDTH and height <= BASE_HEIGHT
+        )
+        if derivable:
+            base_data, _ = await self.get_image(client, source_name, 'png', BASE_WIDTH, BASE_HEIGHT, -1)
+            loop = asyncio.get_running_loop()
+            image_data = await loop.run_in_executor(
+                self.executor, resize_data_uri, base_data, image_format, width, height, quality
+            )
+            self.metrics['derived'] += 1
+        else:
+            resp = await client.call('GetSourceScreenshot', {
+                'sourceName': source_name,
+                'imageFormat': image_format,
+                'imageWidth': width,
+                'imageHeight': height,
+                'imageCompressionQuality': quality,
+            })
+            image_data = resp.get('imageData')
+            if not image_data:
+                raise Exception('No image data received from OBS.')
+            self.metrics['captures'] += 1
+        self.put(key, image_data)
+        return image_data
+
+    def stats(self):
+        return {**self.metrics, 'entries': len(self.entries), 'bytes': self.size, 'max_bytes': self.max_bytes}
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+
+# outputState values reported by RecordStateChanged / ReplayBufferStateChanged
+OUTPUT_STARTED = 'OBS_WEBSOCKET_OUTPUT_STARTED'
+OUTPUT_STOPPED = 'OBS_WEBSOCKET_OUTPUT_STOPPED'
+OUTPUT_PAUSED = 'OBS_WEBSOCKET_OUTPUT_PAUSED'
+OUTPUT_RESUMED = 'OBS_WEBSOCKET_OUTPUT_RESUMED'
+
+
+class OBSStateCache:
+    """In-memory mirror of the OBS state the service handlers check before acting.
+
+    Kept current from OBS events; a full resync (one RequestBatch) is only done
+    when nothing has refreshed the mirror for `max_staleness` seconds. The
+    resync goes through `call_batch(requests)` when given, so an owner that
+    holds requests while OBS reconnects (OBSTarget) does so for it as well;
+    otherwise it is sent on the attached client.
+    """
+
+    EVENTS = ('RecordStateChanged', 'ReplayBufferStateChanged', 'ReplayBufferSaved', 'CurrentProgramSceneChanged')
+
+    def __init__(self, max_staleness=10.0, call_batch=None):
+        self.max_staleness = max_staleness
+        self.call_batch = call_batch
+        self.client = None
+        self.synced_at = None
+        self.sync_task = None
+        self.record_active = False
+        self.record_paused = False
+        self.record_output_path = None
+        self.replay_buffer_active = False
+        self.replay_output_path = None
+        self.current_program_scene = None
+
+    def attach(self, client):
+        self.detach()
+        self.client = client
+        for event_type in self.EVENTS:
+            client.register_event(self.on_event, event_type)
+
+    def detach(self):
+        if self.client is not None:
+            for event_type in self.EVENTS:
+                self.client.unregister_event(self.on_event, event_type)
+        self.client = None
+        self.synced_at = None
+
+    def is_fresh(self):
+        if self.client is None or not self.client.is_connected or self.synced_at is None:
+            return False
+        return time.monotonic() - self.synced_at < self.max_staleness
+
+    def touch(self):
+        self.synced_at = time.monotonic()
+
+    def on_event(self, event_type, event_data):
+        if event_type == 'RecordStateChanged':
+            state = event_data.get('outputState')
+            self.record_active = event_data.get('outputActive', self.record_active)
+            if state == OUTPUT_PAUSED:
+                self.record_paused = True
+            elif state in (OUTPUT_RESUMED, OUTPUT_STARTED, OUTPUT_STOPPED):
+                self.record_paused = False
+            if event_data.get('outputPath'):
+                self.record_output_path = event_data['outputPath']
+        elif event_type == 'ReplayBufferStateChanged':
+            self.replay_buffer_active = event_data.get('outputActive', self.replay_buffer_active)
+        elif event_type == 'ReplayBufferSaved':
+            self.replay_output_path = event_data.get('savedReplayPath')
+        elif event_type == 'CurrentProgramSceneChanged':
+            self.current_program_scene = event_data.get('sceneName')
+        # An event only refreshes the mirror if it was already in sync
+        if self.synced_at is not None:
+            self.touch()
+
+    async def sync(self, call_batch=None):
+        call_batch = call_batch or self.call_batch
+        if call_batch is None:
+            if self.client is None:
+                raise ConnectionError("Not connected to OBS Studio")
+            call_batch = self.client.call_batch
+        results = await call_batch([
+            {'requestType': 'GetRecordStatus'},
+            {'requestType': 'GetReplayBufferStatus'},
+            {'requestType': 'GetCurrentProgramScene'},
+        ])
+        record, replay, scene = (
+            result.get('responseData', {}) if result['requestStatus']['result'] else None
+            for result in results
+        )
+        if record is not None:
+            self.record_active = record.get('outputActive', False)
+            self.record_paused = record.get('outputPaused', False)
+        if replay is not None:
+            self.replay_buffer_active = replay.get('outputActive', False)
+        else:
+            # GetReplayBufferStatus fails when the replay buffer is disabled
+            self.replay_buffer_active = False
+        if scene is not None:
+            self.current_program_scene = scene.get('currentProgramSceneName')
+        self.touch()
+        logging.info("OBS state cache synchronised.")
+
+    async def ensure_fresh(self):
+        if self.is_fresh():
+            return
+        # Concurrent callers share a single resync
+        if self.sync_task is None or self.sync_task.done():
+            self.sync_task = asyncio.get_running_loop().create_task(self.sync())
+        await asyncio.shield(self.sync_task)
+
+    def record_status(self):
+        return {'outputActive': self.record_active, 'outputPaused': self.record_paused}
+
+    async def get_current_program_scene(self):
+        await self.ensure_fresh()
+        return self.current_program_scene
+
+    def update(self, **fields):
+        # Optimistic update after a successful action, ahead of the matching event
+        for name, value in fields.items():
+            setattr(self, name, value)
@@ -0,0 +1,275 @@
+import asyncio
+import functools
+import json
+import logging
+
+from obs_admission import Coalescer
+from obs_async import AsyncOBSClient, EventSubscription
+from obs_fanout import EventBroadcaster
+from obs_health import HealthMonitor
+from obs_reconnect import ReplayQueue, backoff_delays, is_coalescable, is_idempotent
+from obs_replay import ReplayBufferSaver
+from obs_serializer import JSON
+from obs_snapshot_cache import SnapshotCache
+from obs_state import OBSStateCache
+
+
+def parse_targets(spec):
+    # "name=[password@]host:port,name2=..." -> {name: (host, port, password)}
+    targets = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, address = item.partition('=')
+        password, _, hostport = address.rpartition('@')
+        host, _, port = hostport.rpartition(':')
+        if not name or not host or not port.isdigit():
+            raise ValueError(f"Invalid OBS target: {item}")
+        targets[name] = (host, int(port), password)
+    return targets
+
+
+class OBSTarget:
+    """One OBS instance the service fronts, with its own session and caches.
+
+    A supervisor task keeps the session up: when the socket is lost it
+    reconnects with jittered exponential backoff and identifies with the same
+    event subscriptions. `call`/`call_batch` go to whichever client is current;
+    idempotent requests issued or interrupted while OBS is away wait in a
+    bounded replay queue until it is back or their deadline passes. Identical
+    read-only requests in flight at the same time are sent to OBS once, except
+    screenshots, which sample a new moment every time.
+    """
+
+    def __init__(self, name, host, port, password='', configured=True, timeout=10,
+                 state_max_staleness=10.0, replay_save_timeout=10.0,
+                 event_queue_size=256, event_max_dropped=1024,
+                 snapshot_cache_max_bytes=64 * 1024 * 1024, snapshot_cache_ttl=1.0, executor=None,
+                 reconnect_base_delay=0.5, reconnect_max_delay=30.0, replay_queue_size=256, replay_deadline=5.0,
+                 serializer=JSON, event_handlers=None, health_interval=0.0, health_samples=300, health_window=30.0,
+                 health_thresholds=None, alert_handlers=None):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.password = password
+        self.configured = configured  # False for targets created on the fly by CONNECT_WEBSOCKET
+        self.timeout = timeout
+        self.serializer = serializer  # Wire format of the OBS session
+        self.client = None
+        self.event_subscriptions = EventSubscription.ALL
+        self.bound_clients = set()
+        self.supervisor_task = None
+        self.connected = asyncio.Event()
+        self.last_error = None
+        self.reconnects = 0
+        self.reconnect_base_delay = reconnect_base_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.replay_queue = ReplayQueue(max_size=replay_queue_size, deadline=replay_deadline)
+        self.coalescer = Coalescer()
+        # Its resyncs wait in the replay queue like any other read while OBS reconnects
+        self.state = OBSStateCache(max_staleness=state_max_staleness, call_batch=self.call_batch)
+        self.replay_saver = ReplayBufferSaver(timeout=replay_save_timeout)
+        self.broadcaster = EventBroadcaster(queue_size=event_queue_size, max_dropped=event_max_dropped, target=name)
+        # handler(target, data) for every raw OBS event, across reconnects
+        self.event_handlers = event_handlers if event_handlers is not None else []
+        self.snapshot_cache = SnapshotCache(max_bytes=snapshot_cache_max_bytes, ttl=snapshot_cache_ttl, executor=executor)
+        # handler(target, alert, raised, value, threshold) coroutines for health alerts
+        self.alert_handlers = alert_handlers if alert_handlers is not None else []
+        self.health = HealthMonitor(self, interval=health_interval, size=health_samples, window=health_window,
+                                    thresholds=health_thresholds, on_alert=self._on_health_alert)
+
+    @property
+    def is_connected(self):
+        return self.client is not None and self.client.is_connected
+
+    @property
+    def is_supervised(self):
+        return self.supervisor_task is not None and not self.supervisor_task.done()
+
+    def start(self):
+        if not self.is_supervised:
+            self.supervisor_task = asyncio.get_running_loop().create_task(self._supervise())
+        self.health.start()
+
+    async def connect(self, timeout=None):
+        # Starts supervising the target and waits for its session to be up
+        self.start()
+        try:
+            await asyncio.wait_for(self.connected.wait(), timeout if timeout is not None else self.timeout)
+        except asyncio.TimeoutError:
+            raise ConnectionError(f"OBS target {self.name} is not reachable: {self.last_error}") from None
+
+    async def disconnect(self):
+        self.health.stop()
+        if self.supervisor_task is not None:
+            self.supervisor_task.cancel()
+            try:
+                await self.supervisor_task
+            except asyncio.CancelledError:
+                pass
+            self.supervisor_task = None
+        self.replay_queue.fail(ConnectionError(f"OBS target {self.name} was disconnected"))
+        if self.client is not None:
+            await self._close_session()
+            logging.info(f"Disconnected from OBS Studio target {self.name}.")
+
+    async def _supervise(self):
+        delays = None
+        while True:
+            try:
+                await self._open_session()
+            except Exception as e:
+                self.last_error = e
+                delays = delays or backoff_delays(self.reconnect_base_delay, self.reconnect_max_delay)
+                delay = next(delays)
+                logging.warning(f"OBS target {self.name} unreachable ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            delays = None
+            self.replay_queue.release()
+            # Returns once the socket is gone
+            await asyncio.wait([self.client.reader_task])
+            logging.warning(f"Lost connection to OBS target {self.name}, reconnecting")
+            self.reconnects += 1
+            await self._close_session()
+
+    async def _open_session(self):
+        client = await AsyncOBSClient(
+            host=self.host, port=self.port, password=self.password,
+            event_subscriptions=self.event_subscriptions, timeout=self.timeout,
+            serializer=self.serializer,
+        ).connect()
+        self.state.attach(client)
+        self.replay_saver.attach(client)
+        self.broadcaster.attach(client)
+        for handler in self.event_handlers:
+            client.register_raw_event(functools.partial(handler, self))
+        self.client = client
+        try:
+            # Straight on the new session: the supervisor must not wait in its own replay queue
+            await self.state.sync(client.call_batch)
+        except BaseException:
+            await self._close_session()
+            raise
+        self.connected.set()
+        logging.info(f"Connected to OBS Studio target {self.name} at {self.host}:{self.port}")
+
+    async def _on_health_alert(self, monitor, alert, raised, value, threshold):
+        for handler in self.alert_handlers:
+            await handler(self, alert, raised, value, threshold)
+
+    async def _close_session(self):
+        client, self.client = self.client, None
+        self.connected.clear()
+        self.state.detach()
+        self.replay_saver.detach()
+        self.broadcaster.detach()
+        await client.disconnect()
+
+    async def reidentify(self, event_subscriptions):
+        # Remembered so a reconnected session subscribes to the same events
+        self.event_subscriptions = event_subscriptions
+        if self.is_connected:
+            await self.client.reidentify(event_subscriptions)
+
+    async def _replayable(self, idempotent, send):
+        deadline = None
+        while True:
+            if not self.is_connected:
+                if not idempotent or not self.is_supervised:
+                    raise ConnectionError(f"OBS target {self.name} is not connected")
+                deadline = deadline or self.replay_queue.new_deadline()
+                await self.replay_queue.wait(deadline)
+                continue
+            try:
+                return await send(self.client)
+            except ConnectionError:
+                # The session dropped under the request; only safe ones go again
+                if not idempotent or not self.is_supervised:
+                    raise
+
+    async def call(self, request_type, request_data=None, timeout=None):
+        call = functools.partial(
+            self._replayable,
+            is_idempotent(request_type),
+            lambda client: client.call(request_type, request_data, timeout),
+        )
+        if not is_coalescable(request_type):
+            return await call()
+        return await self.coalescer.run((request_type, json.dumps(request_data, sort_keys=True)), call)
+
+    async def call_batch(self, requests, **options):
+        call = functools.partial(
+            self._replayable,
+            all(is_idempotent(request['requestType']) for request in requests),
+            lambda client: client.call_batch(requests, **options),
+        )
+        if not all(is_coalescable(request['requestType']) for request in requests):
+            return await call()
+        return await self.coalescer.run(('batch', json.dumps([requests, options], sort_keys=True, default=str)), call)
+
+    def describe(self):
+        return {
+            'name': self.name,
+            'host': self.host,
+            'port': self.port,
+            'connected': self.is_connected,
+            'configured': self.configured,
+            'clients': len(self.bound_clients),
+            'reconnects': self.reconnects,
+            'replay_queue': self.replay_queue.stats(),
+            'coalesced': self.coalescer.metrics['coalesced'],
+        }
+
+
+class OBSTargetRegistry:
+    def __init__(self, **target_options):
+        self.target_options = target_options
+        self.targets = {}
+        self.event_handlers = []  # Shared by every target, including ones added later
+        self.alert_handlers = []
+
+    def add(self, name, host, port, password='', configured=True):
+        if name in self.targets:
+            raise ValueError(f"OBS target {name} already exists")
+        target = OBSTarget(name, host, port, password, configured=configured,
+                           event_handlers=self.event_handlers, alert_handlers=self.alert_handlers, **self.target_options)
+        self.targets[name] = target
+        return target
+
+    def get(self, name):
+        return self.targets.get(name)
+
+    def find(self, host, port):
+        for target in self.targets.values():
+            if target.host == host and target.port == port:
+                return target
+        return None
+
+    async def remove(self, name):
+        target = self.targets.pop(name, None)
+        if target is not None:
+            await target.disconnect()
+
+    async def release_if_unused(self, target):
+        # Targets created on the fly go away with their last client
+        if not target.configured and not target.bound_clients and self.targets.get(target.name) is target:
+            await self.remove(target.name)
+
+    def start_all(self):
+        # Supervisors connect in the background and keep retrying
+        for target in self.targets.values():
+            target.start()
+
+    async def connect_all(self):
+        # Targets connect concurrently; one unreachable box does not hold up the
+        # rest and its supervisor keeps retrying in the background
+        names = list(self.targets)
+        results = await asyncio.gather(*(self.targets[name].connect() for name in names), return_exceptions=True)
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                logging.error(f"Failed to connect to OBS Studio target {name}: {result}")
+
+    async def disconnect_all(self):
+        await asyncio.gather(*(target.disconnect() for target in self.targets.values()), return_exceptions=True)
+
+    def __iter__(self):
+        return iter(list(self.targets.values()))
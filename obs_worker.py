@@ -0,0 +1,202 @@
+import argparse
+import asyncio
+import logging
+import uuid
+
+import websockets
+
+from command_registry import CommandError, CommandRegistry
+from obs_serializer import IPC, for_subprotocol, select_subprotocol
+
+IPC_READ_LIMIT = 256 * 1024 * 1024  # Snapshot responses carry whole images
+CLIENT_QUEUE_SIZE = 1024  # Messages buffered per client in a worker before it is disconnected
+
+
+# Frames on the owner <-> worker channel: "op instance_id length\n" + payload.
+# Worker to owner: open (payload: negotiated subprotocol), message (a parsed
+# and validated command, IPC encoded), closed, listening (once the client port
+# is bound; instance_id is -).
+# Owner to worker: schema (first frame, IPC encoded command schemas; instance_id
+# is -), send (an IPC encoded message for the client), close.
+def encode_frame(op, instance_id, payload=b''):
+    return f"{op} {instance_id} {len(payload)}\n".encode() + payload
+
+
+async def read_frame(reader):
+    header = await reader.readline()
+    if not header:
+        raise EOFError
+    op, instance_id, length = header.decode().split(' ')
+    payload = await reader.readexactly(int(length))
+    return op, instance_id, payload
+
+
+class WorkerLink:
+    # Owner side of the connection to one front-end worker
+    def __init__(self, writer):
+        self.writer = writer
+
+    async def send(self, instance_id, message):
+        payload = message.encode() if isinstance(message, str) else message
+        self.writer.write(encode_frame('send', instance_id, payload))
+        await self.writer.drain()
+
+    async def close(self, instance_id, code, reason):
+        self.writer.write(encode_frame('close', instance_id, f"{code} {reason}".encode()))
+        await self.writer.drain()
+
+
+class RemoteWebSocket:
+    """Stands in, in the owner process, for a client socket held by a worker.
+
+    Messages for it are encoded with `serializer` (IPC); the worker re-encodes
+    them in the client's own format.
+    """
+
+    serializer = IPC
+
+    def __init__(self, link, instance_id, subprotocol=None):
+        self.link = link
+        self.instance_id = instance_id
+        self.subprotocol = subprotocol
+        self.closed = False
+
+    async def send(self, message):
+        if self.closed:
+            raise websockets.exceptions.ConnectionClosed(None, None)
+        try:
+            await self.link.send(self.instance_id, message)
+        except ConnectionError:
+            self.closed = True
+            raise websockets.exceptions.ConnectionClosed(None, None) from None
+
+    async def close(self, code=1000, reason=''):
+        if not self.closed:
+            self.closed = True
+            await self.link.close(self.instance_id, code, reason)
+
+
+async def queued_messages(queue):
+    # Client messages relayed by a worker, until the worker reports the close
+    while True:
+        message = await queue.get()
+        if message is None:
+            return
+        yield message
+
+
+def error_response(instance_id, command_uid, message):
+    # Same shape as the owner's error responses
+    return {"status": "error", "command_uid": command_uid, "instance_id": instance_id, "message": message}
+
+
+def parse_command(serializer, registry, instance_id, message):
+    # Returns (command, None) or (None, error response) for a client message
+    try:
+        data = serializer.loads(message)
+        if not isinstance(data, dict):
+            raise ValueError("message must be an object")
+    except (ValueError, TypeError) as e:
+        return None, error_response(instance_id, '', f"Error processing command: {str(e)}")
+    try:
+        registry.validate(data.get('command'), data.get('parameter', {}))
+    except CommandError as e:
+        return None, error_response(instance_id, data.get('command_uid'), str(e))
+    return data, None
+
+
+class Outbox:
+    # Per-client send queue in a worker, so one slow client never stalls the
+    # rest; messages are encoded for the client here, off the owner's loop
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.serializer = for_subprotocol(websocket.subprotocol)
+        self.queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.task = asyncio.get_running_loop().create_task(self.drain())
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            logging.warning("Disconnecting slow client")
+            self.task.cancel()
+            asyncio.get_running_loop().create_task(self.websocket.close(1008, 'Slow consumer'))
+
+    def close(self, code, reason):
+        # Queued behind the messages the owner sent before closing
+        self.put((code, reason))
+
+    async def drain(self):
+        try:
+            while True:
+                message = await self.queue.get()
+                if isinstance(message, tuple):
+                    await self.websocket.close(*message)
+                    return
+                if isinstance(message, bytes):
+                    message = IPC.loads(message)
+                await self.websocket.send(self.serializer.dumps(message))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+
+async def run_worker(host, port, ipc_path):
+    # Terminates the client websockets, parses and validates their commands and
+    # relays them to the owner
+    reader, writer = await asyncio.open_unix_connection(ipc_path, limit=IPC_READ_LIMIT)
+    _, _, schemas = await read_frame(reader)
+    registry = CommandRegistry.from_schemas(IPC.loads(schemas))
+    outboxes = {}
+
+    async def handle_client(websocket):
+        instance_id = str(uuid.uuid4())
+        outbox = outboxes[instance_id] = Outbox(websocket)
+        writer.write(encode_frame('open', instance_id, (websocket.subprotocol or '').encode()))
+        try:
+            async for message in websocket:
+                # Malformed and invalid commands are answered here without reaching the owner
+                data, error = parse_command(outbox.serializer, registry, instance_id, message)
+                if error is not None:
+                    outbox.put(error)
+                    continue
+                writer.write(encode_frame('message', instance_id, IPC.dumps(data)))
+                await writer.drain()
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            outboxes.pop(instance_id).task.cancel()
+            writer.write(encode_frame('closed', instance_id))
+
+    async with websockets.serve(handle_client, host, port, reuse_port=True, origins=None, max_size=None,
+                                select_subprotocol=select_subprotocol):
+        logging.info(f"Worker accepting clients on port {port}")
+        writer.write(encode_frame('listening', '-'))
+        await writer.drain()
+        while True:
+            try:
+                op, instance_id, payload = await read_frame(reader)
+            except (EOFError, asyncio.IncompleteReadError, ConnectionError):
+                logging.info("Owner process went away, worker exiting")
+                return
+            outbox = outboxes.get(instance_id)
+            if outbox is None:
+                continue
+            if op == 'send':
+                outbox.put(payload)
+            elif op == 'close':
+                code, _, reason = payload.decode().partition(' ')
+                outbox.close(int(code), reason)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='OBS WebSocket Service front-end worker')
+    parser.add_argument('--host', type=str, default='0.0.0.0', help='Host to accept service clients on')
+    parser.add_argument('--port', type=int, required=True, help='Port shared by all workers (SO_REUSEPORT)')
+    parser.add_argument('--ipc', type=str, required=True, help='Unix socket of the owner process')
+    parser.add_argument('--name', type=str, default='worker', help='Name used in log lines')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format=f'%(asctime)s %(levelname)s [{args.name}] %(message)s')
+    try:
+        asyncio.run(run_worker(args.host, args.port, args.ipc))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,82 @@
+import asyncio
+import unittest
+
+from obs_admission import Coalescer, RateLimiter
+from obs_reconnect import is_coalescable
+from obs_targets import OBSTarget
+
+
+class FakeClient:
+    # Answers each request after a short delay, counting what reached OBS
+    is_connected = True
+
+    def __init__(self):
+        self.calls = []
+
+    async def call(self, request_type, request_data=None, timeout=None):
+        self.calls.append(request_type)
+        number = len(self.calls)
+        await asyncio.sleep(0.01)
+        return {'call': number}
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_burst_then_refused(self):
+        limiter = RateLimiter(rate=1.0, burst=3)
+        self.assertEqual([limiter.check('A') for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertGreater(limiter.check('A'), 0)
+        self.assertEqual(limiter.rejected, 1)
+
+    def test_refused_command_costs_nothing(self):
+        limiter = RateLimiter(rate=1.0, burst=2, command_limits={'SNAP': (1.0, 1)})
+        self.assertEqual(limiter.check('SNAP'), 0.0)
+        self.assertGreater(limiter.check('SNAP'), 0)
+        # The refused SNAP did not take the client-wide token
+        self.assertEqual(limiter.check('OTHER'), 0.0)
+
+
+class CoalescerTest(unittest.IsolatedAsyncioTestCase):
+    async def test_identical_calls_share_one_run(self):
+        coalescer = Coalescer()
+        runs = []
+
+        async def call():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            return 'result'
+        results = await asyncio.gather(*(coalescer.run('key', call) for _ in range(5)))
+        self.assertEqual(results, ['result'] * 5)
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(coalescer.metrics['coalesced'], 4)
+        self.assertFalse(coalescer.in_flight)
+
+    async def test_caller_giving_up_does_not_cancel_the_others(self):
+        coalescer = Coalescer()
+
+        async def call():
+            await asyncio.sleep(0.02)
+            return 'result'
+        first = asyncio.ensure_future(coalescer.run('key', call))
+        second = asyncio.ensure_future(coalescer.run('key', call))
+        await asyncio.sleep(0)
+        first.cancel()
+        self.assertEqual(await second, 'result')
+
+
+class TargetCoalescingTest(unittest.IsolatedAsyncioTestCase):
+    def test_screenshots_are_not_coalescable(self):
+        self.assertTrue(is_coalescable('GetRecordStatus'))
+        self.assertFalse(is_coalescable('GetSourceScreenshot'))
+        self.assertFalse(is_coalescable('StartRecord'))
+
+    async def test_reads_share_a_request_but_screenshots_do_not(self):
+        target = OBSTarget('test', 'localhost', 4455)
+        target.client = FakeClient()
+        await asyncio.gather(*(target.call('GetRecordStatus') for _ in range(3)))
+        screenshots = await asyncio.gather(*(target.call('GetSourceScreenshot', {'sourceName': 'Scene'}) for _ in range(3)))
+        self.assertEqual(target.client.calls, ['GetRecordStatus'] + ['GetSourceScreenshot'] * 3)
+        self.assertEqual(len({result['call'] for result in screenshots}), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import json
+import os
+import tempfile
+import unittest
+
+from obs_artifacts import STATUS_ABANDONED, STATUS_COMPLETE, ArtifactIndex
+
+
+class ArtifactIndexTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'artifacts.jsonl')
+
+    def open_index(self, **options):
+        index = ArtifactIndex(self.path, **options).load()
+        self.addCleanup(index.close)
+        return index
+
+    def test_pages_newest_first_with_a_cursor(self):
+        index = self.open_index()
+        for number in range(5):
+            index.add('snapshot' if number % 2 else 'replay', 'default', 'client', f'/clips/{number}.mkv')
+        items, cursor = index.page(limit=2)
+        self.assertEqual([item['seq'] for item in items], [4, 3])
+        items, cursor = index.page(cursor=cursor, limit=2)
+        self.assertEqual([item['seq'] for item in items], [2, 1])
+        items, cursor = index.page(cursor=cursor, limit=2)
+        self.assertEqual(([item['seq'] for item in items], cursor), ([0], None))
+        items, _ = index.page(kind='snapshot')
+        self.assertEqual([item['seq'] for item in items], [3, 1])
+
+    def test_last_line_for_an_id_wins_on_load(self):
+        index = self.open_index()
+        started = index.start_recording('default', 'client')
+        index.finish_recording('default', '/videos/take.mkv', size=10)
+        index.close()
+        reloaded = self.open_index()
+        record = reloaded.get(started['id'])
+        self.assertEqual((record['status'], record['file_path']), (STATUS_COMPLETE, '/videos/take.mkv'))
+        self.assertIsNone(reloaded.active_recording('default'))
+
+    def test_recording_started_again_abandons_the_previous_one(self):
+        index = self.open_index()
+        first = index.start_recording('default', 'client')
+        second = index.start_recording('default', 'client')
+        self.assertEqual(first['status'], STATUS_ABANDONED)
+        self.assertIs(index.active_recording('default'), second)
+
+    def test_memory_holds_the_newest_records_only(self):
+        index = self.open_index(max_records=10)
+        recording = index.start_recording('default', 'client')
+        for number in range(30):
+            index.add('snapshot', 'default', 'client', f'/snapshots/{number}.png')
+        self.assertLessEqual(len(index.order), 11)
+        self.assertEqual(len(index.order), len(index.seqs))
+        self.assertEqual(index.order[-1]['seq'], 30)
+        # The recording in progress outlives the trim and can still be finished
+        self.assertIs(index.active_recording('default'), recording)
+        index.finish_recording('default', '/videos/take.mkv')
+        self.assertEqual(recording['status'], STATUS_COMPLETE)
+        index.close()
+        self.assertEqual(len(self.open_index(max_records=10).order), 10)
+
+    def test_superseded_lines_are_compacted_on_load(self):
+        index = self.open_index()
+        record = index.add('replay', 'default', 'client', '/clips/a.mkv')
+        for number in range(150):
+            index.update(record, size=number)
+        index.close()
+        self.open_index().close()
+        with open(self.path, encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([(line['id'], line['size']) for line in lines], [(record['id'], 149)])
+
+
+if __name__ == '__main__':
+    unittest.main()
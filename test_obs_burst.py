@@ -0,0 +1,73 @@
+import asyncio
+import unittest
+
+from obs_burst import SnapshotBurst
+
+
+class FakeEngine:
+    # Records when each capture started and how many overlapped
+    snapshot_dir = 'snapshots'
+
+    def __init__(self, duration=0.0):
+        self.duration = duration
+        self.started = []
+        self.running = 0
+        self.max_running = 0
+
+    async def capture(self, client, source_name, file_path=None, **options):
+        self.started.append((file_path, asyncio.get_running_loop().time()))
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(self.duration)
+        finally:
+            self.running -= 1
+        return {'file_path': file_path}
+
+
+class SnapshotBurstTest(unittest.IsolatedAsyncioTestCase):
+    async def test_frames_follow_absolute_deadlines(self):
+        engine = FakeEngine()
+        burst = SnapshotBurst(engine, None, 'Scene', interval=0.02, count=5)
+        started = asyncio.get_running_loop().time()
+        await burst.start()
+        self.assertEqual(burst.summary()['captured'], 5)
+        self.assertEqual(burst.dropped, 0)
+        for frame, (file_path, at) in enumerate(engine.started):
+            self.assertTrue(file_path.endswith(f"burst_{burst.burst_id}_{frame:05d}.png"))
+            # Never early, and lateness does not add up from frame to frame
+            self.assertGreaterEqual(at - started, frame * 0.02 - 0.001)
+            self.assertLess(at - started, (frame + 1) * 0.02)
+
+    async def test_slow_captures_drop_frames_instead_of_queueing(self):
+        engine = FakeEngine(duration=0.05)
+        finished = []
+
+        async def on_finished(burst):
+            finished.append(burst.summary())
+        burst = SnapshotBurst(engine, None, 'Scene', interval=0.01, count=10, max_in_flight=1, on_finished=on_finished)
+        await burst.start()
+        self.assertEqual(engine.max_running, 1)
+        self.assertGreater(burst.dropped, 0)
+        self.assertEqual(burst.captured + burst.dropped, 10)
+        self.assertEqual(finished, [burst.summary()])
+
+    async def test_stop_cancels_captures_and_reports(self):
+        engine = FakeEngine(duration=1.0)
+        finished = []
+
+        async def on_finished(burst):
+            finished.append(burst.burst_id)
+        burst = SnapshotBurst(engine, None, 'Scene', interval=0.01, count=100, on_finished=on_finished)
+        task = burst.start()
+        await asyncio.sleep(0.03)
+        burst.stop()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+        self.assertEqual(finished, [burst.burst_id])
+        self.assertEqual(engine.running, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from obs_health import HealthMonitor, RingBuffer
+
+
+class FakeTarget:
+    # Answers GetStats/GetRecordStatus with the counters the test sets
+    name = 'test'
+    is_connected = True
+
+    def __init__(self):
+        self.output_skipped = 0
+        self.output_total = 0
+
+    async def call_batch(self, requests):
+        ok = {'result': True}
+        stats = {'outputSkippedFrames': self.output_skipped, 'outputTotalFrames': self.output_total,
+                 'availableDiskSpace': 10000.0}
+        return [{'requestStatus': ok, 'responseData': stats}, {'requestStatus': ok, 'responseData': {}}]
+
+
+class RingBufferTest(unittest.TestCase):
+    def test_oldest_values_are_overwritten(self):
+        ring = RingBuffer(3)
+        for value in range(5):
+            ring.append(value)
+        self.assertEqual(ring.values(), [2.0, 3.0, 4.0])
+        self.assertEqual((ring[0], ring[-1]), (2.0, 4.0))
+        with self.assertRaises(IndexError):
+            ring[3]
+
+
+class HealthWindowTest(unittest.IsolatedAsyncioTestCase):
+    async def sample_at(self, monitor, monotonic, wall):
+        with mock.patch('obs_health.time.monotonic', return_value=monotonic), \
+                mock.patch('obs_health.time.time', return_value=wall):
+            await monitor.sample()
+
+    async def test_window_follows_the_monotonic_clock(self):
+        target = FakeTarget()
+        monitor = HealthMonitor(target, window=10.0)
+        await self.sample_at(monitor, 100.0, 1_000_000.0)
+        target.output_skipped, target.output_total = 50, 100
+        await self.sample_at(monitor, 105.0, 1_000_005.0)
+        # The wall clock is set back an hour; the window still spans 5 seconds
+        target.output_skipped, target.output_total = 50, 200
+        await self.sample_at(monitor, 110.0, 996_410.0)
+        rolling = monitor.rolling()
+        self.assertEqual(rolling['window'], 10.0)
+        self.assertEqual(rolling['samples'], 3)
+        self.assertEqual(rolling['dropped_frame_rate'], 0.25)
+        # Samples older than the window drop out
+        await self.sample_at(monitor, 116.0, 996_416.0)
+        self.assertEqual(monitor.rolling()['samples'], 2)
+        self.assertEqual(monitor.rolling()['dropped_frame_rate'], 0.0)
+
+    async def test_slow_alert_handler_does_not_hold_up_sampling(self):
+        target = FakeTarget()
+        delivered = asyncio.Event()
+        alerts = []
+
+        async def on_alert(monitor, alert, raised, value, threshold):
+            alerts.append((alert, raised))
+            await delivered.wait()
+        monitor = HealthMonitor(target, thresholds={'dropped_frames': 0.1}, on_alert=on_alert)
+        await self.sample_at(monitor, 0.0, 0.0)
+        target.output_skipped, target.output_total = 20, 100
+        await asyncio.wait_for(self.sample_at(monitor, 2.0, 2.0), 1.0)
+        self.assertIn('dropped_frames', monitor.raised)
+        await asyncio.sleep(0)
+        self.assertEqual(alerts, [('dropped_frames', True)])
+        self.assertEqual(len(monitor.alert_tasks), 1)
+        delivered.set()
+        await asyncio.gather(*monitor.alert_tasks)
+        await asyncio.sleep(0)
+        self.assertFalse(monitor.alert_tasks)
+
+
+if __name__ == '__main__':
+    unittest.main()
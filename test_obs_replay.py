@@ -0,0 +1,89 @@
+import asyncio
+import unittest
+
+from obs_replay import ReplayBufferSaver
+
+
+class FakeClient:
+    # Records SaveReplayBuffer requests; the test emits ReplayBufferSaved itself
+    def __init__(self):
+        self.handlers = {}
+        self.saves = 0
+
+    def register_event(self, callback, event_type=None):
+        self.handlers[event_type] = callback
+
+    def unregister_event(self, callback, event_type=None):
+        self.handlers.pop(event_type, None)
+
+    async def call(self, request_type, request_data=None, timeout=None):
+        if request_type == 'SaveReplayBuffer':
+            self.saves += 1
+            return {}
+        if request_type == 'GetProfileParameter':
+            return {'parameterValue': '30'}
+        raise ValueError(request_type)
+
+    def saved(self, path):
+        self.handlers['ReplayBufferSaved']('ReplayBufferSaved', {'savedReplayPath': path})
+
+
+class ReplayBufferSaverTest(unittest.IsolatedAsyncioTestCase):
+    async def test_save_after_a_timed_out_save_succeeds(self):
+        client = FakeClient()
+        saver = ReplayBufferSaver(timeout=0.05)
+        saver.attach(client)
+        # OBS never sends the event of the first save
+        with self.assertRaises(TimeoutError):
+            await saver.save()
+        self.assertFalse(saver.pending)
+
+        second = asyncio.ensure_future(saver.save())
+        while client.saves < 2:
+            await asyncio.sleep(0)
+        client.saved('/replays/second.mkv')
+        saved_path, _ = await second
+        self.assertEqual(saved_path, '/replays/second.mkv')
+
+    async def test_one_lost_event_does_not_stall_later_saves(self):
+        client = FakeClient()
+        saver = ReplayBufferSaver(timeout=0.05)
+        saver.attach(client)
+        with self.assertRaises(TimeoutError):
+            await saver.save()
+        for number in range(2, 5):
+            save = asyncio.ensure_future(saver.save())
+            while client.saves < number:
+                await asyncio.sleep(0)
+            client.saved(f'/replays/{number}.mkv')
+            self.assertEqual((await save)[0], f'/replays/{number}.mkv')
+
+    async def test_refused_save_does_not_hold_a_place(self):
+        client = FakeClient()
+        saver = ReplayBufferSaver(timeout=0.05)
+        saver.attach(client)
+
+        async def refuse(request_type, request_data=None, timeout=None):
+            raise RuntimeError("Replay buffer is not active")
+        client.call, call = refuse, client.call
+        with self.assertRaises(RuntimeError):
+            await saver.save()
+        client.call = call
+
+        save = asyncio.ensure_future(saver.save())
+        while client.saves < 1:
+            await asyncio.sleep(0)
+        client.saved('/replays/only.mkv')
+        self.assertEqual((await save)[0], '/replays/only.mkv')
+
+    async def test_save_while_detached_fails_cleanly(self):
+        saver = ReplayBufferSaver(timeout=0.05)
+        saver.attach(FakeClient())
+        saver.detach()
+        with self.assertRaisesRegex(ConnectionError, "Not connected to OBS Studio"):
+            await saver.save()
+        self.assertFalse(saver.pending)
+
+
+if __name__ == '__main__':
+    unittest.main()
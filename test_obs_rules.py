@@ -0,0 +1,80 @@
+import asyncio
+import unittest
+
+from obs_rules import Rule, RuleEngine, TimerWheel
+
+
+class TimerWheelTest(unittest.IsolatedAsyncioTestCase):
+    async def test_timers_fire_in_deadline_order_and_never_early(self):
+        wheel = TimerWheel(resolution=0.005, size=8)
+        loop = asyncio.get_running_loop()
+        fired = []
+        start = loop.time()
+        # 0.06s is beyond one revolution of 8 * 0.005s
+        for delay in (0.06, 0.01, 0.03):
+            wheel.call_later(delay, lambda delay=delay: fired.append((delay, loop.time() - start)))
+        await asyncio.sleep(0.1)
+        self.assertEqual([delay for delay, _ in fired], [0.01, 0.03, 0.06])
+        for delay, elapsed in fired:
+            self.assertGreaterEqual(elapsed, delay)
+        self.assertEqual(len(wheel), 0)
+
+    async def test_cancelled_timer_does_not_fire(self):
+        wheel = TimerWheel(resolution=0.005, size=8)
+        fired = []
+        timer = wheel.call_later(0.01, fired.append, 'cancelled')
+        wheel.call_later(0.02, fired.append, 'kept')
+        wheel.cancel(timer)
+        wheel.cancel(timer)
+        self.assertEqual(len(wheel), 1)
+        await asyncio.sleep(0.05)
+        self.assertEqual(fired, ['kept'])
+
+    async def test_callback_may_add_an_earlier_timer(self):
+        wheel = TimerWheel(resolution=0.005, size=8)
+        fired = []
+
+        def first():
+            fired.append('first')
+            wheel.call_later(0.01, fired.append, 'added')
+        wheel.call_later(0.01, first)
+        wheel.call_later(0.1, fired.append, 'last')
+        await asyncio.sleep(0.05)
+        self.assertEqual(fired, ['first', 'added'])
+
+
+class RuleOwnershipTest(unittest.IsolatedAsyncioTestCase):
+    def make_rule(self, owner='client-1', owner_key='key-1'):
+        return Rule(owner, 'uid', 'default', [{'command': 'GET_RECORD_STATUS'}], event_type='RecordStateChanged',
+                    owner_key=owner_key)
+
+    def test_owner_is_the_connection_or_the_key_holder(self):
+        rule = self.make_rule()
+        self.assertTrue(rule.is_owned_by('client-1'))
+        self.assertTrue(rule.is_owned_by('client-2', 'key-1'))
+        self.assertFalse(rule.is_owned_by('client-2'))
+        self.assertFalse(rule.is_owned_by('client-2', 'key-2'))
+
+    def test_rule_without_key_is_only_owned_by_its_connection(self):
+        rule = self.make_rule(owner_key=None)
+        self.assertFalse(rule.has_key(None))
+        self.assertFalse(rule.is_owned_by('client-2', 'key-1'))
+
+    def test_key_is_not_described(self):
+        rule = self.make_rule()
+        self.assertNotIn('key-1', rule.describe(0.0).values())
+        self.assertNotIn('owner_key', rule.describe(0.0))
+
+    async def test_rules_are_found_by_key(self):
+        async def run(rule, lateness):
+            return True
+        engine = RuleEngine(run)
+        mine = engine.add(self.make_rule())
+        engine.add(self.make_rule(owner='client-2', owner_key='key-2'))
+        engine.add(self.make_rule(owner_key=None))
+        self.assertEqual(engine.owned_by_key('key-1'), [mine])
+        self.assertEqual(engine.owned_by_key('unknown'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()